@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+import argparse
+
+import torch
+
+import config
+from grid import decode_iou
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests"))
+from test_grid import reference_batch_iou
+
+# Micro-benchmark of the pred/target IoU the loss computes every step: the
+# original batch_iou (meshgrid per call, stacked xyxy, autograd graph recorded)
+# vs grid.decode_iou as the loss runs it now.
+#   python benchmark_iou.py [--batch-size 64] [--device cuda]
+
+
+def bench(fn, a, b, iters, grad):
+    def step():
+        with torch.set_grad_enabled(grad):
+            fn(a, b)
+
+    for _ in range(3):
+        step()
+    if a.is_cuda:
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(iters):
+        step()
+    if a.is_cuda:
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / iters
+
+
+def main():
+    parser = argparse.ArgumentParser("IoU micro-benchmark")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--iters", type=int, default=200)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    shape = (args.batch_size, config.S, config.S, config.B, 5 + config.C)
+    a = torch.rand(shape, device=args.device, requires_grad=True)
+    b = torch.rand(shape, device=args.device)
+
+    # The loss used to record a graph for the IoU, now it runs under no_grad
+    ref = bench(reference_batch_iou, a, b, args.iters, grad=True)
+    new = bench(decode_iou, a, b, args.iters, grad=False)
+    print(f"reference {ref * 1e3:.3f} ms, decode_iou {new * 1e3:.3f} ms ({ref / new:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import argparse
+
+import torch
+from safetensors import safe_open
+from safetensors.torch import save_file, load_file
+
+import config
+from model import YOLOv2, YOLOv2ViT, YOLOv2ResNet
+
+# Weight-only inference export of a training checkpoint:
+#   python export.py --model YOLOv2ResNet [--dtype fp16]
+# writes checkpoints/<model>/best_model.safetensors + best_model.json,
+# which test.py and view_img_bbox.py load in preference to best_model.pth.
+
+MODELS = {"YOLOv2": YOLOv2, "YOLOv2ViT": YOLOv2ViT, "YOLOv2ResNet": YOLOv2ResNet}
+DTYPES = {"fp32": torch.float32, "fp16": torch.float16, "bf16": torch.bfloat16}
+
+
+def export_weights(state_dict, path, model_config, dtype=None):
+    """
+    Writes only the model weights as safetensors, floating point tensors cast
+    to dtype when given. model_config (model, head, S, B, C) is stored in the file
+    header and next to it as <path>.json.
+    """
+    tensors = {
+        name: (t.to(dtype) if dtype is not None and t.is_floating_point() else t).contiguous()
+        for name, t in state_dict.items()
+    }
+    model_config = dict(model_config, dtype=str(next(t.dtype for t in tensors.values() if t.is_floating_point())))
+    save_file(tensors, path, metadata={"config": json.dumps(model_config)})
+    with open(os.path.splitext(path)[0] + ".json", "w") as f:
+        json.dump(model_config, f, indent=2)
+
+
+def load_exported(path, device, dtype=torch.float32):
+    """
+    Loads a file written by export_weights. The tensors are memory-mapped and
+    assigned to the model instead of copied into its parameters.
+    """
+    with safe_open(path, framework="pt") as f:
+        model_config = json.loads(f.metadata()["config"])
+    _check_grid(model_config, path)
+
+    state_dict = load_file(path)
+    if dtype is not None:
+        state_dict = {name: t.to(dtype) if t.is_floating_point() else t for name, t in state_dict.items()}
+
+    model = MODELS[model_config["model"]](head=model_config.get("head", "dense"))
+    model.load_state_dict(state_dict, assign=True)
+    return model.to(device).eval()
+
+
+def _check_grid(model_config, path):
+    # The models take S, B, C from config.py
+    if (model_config["S"], model_config["B"], model_config["C"]) != (config.S, config.B, config.C):
+        raise ValueError(f"{path} was trained for S, B, C = {model_config['S']}, {model_config['B']}, {model_config['C']}")
+
+
+def checkpoint_model_config(checkpoint, default):
+    """
+    The model_config (model, head, S, B, C) a training checkpoint was trained
+    with. Checkpoints from before train.py stored it get default (config.py)
+    instead. Either way it is checked against the weights.
+    """
+    model_config = checkpoint.get("model_config")
+    if model_config is None:
+        print("Checkpoint has no model_config, assuming the current config.py")
+        model_config = default
+    _check_head_shapes(checkpoint["model_state_dict"], model_config)
+    return model_config
+
+
+def _check_head_shapes(state_dict, model_config):
+    # Linear (2D) and conv (4D) weights in order, the head's come last. Only the heads have
+    # Linear layers (ResNet50's fc is removed) or depthwise convs
+    weights = [t for name, t in state_dict.items() if name.endswith(".weight") and t.dim() in (2, 4)]
+    if any(t.dim() == 2 for t in weights):
+        head = "dense"
+    elif any(t.dim() == 4 and t.shape[1] == 1 and t.shape[0] > 1 for t in weights):
+        head = "separable"
+    else:
+        head = "conv"
+
+    S, B, C = model_config["S"], model_config["B"], model_config["C"]
+    depth = weights[-1].shape[0] // (S * S if head == "dense" else 1)
+    linears = [t for t in weights if t.dim() == 2]
+    # YOLOv2's dense head flattens 1024xSxS features, DetectionNet's downsamples to 7x7 first
+    cells = S * S if model_config["model"] == "YOLOv2" else 7 * 7
+    # YOLOv2 has no separable variant, its head="separable" builds the conv head
+    expected_head = "conv" if model_config["model"] == "YOLOv2" and model_config["head"] == "separable" else model_config["head"]
+    if head != expected_head or depth != B * (5 + C) or (linears and linears[0].shape[1] != 1024 * cells):
+        raise ValueError(f"Checkpoint weights ({head} head) don't match model_config {model_config}")
+
+
+def _default_model_config(model_name):
+    return {"model": model_name, "head": config.HEAD, "S": config.S, "B": config.B, "C": config.C}
+
+
+def load_for_inference(model_name, device, ckpt_dir="checkpoints"):
+    """
+    Loads the newer of <model>/best_model.safetensors (see main) and the
+    best_model.pth training checkpoint, so an export older than the checkpoint
+    (training found a better model after it) is not used.
+    """
+    export_path = f"{ckpt_dir}/{model_name}/best_model.safetensors"
+    ckpt_path = f"{ckpt_dir}/{model_name}/best_model.pth"
+    if os.path.exists(export_path):
+        if not os.path.exists(ckpt_path) or os.path.getmtime(export_path) >= os.path.getmtime(ckpt_path):
+            return load_exported(export_path, device)
+        print(f"{export_path} is older than {ckpt_path}, loading the checkpoint (re-run export.py to update it)")
+
+    checkpoint = torch.load(ckpt_path, map_location="cpu", mmap=True, weights_only=True)
+    model_config = checkpoint_model_config(checkpoint, _default_model_config(model_name))
+    _check_grid(model_config, ckpt_path)
+    model = MODELS[model_config["model"]](head=model_config["head"])
+    model.load_state_dict(checkpoint["model_state_dict"], assign=True)
+    return model.to(device).eval()
+
+
+def main():
+    parser = argparse.ArgumentParser("YOLO weight export")
+    parser.add_argument("--model", choices=list(MODELS), default="YOLOv2ResNet")
+    parser.add_argument("--ckpt", default=None, help="Training checkpoint, defaults to checkpoints/<model>/best_model.pth")
+    parser.add_argument("--out", default=None, help="Output file, defaults to checkpoints/<model>/best_model.safetensors")
+    parser.add_argument("--dtype", choices=list(DTYPES), default="fp32", help="Stored dtype of floating point weights")
+    args = parser.parse_args()
+
+    ckpt_path = args.ckpt or f"checkpoints/{args.model}/best_model.pth"
+    out_path = args.out or f"checkpoints/{args.model}/best_model.safetensors"
+
+    start = time.perf_counter()
+    checkpoint = torch.load(ckpt_path, map_location="cpu", mmap=True, weights_only=True)
+    model_config = checkpoint_model_config(checkpoint, _default_model_config(args.model))
+    export_weights(checkpoint["model_state_dict"], out_path, model_config, DTYPES[args.dtype])
+
+    print(f"Exported {ckpt_path} ({os.path.getsize(ckpt_path) / 1e6:.1f} MB) to "
+          f"{out_path} ({os.path.getsize(out_path) / 1e6:.1f} MB) in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import torch
+
+import config
+
+# Grid offsets reused across calls, keyed by (S, B, device, dtype). Decoding
+# boxes used to rebuild a meshgrid over arange(S) for every tensor, twice per
+# loss evaluation.
+_grids = {}
+
+
+def cell_grid(S, B, device, dtype):
+    """
+    Output: (S, S, B) x and y index of each cell (expanded views of (S, S, 1)
+    tensors allocated on first use) and the cell width and height in pixels.
+    """
+    key = (S, B, torch.device(device), dtype)
+    grid = _grids.get(key)
+    if grid is None:
+        grid_y, grid_x = torch.meshgrid(
+            torch.arange(S, device=device, dtype=dtype),
+            torch.arange(S, device=device, dtype=dtype),
+            indexing='ij'
+        )
+        grid = (
+            grid_x.view(S, S, 1).expand(S, S, B),
+            grid_y.view(S, S, 1).expand(S, S, B),
+            config.IMG_SIZE[0] / S,
+            config.IMG_SIZE[1] / S,
+        )
+        _grids[key] = grid
+    return grid
+
+
+def decode_corners(box):
+    """
+    box: (N, S, S, B, 4) where x, y are relative to the cell and w, h relative to the image
+    returns: x1, y1, x2, y2, each (N, S, S, B) in image pixels
+    """
+    _, S, _, B, _ = box.shape
+    grid_x, grid_y, cell_w, cell_h = cell_grid(S, B, box.device, box.dtype)
+    x, y, w, h = box.unbind(-1)
+
+    x_abs = (grid_x + x) * cell_w
+    y_abs = (grid_y + y) * cell_h
+    w_abs = w * config.IMG_SIZE[0]
+    h_abs = h * config.IMG_SIZE[1]
+    return x_abs - w_abs / 2, y_abs - h_abs / 2, x_abs + w_abs / 2, y_abs + h_abs / 2
+
+
+def decode_iou(a, b):
+    """
+    a, b: (N, S, S, B, 4+) boxes as in decode_corners, extra channels are ignored
+    returns: (N, S, S, B, B) IoU of every box of a with every box of b in the same cell
+
+    Works on the decoded corner coordinates directly, without stacking them
+    into xyxy tensors and slicing those apart again.
+    """
+    ax1, ay1, ax2, ay2 = (t.unsqueeze(4) for t in decode_corners(a[..., :4])) # (N, S, S, B, 1)
+    bx1, by1, bx2, by2 = (t.unsqueeze(3) for t in decode_corners(b[..., :4])) # (N, S, S, 1, B)
+
+    area_a = (ax2 - ax1) * (ay2 - ay1)
+    area_b = (bx2 - bx1) * (by2 - by1)
+
+    inter_w = (torch.min(ax2, bx2) - torch.max(ax1, bx1)).clamp(min=0)
+    inter_h = (torch.min(ay2, by2) - torch.max(ay1, by1)).clamp(min=0)
+    inter = inter_w * inter_h
+
+    union = area_a + area_b - inter
+    ious = inter / union
+    return torch.where(union > 0, ious, torch.zeros_like(ious)) # No NaN
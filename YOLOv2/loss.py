@@ -2,7 +2,7 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
-from utils import batch_iou
+from grid import decode_iou
 import config
 
 class YOLOLoss(nn.Module):
@@ -29,7 +29,9 @@ class YOLOLoss(nn.Module):
         # Each box has B iou targets
         # Each box is responsible for one with best iou
         # gnd_truth is targets but the box is at correct spot for the pred
-        ious = batch_iou(preds, targets) # (N, S, S, B, B)
+        # Only used to pick boxes, so no graph is recorded for it
+        with torch.no_grad():
+            ious = decode_iou(preds, targets) # (N, S, S, B, B)
         responsible = torch.argmax(ious, dim=-1, keepdim=True) # (N, S, S, B, 1)
         responsible = responsible.expand(-1, -1, -1, -1, targets.size(-1)) # (N, S, S, B, 5+C)
         gnd_truth = torch.gather(targets, dim=3, index=responsible) # (N, S, S, B, 5+C)
@@ -82,8 +84,9 @@ class YOLOV2Loss(nn.Module):
         preds = preds.view(N, S, S, B, 5 + C)
         targets = targets.view(N, S, S, B, 5 + C)
 
-        # Get IoU for each pred-target pair
-        ious = batch_iou(preds, targets)  # (N, S, S, B, B)
+        # Get IoU for each pred-target pair, only used to pick boxes so no graph is recorded
+        with torch.no_grad():
+            ious = decode_iou(preds, targets)  # (N, S, S, B, B)
         best_target_idx = torch.argmax(ious, dim=-1)  # (N, S, S, B)
 
         # For each pred box, find corresponding best-matching target box
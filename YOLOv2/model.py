@@ -4,12 +4,25 @@ import torch.nn.functional as F
 from torchvision.models import resnet50, ResNet50_Weights, resnet18, ResNet18_Weights
 
 import config
+from recompute import CheckpointedSequential
 
 # Original YOLOv2 from scratch
 
+# The deep conv stacks (YOLOv2.model, DetectionNet.model) are CheckpointedSequentials,
+# their activations can be recomputed in backward instead of stored (train.py --checkpoint-segments).
+
+HEADS = ("dense", "conv", "separable")
+
+
+def check_head(head):
+    if head not in HEADS:
+        raise ValueError(f"Unknown head {head!r}, expected one of {HEADS}")
+
+
 class YOLOv2(nn.Module):
-    def __init__(self):
+    def __init__(self, head=config.HEAD):
         super().__init__()
+        check_head(head)
 
         layers = []
 
@@ -88,16 +101,23 @@ class YOLOv2(nn.Module):
                 nn.LeakyReLU(0.1),
             ]
 
-        self.model = nn.Sequential(*layers)
+        self.model = CheckpointedSequential(*layers)
 
         self.depth = config.B * (5 + config.C)
-        self.out = nn.Sequential(
-            nn.Flatten(),
-            nn.Linear(1024 * config.S * config.S, 4096),
-            nn.Dropout(0.5),
-            nn.LeakyReLU(0.1),
-            nn.Linear(4096, config.S * config.S * self.depth),
-        )
+        if head == "dense":
+            self.out = nn.Sequential(
+                nn.Flatten(),
+                nn.Linear(1024 * config.S * config.S, 4096),
+                nn.Dropout(0.5),
+                nn.LeakyReLU(0.1),
+                nn.Linear(4096, config.S * config.S * self.depth),
+            )
+        else:
+            # The 1024xSxS features already line up with the grid, predict each cell with a 1x1 conv
+            self.out = nn.Sequential(
+                nn.Conv2d(1024, self.depth, kernel_size=1),
+                CellsToVector(),
+            )
  
     def forward(self, X):
         X = self.model(X)
@@ -112,7 +132,7 @@ class YOLOv2(nn.Module):
         return output
     
 class YOLOv2ViT(nn.Module):
-    def __init__(self):
+    def __init__(self, head=config.HEAD):
         super().__init__()
  
     def forward(self, X):
@@ -121,7 +141,7 @@ class YOLOv2ViT(nn.Module):
 # YOLOv2 with ResNet50 backbone
 
 class YOLOv2ResNet(nn.Module):
-    def __init__(self):
+    def __init__(self, head=config.HEAD):
         super().__init__()
         self.depth = config.B * 5 + config.C
 
@@ -142,57 +162,86 @@ class YOLOv2ResNet(nn.Module):
         self.model = nn.Sequential(
             backbone,
             Reshape(2048, 14, 14),
-            DetectionNet(2048)              # 4 conv, 2 linear
+            DetectionNet(2048, head)        # 4 conv, 2 linear (or 1x1 conv)
         )
 
     def forward(self, x):
         return self.model.forward(x)
     
 class DetectionNet(nn.Module):
-    """The layers added on for detection as described in the YOLOv2 paper, with BatchNorm."""
+    """
+    The layers added on for detection as described in the YOLOv2 paper, with BatchNorm.
+    head="conv" replaces the two linear layers with a 1x1 conv per cell, "separable"
+    also makes the 3x3 convs depthwise-separable.
+    """
 
-    def __init__(self, in_channels):
+    def __init__(self, in_channels, head=config.HEAD):
         super().__init__()
+        check_head(head)
 
         inner_channels = 1024
         self.depth = config.B * (5 + config.C)
+        separable = head == "separable"
 
-        self.model = nn.Sequential(
-            nn.Conv2d(in_channels, inner_channels, kernel_size=3, padding=1),
-            nn.BatchNorm2d(inner_channels),
-            nn.LeakyReLU(negative_slope=0.1),
-
-            nn.Conv2d(inner_channels, inner_channels, kernel_size=3, stride=2, padding=1),
-            nn.BatchNorm2d(inner_channels),
-            nn.LeakyReLU(negative_slope=0.1),
-
-            nn.Conv2d(inner_channels, inner_channels, kernel_size=3, padding=1),
-            nn.BatchNorm2d(inner_channels),
-            nn.LeakyReLU(negative_slope=0.1),
+        layers = []
+        layers += conv_block(in_channels, inner_channels, separable=separable)
+        layers += conv_block(inner_channels, inner_channels, stride=2, separable=separable)
+        layers += conv_block(inner_channels, inner_channels, separable=separable)
+        layers += conv_block(inner_channels, inner_channels, separable=separable)
 
-            nn.Conv2d(inner_channels, inner_channels, kernel_size=3, padding=1),
-            nn.BatchNorm2d(inner_channels),
-            nn.LeakyReLU(negative_slope=0.1),
+        if head == "dense":
+            layers += [
+                nn.Flatten(),
 
-            nn.Flatten(),
+                nn.Linear(7 * 7 * inner_channels, 4096),
+                nn.Dropout(0.5),
+                nn.LeakyReLU(negative_slope=0.1),
 
-            nn.Linear(7 * 7 * inner_channels, 4096),
-            nn.Dropout(0.5),
-            nn.LeakyReLU(negative_slope=0.1),
+                nn.Linear(4096, config.S * config.S * self.depth)
+            ]
+        else:
+            layers += [
+                nn.Conv2d(inner_channels, self.depth, kernel_size=1),
+                CellsToVector(),
+            ]
 
-            nn.Linear(4096, config.S * config.S * self.depth)
-        )
+        self.model = CheckpointedSequential(*layers)
 
     def forward(self, x):
         x = self.model(x)
 
         # Apply sigmoid to x,y,w,h conf
+        # Out of place so FX can trace it (quantize.py), same values as x[:5] = F.sigmoid(x[:5])
         x = x.view(-1, config.S, config.S, config.B)
-        x[:5] = F.sigmoid(x[:5])
+        x = torch.cat([F.sigmoid(x[:5]), x[5:]])
         
         return x.view(-1, config.S, config.S, self.depth)
 
     
+def conv_block(in_channels, out_channels, stride=1, separable=False):
+    if separable:
+        return [
+            nn.Conv2d(in_channels, in_channels, kernel_size=3, stride=stride, padding=1, groups=in_channels),
+            nn.BatchNorm2d(in_channels),
+            nn.LeakyReLU(negative_slope=0.1),
+            nn.Conv2d(in_channels, out_channels, kernel_size=1),
+            nn.BatchNorm2d(out_channels),
+            nn.LeakyReLU(negative_slope=0.1),
+        ]
+    return [
+        nn.Conv2d(in_channels, out_channels, kernel_size=3, stride=stride, padding=1),
+        nn.BatchNorm2d(out_channels),
+        nn.LeakyReLU(negative_slope=0.1),
+    ]
+
+
+class CellsToVector(nn.Module):
+    """(N, depth, S, S) conv output -> (N, S*S*depth), the same layout as the linear head."""
+
+    def forward(self, x):
+        return x.permute(0, 2, 3, 1).flatten(1)
+
+
 class Reshape(nn.Module):  
     def __init__(self, *args):
         super().__init__()
@@ -215,7 +264,7 @@ class ResNet18(nn.Module):
         return self.model.forward(x)
 
 class YOLOv2ResNet18(nn.Module):
-    def __init__(self, backbone_weights=None):
+    def __init__(self, backbone_weights=None, head=config.HEAD):
         super().__init__()
         self.depth = config.B * (5 + config.C)
 
@@ -236,7 +285,7 @@ class YOLOv2ResNet18(nn.Module):
         self.model = nn.Sequential(
             backbone.model,
             Reshape(512, 14, 14),
-            DetectionNet(512)              # 4 conv, 2 linear
+            DetectionNet(512, head)        # 4 conv, 2 linear (or 1x1 conv)
         )
 
     def forward(self, x):
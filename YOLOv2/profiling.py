@@ -0,0 +1,171 @@
+# Copied as YoMAMBA/utils/profiling.py: the projects are standalone and don't import each other, fix both.
+import os
+import json
+import time
+import resource
+from contextlib import contextmanager, nullcontext
+from collections import defaultdict
+
+import torch
+
+# Per-step instrumentation of a training loop. The loop iterates its loader
+# through StepProfiler.iterate and wraps its stages in profiler.stage(name):
+#   for batch in profiler.iterate(loader, epoch):
+#       with profiler.stage("h2d"): ...
+#       with profiler.stage("forward"): ...
+# "data" (waiting for the batch) and "optimizer" (every optimizer.step, through
+# optimizer hooks) are recorded on their own. Each step becomes one JSONL line
+# (and TensorBoard scalars) with the seconds per stage, images/s and peak memory.
+
+
+class StepProfiler:
+    """
+    Records per-step stage timings, throughput and peak memory to
+    log_dir/profile.jsonl and, with tensorboard=True, to a TensorBoard run in
+    log_dir. Stages are exclusive: a stage entered inside another one (the
+    optimizer step inside "backward") is not counted twice. With sync=True
+    the device is synchronized at every stage boundary, so asynchronous CUDA
+    work is charged to the stage that launched it instead of to the next
+    .item(), at some cost in throughput. trace_steps=(first, last) also runs
+    torch.profiler over those global steps and saves the trace to log_dir.
+    enabled=False turns every method into a no-op.
+    """
+
+    def __init__(self, log_dir, device, optimizer=None, enabled=True, sync=True, tensorboard=True, trace_steps=None):
+        self.enabled = enabled
+        self.device = torch.device(device)
+        self.sync = sync and self.device.type == "cuda"
+        self.trace_steps = trace_steps
+        self.global_step = 0
+        self.totals = defaultdict(float) # per epoch, for summary()
+        self.samples = 0
+        self.steps = 0
+        self._times = defaultdict(float)
+        self._stack = []
+        self._since = 0.0
+        self._trace = None
+        if not enabled:
+            return
+
+        os.makedirs(log_dir, exist_ok=True)
+        self.log_dir = log_dir
+        self._jsonl = open(os.path.join(log_dir, "profile.jsonl"), "a")
+        self._writer = None
+        if tensorboard:
+            from torch.utils.tensorboard import SummaryWriter
+            self._writer = SummaryWriter(log_dir)
+        if optimizer is not None:
+            optimizer.register_step_pre_hook(lambda *_: self._enter("optimizer"))
+            optimizer.register_step_post_hook(lambda *_: self._exit())
+
+    def _now(self):
+        if self.sync:
+            torch.cuda.synchronize(self.device)
+        return time.perf_counter()
+
+    def _enter(self, name):
+        now = self._now()
+        if self._stack:
+            self._times[self._stack[-1]] += now - self._since
+        self._stack.append(name)
+        self._since = now
+
+    def _exit(self):
+        now = self._now()
+        self._times[self._stack.pop()] += now - self._since
+        self._since = now
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        self._enter(name)
+        try:
+            with torch.profiler.record_function(name) if self._trace is not None else nullcontext():
+                yield
+        finally:
+            self._exit()
+
+    def iterate(self, loader, epoch):
+        """Yields the batches of loader, each one a profiled step of epoch."""
+        if not self.enabled:
+            yield from loader
+            return
+
+        self.totals = defaultdict(float)
+        self.samples = 0
+        self.steps = 0
+        batches = iter(loader)
+        while True:
+            self._start_trace()
+            self._times = defaultdict(float)
+            if self.device.type == "cuda":
+                torch.cuda.reset_peak_memory_stats(self.device)
+            start = self._now()
+            with self.stage("data"):
+                batch = next(batches, None)
+            if batch is None:
+                self._stop_trace(force=True)
+                return
+            yield batch
+            self._end_step(epoch, len(batch[0]), self._now() - start)
+
+    def _end_step(self, epoch, samples, elapsed):
+        record = {"epoch": epoch, "step": self.global_step, "samples": samples}
+        record.update({name: t for name, t in self._times.items()})
+        record["total"] = elapsed
+        record["images_per_s"] = samples / elapsed
+        if self.device.type == "cuda":
+            record["peak_cuda_mb"] = torch.cuda.max_memory_allocated(self.device) / 2**20
+        record["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # KiB on Linux
+
+        self._jsonl.write(json.dumps(record) + "\n")
+        if self._writer is not None:
+            for name, t in self._times.items():
+                self._writer.add_scalar(f"step_ms/{name}", t * 1000, self.global_step)
+            self._writer.add_scalar("throughput/images_per_s", record["images_per_s"], self.global_step)
+            for key in ("peak_cuda_mb", "max_rss_mb"):
+                if key in record:
+                    self._writer.add_scalar(f"memory/{key}", record[key], self.global_step)
+
+        for name, t in self._times.items():
+            self.totals[name] += t
+        self.totals["total"] += elapsed
+        self.samples += samples
+        self.steps += 1
+        self._stop_trace()
+        self.global_step += 1
+
+    def _start_trace(self):
+        if self.trace_steps is None or self._trace is not None or self.global_step != self.trace_steps[0]:
+            return
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if self.device.type == "cuda":
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self._trace = torch.profiler.profile(activities=activities, record_shapes=True, profile_memory=True)
+        self._trace.__enter__()
+
+    def _stop_trace(self, force=False):
+        if self._trace is None or not (force or self.global_step >= self.trace_steps[1]):
+            return
+        self._trace.__exit__(None, None, None)
+        path = os.path.join(self.log_dir, f"trace_steps_{self.trace_steps[0]}-{self.global_step}.json")
+        self._trace.export_chrome_trace(path)
+        self._trace = None
+        print(f"Saved torch.profiler trace to {path}")
+
+    def summary(self):
+        """Mean ms per stage and images/s of the steps of the last iterate() pass."""
+        if not self.enabled or self.steps == 0:
+            return ""
+        stages = " | ".join(f"{name} {t / self.steps * 1000:.1f}" for name, t in self.totals.items() if name != "total")
+        return f"ms/step: {stages} | {self.samples / self.totals['total']:.1f} img/s"
+
+    def close(self):
+        if not self.enabled:
+            return
+        self._stop_trace(force=True)
+        self._jsonl.close()
+        if self._writer is not None:
+            self._writer.close()
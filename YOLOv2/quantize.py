@@ -0,0 +1,124 @@
+import os
+import copy
+import json
+import time
+import argparse
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, Subset
+from torch.ao.quantization import get_default_qconfig_mapping, default_dynamic_qconfig
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+from torchmetrics.detection.mean_ap import MeanAveragePrecision
+
+import config
+from data import VOCDataset, collate_stack
+from export import MODELS, load_for_inference
+from utils import batch_to_mAP_list
+
+# Post-training int8 quantization for CPU inference:
+#   python quantize.py --model YOLOv2ResNet [--calibration-images 256] [--eval-images 512]
+# Convs get static int8 (Conv+BN(+ReLU) fused, per-channel weights, activation ranges
+# calibrated on the first VOC val images), the big Linear layers of the detection head
+# dynamic int8. Writes checkpoints/<model>/best_model_int8.pt (TorchScript, loads with
+# load_quantized and no model code) and compares it to fp32 on the next val images.
+
+ENGINE = "x86"
+
+
+def quantize_int8(model, calibration_batches):
+    """
+    Input: fp32 model, iterable of (N, 3, H, W) calibration images.
+    Output: quantized copy of model (CPU, eval mode).
+    """
+    torch.backends.quantized.engine = ENGINE
+    model = copy.deepcopy(model).cpu().eval()
+
+    qconfig_mapping = get_default_qconfig_mapping(ENGINE).set_object_type(nn.Linear, default_dynamic_qconfig)
+    batches = iter(calibration_batches)
+    first = next(batches)
+    prepared = prepare_fx(model, qconfig_mapping, (first[:1],))
+    with torch.no_grad():
+        prepared(first)
+        for images in batches:
+            prepared(images)
+    return convert_fx(prepared).eval()
+
+
+def save_quantized(model, path, model_config):
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(model, torch.zeros(1, 3, *config.IMG_SIZE)))
+    torch.jit.save(traced, path, _extra_files={"config.json": json.dumps(dict(model_config, dtype="int8"))})
+
+
+def load_quantized(path):
+    """Output: (model, model_config) of a file written by save_quantized, model runs on CPU only."""
+    torch.backends.quantized.engine = ENGINE
+    extra_files = {"config.json": ""}
+    model = torch.jit.load(path, map_location="cpu", _extra_files=extra_files)
+    return model, json.loads(extra_files["config.json"])
+
+
+def time_forward(model, batch_size, iters):
+    x = torch.randn(batch_size, 3, *config.IMG_SIZE)
+    with torch.inference_mode():
+        model(x) # warmup
+        start = time.perf_counter()
+        for _ in range(iters):
+            model(x)
+    return (time.perf_counter() - start) / iters
+
+
+def val_mAP(model, dataset):
+    metric = MeanAveragePrecision(backend="faster_coco_eval")
+    with torch.inference_mode():
+        for images, targets in DataLoader(dataset, batch_size=32, collate_fn=collate_stack):
+            preds_list, targets_list = batch_to_mAP_list(model(images), targets)
+            metric.update(preds=preds_list, target=targets_list)
+    return metric.compute()["map_50"].item()
+
+
+def main():
+    parser = argparse.ArgumentParser("YOLO int8 quantization")
+    parser.add_argument("--model", choices=list(MODELS), default="YOLOv2ResNet")
+    parser.add_argument("--out", default=None, help="Output file, defaults to checkpoints/<model>/best_model_int8.pt")
+    parser.add_argument("--calibration-images", type=int, default=256)
+    parser.add_argument("--eval-images", type=int, default=512, help="Val images for the mAP comparison, 0 to skip it")
+    parser.add_argument("--batch-size", type=int, default=16, help="Batch size of the throughput measurement")
+    parser.add_argument("--iters", type=int, default=10)
+    args = parser.parse_args()
+
+    out_path = args.out or f"checkpoints/{args.model}/best_model_int8.pt"
+    model = load_for_inference(args.model, "cpu")
+
+    val_ds = VOCDataset("val")
+    n_calibration = min(len(val_ds), args.calibration_images)
+    calibration_loader = DataLoader(Subset(val_ds, range(n_calibration)), batch_size=32, collate_fn=collate_stack)
+
+    start = time.perf_counter()
+    quantized = quantize_int8(model, (images for images, _ in calibration_loader))
+    model_config = {"model": args.model, "head": config.HEAD, "S": config.S, "B": config.B, "C": config.C}
+    save_quantized(quantized, out_path, model_config)
+    print(f"Quantized with {n_calibration} calibration images in {time.perf_counter() - start:.1f}s, "
+          f"saved {out_path} ({os.path.getsize(out_path) / 1e6:.1f} MB)")
+
+    # Measure the saved artifact, not the in-memory model
+    quantized, _ = load_quantized(out_path)
+    eval_ds = Subset(val_ds, range(n_calibration, min(len(val_ds), n_calibration + args.eval_images)))
+
+    results = {}
+    for name, m in [("fp32", model), ("int8", quantized)]:
+        latency = time_forward(m, 1, args.iters)
+        throughput = args.batch_size / time_forward(m, args.batch_size, max(1, args.iters // 2))
+        mAP = val_mAP(m, eval_ds) if len(eval_ds) > 0 else None
+        results[name] = (latency, throughput, mAP)
+        print(f"{name}: {latency * 1e3:.1f} ms at batch 1, {throughput:.1f} images/s at batch {args.batch_size}, "
+              f"mAP@50 {'n/a' if mAP is None else f'{mAP:.4f}'}")
+
+    print(f"Speedup {results['fp32'][0] / results['int8'][0]:.2f}x at batch 1")
+    if len(eval_ds) > 0:
+        print(f"mAP@50 delta {results['int8'][2] - results['fp32'][2]:+.4f} on {len(eval_ds)} val images")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,41 @@
 import torch
-from torch.utils.data import DataLoader
 from torchmetrics.detection.mean_ap import MeanAveragePrecision
 from utils import batch_to_mAP_list
 
-from model import YOLOv2, YOLOv2ResNet, YOLOv2ViT
-from data import VOCDataset
+from data import VOCDataset, collate_stack
+from export import load_for_inference
+from loader import make_loader, LoaderTimer
 import config
 from tqdm import tqdm
 
-## Dataset
-test_ds = VOCDataset("val")
 
-def collate_fn(batch):
-    imgs, targets = zip(*batch)
-    return torch.stack(imgs), torch.stack(targets)
+# Under main so spawned loader workers (macOS) don't rerun the evaluation on import
+def main():
+    ## Dataset
+    test_ds = VOCDataset("val")
+    test_dataloader = LoaderTimer(make_loader(test_ds, 64, collate_fn=collate_stack))
 
-test_dataloader = DataLoader(test_ds, batch_size=64, collate_fn=collate_fn)
+    ## Model and Metric
 
-## Model and Metric
+    device = "cuda" if torch.cuda.is_available() else "mps"
+    model_name = "YOLOv2ResNet"
+    model = load_for_inference(model_name, device)
 
-device = "cuda" if torch.cuda.is_available() else "mps"
-model_name = "YOLOv2ResNet"
-models = {
-    "YOLOv2": YOLOv2,
-    "YOLOv2Vit": YOLOv2ViT,
-    "YOLOv2ResNet": YOLOv2ResNet
-}
-model = models[model_name]().to(device)
-checkpoint = torch.load(f"checkpoints/{model_name}/best_model.pth", map_location=device)
-model.load_state_dict(checkpoint["model_state_dict"])
-model.eval()
+    metric = MeanAveragePrecision(backend="faster_coco_eval")
 
-metric = MeanAveragePrecision(backend="faster_coco_eval")
+    with torch.no_grad():
+        test_loss = 0
+        for images, targets in tqdm(test_dataloader, desc='Test', leave=False):
+            images, targets = images.to(device, non_blocking=True), targets.to(device, non_blocking=True)
 
-with torch.no_grad():
-    test_loss = 0
-    for images, targets in tqdm(test_dataloader, desc='Test', leave=False):
-        images, targets = images.to(device), targets.to(device)
+            preds = model(images)
 
-        preds = model(images)
+            # Calculate mAP
+            preds_list, targets_list = batch_to_mAP_list(preds, targets)
+            metric.update(preds=preds_list, target=targets_list)
+        print(metric.compute())
+        print(test_dataloader.summary())
 
-        # Calculate mAP
-        preds_list, targets_list = batch_to_mAP_list(preds, targets)
-        metric.update(preds=preds_list, target=targets_list)
-    print(metric.compute())
\ No newline at end of file
+
+if __name__ == "__main__":
+    main()
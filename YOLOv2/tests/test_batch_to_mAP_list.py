@@ -0,0 +1,69 @@
+import torch
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import config
+from utils import batch_to_mAP_list, xywh_to_xyxy
+
+
+def reference_batch_to_mAP_list(preds, targets):
+    # Original per image, per cell, per box loop, which keeps empty targets
+    N = preds.shape[0]
+    preds = preds.view(N, config.S, config.S, config.B, 5 + config.C)
+    targets = targets.view(N, config.S, config.S, config.B, 5 + config.C)
+    preds_xyxy = xywh_to_xyxy(preds[..., :4]).view(N, config.S * config.S, config.B, 4)
+    targets_xyxy = xywh_to_xyxy(targets[..., :4]).view(N, config.S * config.S, config.B, 4)
+    preds = preds.view(N, config.S * config.S, config.B, 5 + config.C)
+    targets = targets.view(N, config.S * config.S, config.B, 5 + config.C)
+
+    preds_list, targets_list = [], []
+    for idx in range(N):
+        pred_boxes, pred_labels, pred_scores = [], [], []
+        target_boxes, target_labels = [], []
+        for s in range(config.S * config.S):
+            for b in range(config.B):
+                pred_boxes.append(preds_xyxy[idx, s, b, :])
+                pred_labels.append(torch.argmax(preds[idx, s, b, 5:]).item())
+                pred_scores.append(preds[idx, s, b, 4])
+                target_boxes.append(targets_xyxy[idx, s, b, :])
+                target_labels.append(torch.argmax(targets[idx, s, b, 5:]).item())
+        preds_list.append({"boxes": torch.stack(pred_boxes), "scores": torch.stack(pred_scores), "labels": torch.tensor(pred_labels)})
+        targets_list.append({"boxes": torch.stack(target_boxes), "labels": torch.tensor(target_labels)})
+    return preds_list, targets_list
+
+
+def random_batch(N=4, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    shape = (N, config.S, config.S, config.B, 5 + config.C)
+    preds = torch.rand(shape, generator=generator)
+    targets = torch.zeros(shape)
+    has_obj = torch.rand(shape[:-1], generator=generator) < 0.1
+    classes = torch.randint(0, config.C, shape[:-1], generator=generator)
+    targets[..., :4] = torch.rand(shape[:-1] + (4,), generator=generator) * has_obj.unsqueeze(-1)
+    targets[..., 4] = has_obj.float()
+    targets[..., 5:] = torch.nn.functional.one_hot(classes, config.C) * has_obj.unsqueeze(-1)
+    return preds.view(N, config.S, config.S, -1), targets.view(N, config.S, config.S, -1), has_obj.view(N, -1)
+
+
+def test_matches_reference_without_empty_targets():
+    preds, targets, has_obj = random_batch()
+    preds_list, targets_list = batch_to_mAP_list(preds, targets)
+    ref_preds, ref_targets = reference_batch_to_mAP_list(preds, targets)
+
+    for i in range(preds.shape[0]):
+        for key in ["boxes", "scores", "labels"]:
+            assert torch.equal(preds_list[i][key], ref_preds[i][key])
+        for key in ["boxes", "labels"]:
+            assert torch.equal(targets_list[i][key], ref_targets[i][key][has_obj[i]])
+
+
+def test_conf_threshold():
+    preds, targets, _ = random_batch()
+    preds_list, _ = batch_to_mAP_list(preds, targets, conf_threshold=0.5)
+    ref_preds, _ = reference_batch_to_mAP_list(preds, targets)
+
+    for i in range(preds.shape[0]):
+        keep = ref_preds[i]["scores"] > 0.5
+        for key in ["boxes", "scores", "labels"]:
+            assert torch.equal(preds_list[i][key], ref_preds[i][key][keep])
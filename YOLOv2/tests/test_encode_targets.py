@@ -0,0 +1,44 @@
+import torch
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import config
+from data import encode_targets, collate_boxes, collate_stack
+
+
+def test_yolov2_layout_fills_free_boxes():
+    # Three objects centered in the same cell, only B=2 fit
+    boxes = torch.tensor([[0., 0., 40., 40.], [10., 10., 30., 30.], [5., 5., 35., 35.]])
+    class_ids = torch.tensor([3, 7, 1])
+    target = encode_targets(boxes, class_ids, layout="yolov2").view(config.S, config.S, config.B, 5 + config.C)
+
+    cell = target[0, 0]
+    assert torch.allclose(cell[0, :5], torch.tensor([20 / 64, 20 / 64, 40 / 448, 40 / 448, 1.0]))
+    assert cell[0, 5 + 3] == 1 and cell[1, 5 + 7] == 1
+    assert target[..., 4].sum() == 2
+
+
+def test_yolov1_layout_later_object_overrides():
+    boxes = torch.tensor([[0., 0., 40., 40.], [10., 10., 30., 30.]])
+    target = encode_targets(boxes, torch.tensor([3, 7]), layout="yolov1")
+    assert target[0, 0, 7] == 1 and target[0, 0, 3] == 0
+    assert torch.allclose(target[0, 0, config.C:config.C + 5], torch.tensor([1.0, 20 / 64, 20 / 64, 20 / 64, 20 / 64]))
+
+
+def test_batched_encoding_matches_per_image():
+    samples = [
+        (torch.zeros(3, 4, 4), torch.tensor([[100., 50., 200., 300.]]), torch.tensor([4])),
+        (torch.zeros(3, 4, 4), torch.tensor([[0., 0., 448., 448.], [300., 300., 310., 320.]]), torch.tensor([0, 19])),
+    ]
+    _, boxes, class_ids = collate_boxes(samples)
+    batch = encode_targets(boxes, class_ids, layout="yolov2")
+    for i, (_, b, c) in enumerate(samples):
+        assert torch.equal(batch[i], encode_targets(b, c, layout="yolov2"))
+
+
+def test_collate_stack_matches_torch_stack():
+    samples = [(torch.rand(3, 4, 4), torch.rand(config.S, config.S, 10)) for _ in range(3)]
+    images, targets = collate_stack(samples)
+    assert torch.equal(images, torch.stack([s[0] for s in samples]))
+    assert torch.equal(targets, torch.stack([s[1] for s in samples]))
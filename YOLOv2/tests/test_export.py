@@ -0,0 +1,62 @@
+import sys
+import os
+
+import pytest
+import torch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import config
+from export import checkpoint_model_config, export_weights, load_for_inference
+from model import YOLOv2
+
+
+def model_config(head, model="YOLOv2", C=config.C):
+    return {"model": model, "head": head, "S": config.S, "B": config.B, "C": C}
+
+
+@pytest.fixture(scope="module")
+def conv_state_dict():
+    return YOLOv2(head="conv").state_dict()
+
+
+def test_checkpoint_model_config_matches_weights(conv_state_dict):
+    checkpoint = {"model_state_dict": conv_state_dict}
+    assert checkpoint_model_config(checkpoint, model_config("conv")) == model_config("conv")
+
+    stored = dict(checkpoint, model_config=model_config("conv"))
+    assert checkpoint_model_config(stored, model_config("dense")) == model_config("conv")
+
+    with pytest.raises(ValueError):
+        checkpoint_model_config(checkpoint, model_config("dense"))
+    with pytest.raises(ValueError):
+        checkpoint_model_config(checkpoint, model_config("conv", C=config.C + 1))
+
+
+def test_checkpoint_model_config_detection_net_dense_head():
+    # Shapes of DetectionNet's dense head (YOLOv2ResNet), on meta
+    depth = config.B * (5 + config.C)
+    state_dict = {
+        "model.2.model.0.weight": torch.empty(1024, 2048, 3, 3, device="meta"),
+        "model.2.model.13.weight": torch.empty(4096, 1024 * 7 * 7, device="meta"),
+        "model.2.model.16.weight": torch.empty(config.S * config.S * depth, 4096, device="meta"),
+    }
+    resnet_config = model_config("dense", model="YOLOv2ResNet")
+    assert checkpoint_model_config({"model_state_dict": state_dict}, resnet_config) == resnet_config
+    with pytest.raises(ValueError):
+        checkpoint_model_config({"model_state_dict": state_dict}, model_config("separable", model="YOLOv2ResNet"))
+
+
+def test_load_for_inference_prefers_newer_file(tmp_path, conv_state_dict):
+    model_dir = tmp_path / "YOLOv2"
+    model_dir.mkdir()
+    torch.save({"model_state_dict": conv_state_dict, "model_config": model_config("conv")}, model_dir / "best_model.pth")
+    export_weights({k: torch.zeros_like(v) for k, v in conv_state_dict.items()}, str(model_dir / "best_model.safetensors"), model_config("conv"))
+    os.utime(model_dir / "best_model.pth", (0, 0))
+
+    loaded = load_for_inference("YOLOv2", "cpu", str(tmp_path))
+    assert torch.all(loaded.out[0].weight == 0) # the export
+
+    os.utime(model_dir / "best_model.safetensors", (0, 0))
+    os.utime(model_dir / "best_model.pth")
+    loaded = load_for_inference("YOLOv2", "cpu", str(tmp_path))
+    assert torch.equal(loaded.out[0].weight, conv_state_dict["out.0.weight"]) # the newer checkpoint, with its conv head
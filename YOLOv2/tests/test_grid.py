@@ -0,0 +1,70 @@
+import torch
+import math
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import config
+from grid import cell_grid, decode_iou
+from utils import batch_iou, xywh_to_xyxy
+
+
+def reference_xywh_to_xyxy(box):
+    # Original decode, meshgrid rebuilt per call
+    N, S, _, B, _ = box.shape
+    x, y, w, h = box.unbind(-1)
+    grid_y, grid_x = torch.meshgrid(torch.arange(S, device=box.device), torch.arange(S, device=box.device), indexing='ij')
+    grid_x = grid_x.view(1, S, S, 1).expand(N, S, S, B)
+    grid_y = grid_y.view(1, S, S, 1).expand(N, S, S, B)
+    x_abs = (grid_x + x) * (config.IMG_SIZE[0] / S)
+    y_abs = (grid_y + y) * (config.IMG_SIZE[1] / S)
+    w_abs = w * config.IMG_SIZE[0]
+    h_abs = h * config.IMG_SIZE[1]
+    return torch.stack([x_abs - w_abs / 2, y_abs - h_abs / 2, x_abs + w_abs / 2, y_abs + h_abs / 2], dim=-1)
+
+
+def reference_batch_iou(a, b):
+    a, b = reference_xywh_to_xyxy(a[..., :4]), reference_xywh_to_xyxy(b[..., :4])
+    area_a = ((a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])).unsqueeze(4)
+    area_b = ((b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])).unsqueeze(3)
+    a, b = a.unsqueeze(4), b.unsqueeze(3)
+    inter_w = (torch.min(a[..., 2], b[..., 2]) - torch.max(a[..., 0], b[..., 0])).clamp(min=0)
+    inter_h = (torch.min(a[..., 3], b[..., 3]) - torch.max(a[..., 1], b[..., 1])).clamp(min=0)
+    inter = inter_w * inter_h
+    union = area_a + area_b - inter
+    return torch.where(union > 0, inter / union, torch.zeros_like(inter))
+
+
+def random_boxes(N=8, S=config.S, B=config.B, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    boxes = torch.rand(N, S, S, B, 5 + config.C, generator=generator)
+    boxes[..., 2:4] *= 0.5
+    boxes[0, 0, 0, 0, 2:4] = 0 # Degenerate box, union 0 against itself
+    return boxes
+
+
+def test_decode_matches_reference():
+    boxes = random_boxes()
+    assert torch.equal(xywh_to_xyxy(boxes[..., :4]), reference_xywh_to_xyxy(boxes[..., :4]))
+
+
+def test_decode_iou_matches_reference():
+    a, b = random_boxes(seed=0), random_boxes(seed=1)
+    b[0, 0, 0, 0, 2:4] = 0
+    assert torch.equal(decode_iou(a, b), reference_batch_iou(a, b))
+    assert torch.equal(batch_iou(a, b), decode_iou(a, b))
+
+
+def test_decode_iou_known_overlaps():
+    # Same boxes as the test_batch_iou.py visual check: 1x1 grid, 2 boxes
+    a = torch.tensor([[0.5, 0.5, 0.5, 0.5], [0.5, 0.5, 1.0, 1.0]]).view(1, 1, 1, 2, 4)
+    b = torch.tensor([[0.5, 0.5, 0.5, 0.5], [0.6, 0.5, 0.4, 0.4]]).view(1, 1, 1, 2, 4)
+    ious = decode_iou(a, b).view(2, 2)
+    assert torch.allclose(ious, reference_batch_iou(a, b).view(2, 2), atol=1e-6)
+    assert math.isclose(ious[0, 0].item(), 1.0, rel_tol=1e-6)
+    assert math.isclose(ious[1, 0].item(), 0.25, rel_tol=1e-6)
+
+
+def test_grid_is_cached():
+    assert cell_grid(7, 2, "cpu", torch.float32)[0] is cell_grid(7, 2, "cpu", torch.float32)[0]
+    assert cell_grid(7, 2, "cpu", torch.float64)[0].dtype == torch.float64
@@ -4,28 +4,45 @@ import os
 import time
 import math
 import torch
-from torch.utils.data import DataLoader
 from torch.optim import SGD
 from torch.optim.lr_scheduler import LambdaLR
 from torchmetrics.detection.mean_ap import MeanAveragePrecision
 from tqdm import tqdm
 
-from data import VOCDataset
+from data import VOCDataset, collate_boxes, collate_stack, encode_targets
+from augment import BatchAugment
 from model import YOLOv2, YOLOv2ViT, YOLOv2ResNet, YOLOv2ResNet18
 from loss import YOLOLoss, YOLOV2Loss
 import config
 from utils import batch_to_mAP_list, plot_training_metrics
+from amp import MixedPrecision, GradientAccumulator, prepare_model, prepare_input, benchmark_settings, benchmark_step_time, tune_micro_batch
+from recompute import set_checkpoint_segments, checkpointing_report
+from profiling import StepProfiler
+from checkpoint import CheckpointWriter
+from loader import make_loader, split_workers, LoaderTimer
 
 
 def main():
     # CLI arguments
     parser = argparse.ArgumentParser("YOLO Training")
     parser.add_argument("--model", choices=["YOLOv2","YOLOv2ViT","YOLOv2ResNet", "YOLOv2ResNet18"], default="YOLOv2ResNet")
-    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=32, help="Samples per optimizer step")
+    parser.add_argument("--accum-steps", type=int, default=1, help="Micro-batches per optimizer step (gradient accumulation)")
+    parser.add_argument("--auto-micro-batch", action="store_true", default=False, help="Pick the fastest micro-batch (samples/s) that fits in memory, sets --accum-steps")
     parser.add_argument("--epochs", type=int, default=200)
     parser.add_argument("--lr", type=float, default=1e-4)
     parser.add_argument("--lambda-cls", type=float, default=1.0)
     parser.add_argument("--save-last-checkpoint", action="store_true", default=False)
+    parser.add_argument("--gpu-augment", action="store_true", default=False, help="Augment whole batches on the device instead of per sample in workers")
+    parser.add_argument("--precision", choices=["fp32", "bf16", "fp16"], default="fp32", help="Autocast dtype, fp16 adds loss scaling")
+    parser.add_argument("--channels-last", action="store_true", default=False, help="Use channels-last memory format")
+    parser.add_argument("--compile", action="store_true", default=False, help="torch.compile the model and the loss")
+    parser.add_argument("--num-workers", type=int, default=None, help="DataLoader workers shared by the train and val loaders, default one per available core")
+    parser.add_argument("--benchmark", action="store_true", default=False, help="Report step time for every setting before training")
+    parser.add_argument("--checkpoint-segments", type=int, default=0, help="Recompute the deep conv stacks in backward in this many segments (activation checkpointing), 0 = off")
+    parser.add_argument("--checkpoint-report", action="store_true", default=False, help="Report peak memory and step time with and without activation checkpointing before training")
+    parser.add_argument("--profile", action="store_true", default=False, help="Log per-step stage timings, images/s and peak memory to metrics/<model>/profile (JSONL + TensorBoard)")
+    parser.add_argument("--profile-trace", type=int, nargs=2, default=None, metavar=("FIRST", "LAST"), help="Also record a torch.profiler trace of these global train steps (implies --profile)")
     args = parser.parse_args()
 
     # Device
@@ -42,22 +59,36 @@ def main():
     os.makedirs(f"images/{args.model}", exist_ok=True)
 
     # Data
-    train_ds = VOCDataset("train")
+    augment = BatchAugment() if args.gpu_augment else None
+    train_ds = VOCDataset("train", augment=not args.gpu_augment, encode=not args.gpu_augment)
     val_ds = VOCDataset("val")
-    train_loader = DataLoader(train_ds, batch_size=args.batch_size, shuffle=True, collate_fn=lambda b: tuple(zip(*b)))
-    val_loader = DataLoader(val_ds, batch_size=args.batch_size, shuffle=False, collate_fn=lambda b: tuple(zip(*b)))
 
     # Model
     model_cls = {"YOLOv2": YOLOv2, "YOLOv2ViT": YOLOv2ViT, "YOLOv2ResNet": YOLOv2ResNet}[args.model]
     model = model_cls().to(device)
+    if args.checkpoint_segments:
+        # Before the micro-batch is tuned, so it gets the memory checkpointing frees
+        n = set_checkpoint_segments(model, args.checkpoint_segments)
+        print(f"Activation checkpointing: {n} Sequential(s) in {args.checkpoint_segments} segment(s)")
 
     # Optimizer with parameter groups for ResNet fine-tuning
     optimizer = SGD(model.parameters(), lr=args.lr, momentum=0.9, weight_decay=5e-4)
 
     # Loss
     loss_fn = YOLOV2Loss(lambda_class=args.lambda_cls)
+    amp = MixedPrecision(args.precision, device)
     torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
 
+    # Loaders yield micro-batches, args.batch_size samples are accumulated per optimizer step
+    accum_steps = args.accum_steps
+    if args.auto_micro_batch:
+        imgs, tgts = collate_stack([val_ds[i] for i in range(min(len(val_ds), 8))])
+        _, accum_steps = tune_micro_batch(model, loss_fn, imgs.to(device), tgts.to(device), args.batch_size, args.precision, args.channels_last, args.compile)
+    accumulator = GradientAccumulator(optimizer, amp, args.batch_size, accum_steps)
+    train_workers, val_workers = split_workers(1, args.num_workers)
+    train_loader = make_loader(train_ds, accumulator.micro_batch_size, shuffle=True, collate_fn=collate_boxes if args.gpu_augment else collate_stack, num_workers=train_workers)
+    val_loader = make_loader(val_ds, accumulator.micro_batch_size, collate_fn=collate_stack, num_workers=val_workers)
+
     # Resume from checkpoint
     start_epoch = 0
     best_loss = float('inf')
@@ -66,18 +97,22 @@ def main():
         ckpt = torch.load(ckpt_path, map_location=device)
         model.load_state_dict(ckpt['model_state_dict'])
         optimizer.load_state_dict(ckpt['optimizer_state_dict'])
+        if 'scaler_state_dict' in ckpt:
+            amp.load_state_dict(ckpt['scaler_state_dict'])
         start_epoch = ckpt['epoch']
         best_loss = ckpt['loss']
         print(f"Resumed from epoch {start_epoch}, loss {best_loss:.4f}")
 
     # Metrics history
-    train_losses, map_scores, train_times = [], [0], []
+    train_losses, map_scores, train_times, ckpt_blocked, data_wait = [], [0], [], [], []
     metrics_path = f"metrics/{args.model}/train_metrics.pth"
     if os.path.exists(metrics_path):
         m = torch.load(metrics_path)
         train_losses = m['losses'][:start_epoch]
         map_scores   = m['mAP'][: start_epoch // config.EVAL_INTERVAL]
         train_times  = m['times'][:start_epoch]
+        ckpt_blocked = m.get('checkpoint_blocked_times', [])[:start_epoch]
+        data_wait    = m.get('data_wait_times', [])[:start_epoch]
         print("Loaded previous metrics.")
 
     # LR Scheduler
@@ -91,52 +126,93 @@ def main():
             return 0.5 * (1 + math.cos(math.pi * progress))  # cosine decay
     scheduler = LambdaLR(optimizer, lr_lambda=lr_lambda, last_epoch=start_epoch-1)
 
+    # Startup benchmark on one real batch, before the model is prepared for training
+    if args.benchmark:
+        imgs, tgts = next(iter(val_loader))
+        benchmark_settings(model, loss_fn, imgs.to(device), tgts.to(device))
+    if args.checkpoint_report:
+        imgs, tgts = next(iter(val_loader))
+        imgs, tgts = imgs.to(device), tgts.to(device)
+        checkpointing_report(model, sorted({0, 1, 2, 4, args.checkpoint_segments}), lambda: benchmark_step_time(
+            model, loss_fn, imgs, tgts, args.precision, args.channels_last, steps=3, warmup=1))
+
+    step_model = prepare_model(model, args.channels_last, args.compile)
+
+    # Checkpoints and metrics are serialized in the background, training only waits for the CPU copy
+    ckpt_writer = CheckpointWriter()
+    train_loss_fn = torch.compile(loss_fn) if args.compile else loss_fn
+
+    # Per-step instrumentation, see profiling.py
+    profiler = StepProfiler(f"metrics/{args.model}/profile", device, optimizer, enabled=args.profile or args.profile_trace is not None,
+                            trace_steps=args.profile_trace)
+
     # Training loop
     for epoch in range(start_epoch, args.epochs):
         model.train()
         epoch_loss = 0.0
         t0 = time.time()
-        pbar = tqdm(train_loader, desc=f"Epoch {epoch+1}/{args.epochs}")
-        for imgs, tgts in pbar:
-            imgs = torch.stack(imgs).to(device)
-            tgts = torch.stack(tgts).to(device)
-            preds = model(imgs)
-            loss = loss_fn(preds, tgts)
-            optimizer.zero_grad()
-            loss.backward()
-            optimizer.step()
-            epoch_loss += loss.item()
-            pbar.set_postfix({'loss': loss.item()})
-
-            if torch.isnan(loss):
+        if augment is not None:
+            augment.set_epoch(epoch)
+        timer = LoaderTimer(train_loader)
+        pbar = tqdm(profiler.iterate(timer, epoch), total=len(timer), desc=f"Epoch {epoch+1}/{args.epochs}")
+        for batch in pbar:
+            with profiler.stage("h2d"):
+                batch = [t.to(device, non_blocking=True) for t in batch]
+            if augment is not None:
+                with profiler.stage("augment"):
+                    imgs, boxes, class_ids = batch
+                    imgs, boxes = augment(imgs, boxes)
+                    tgts = encode_targets(boxes, class_ids, layout="yolov2")
+            else:
+                imgs, tgts = batch
+            imgs = prepare_input(imgs, args.channels_last)
+            with profiler.stage("forward"), amp.autocast():
+                preds = step_model(imgs)
+            with profiler.stage("loss"):
+                loss = train_loss_fn(preds.float(), tgts)
+            with profiler.stage("backward"):
+                accumulator.backward(loss, imgs.shape[0]) # includes the optimizer step every accum_steps batches
+            with profiler.stage("sync"):
+                loss_value = loss.item()
+            epoch_loss += loss_value
+            pbar.set_postfix({'loss': loss_value})
+
+            if math.isnan(loss_value):
+                ckpt_writer.close()
+                profiler.close()
                 return
 
+        # Every epoch ends on an optimizer step, so the per epoch LR schedule is the same for any accum steps
+        accumulator.flush()
         scheduler.step()
         elapsed = time.time() - t0
         train_times.append(elapsed)
         avg_loss = epoch_loss / len(train_loader)
         train_losses.append(avg_loss)
-        print(f"[Epoch {epoch+1}] Avg Loss: {avg_loss:.4f} | Time: {elapsed:.1f}s")
+        data_wait.append(timer.data_time)
+        print(f"[Epoch {epoch+1}] Avg Loss: {avg_loss:.4f} | Time: {elapsed:.1f}s | {timer.summary()}")
+        if profiler.enabled:
+            print(f"[Epoch {epoch+1}] {profiler.summary()}")
 
-        # Save best
+        # Save best and last, one snapshot for both
+        ckpt_paths = []
         if avg_loss < best_loss:
             best_loss = avg_loss
-            torch.save({
-                'epoch': epoch+1,
-                'model_state_dict': model.state_dict(),
-                'optimizer_state_dict': optimizer.state_dict(),
-                'loss': avg_loss
-            }, f"checkpoints/{args.model}/best_model.pth")
-
-        # Save last
+            ckpt_paths.append(f"checkpoints/{args.model}/best_model.pth")
         if args.save_last_checkpoint:
-            last_path = f"checkpoints/{args.model}/last_model.pth"
-            torch.save({
+            ckpt_paths.append(f"checkpoints/{args.model}/last_model.pth")
+        blocked = 0.0
+        if ckpt_paths:
+            blocked = ckpt_writer.save({
                 'epoch': epoch+1,
                 'model_state_dict': model.state_dict(),
                 'optimizer_state_dict': optimizer.state_dict(),
-                'loss': avg_loss
-            }, last_path)
+                'scaler_state_dict': amp.state_dict(),
+                'loss': avg_loss,
+                'model_config': {'model': args.model, 'head': config.HEAD, 'S': config.S, 'B': config.B, 'C': config.C}
+            }, ckpt_paths)
+            print(f"[Epoch {epoch+1}] Queued {', '.join(ckpt_paths)} (blocked {blocked:.2f}s)")
+        ckpt_blocked.append(blocked)
 
         # Evaluate mAP
         if epoch > 1 and (epoch % config.EVAL_INTERVAL) == 0:
@@ -144,8 +220,8 @@ def main():
             metric = MeanAveragePrecision(backend="faster_coco_eval")
             with torch.no_grad():
                 for imgs, tgts in val_loader:
-                    imgs = torch.stack(imgs).to(device)
-                    tgts = torch.stack(tgts).to(device)
+                    imgs = imgs.to(device, non_blocking=True)
+                    tgts = tgts.to(device, non_blocking=True)
                     preds = model(imgs)
                     p_list, t_list = batch_to_mAP_list(preds, tgts)
                     metric.update(preds=p_list, target=t_list)
@@ -154,15 +230,21 @@ def main():
             print(f"[Epoch {epoch+1}] mAP: {mAP:.4f}")
 
         # Save metrics
-        torch.save({
+        ckpt_writer.save({
             'losses': train_losses,
             'mAP': map_scores,
-            'times': train_times
-        }, metrics_path)
+            'times': train_times,
+            'checkpoint_blocked_times': ckpt_blocked,
+            'data_wait_times': data_wait
+        }, metrics_path, slot="metrics")
 
         # Plot metrics
         plot_training_metrics(train_losses, map_scores, train_times, args.model)
 
+    ckpt_writer.close()
+    profiler.close()
+    print(f"Training blocked on checkpoints for {ckpt_writer.blocked_time:.2f}s in total")
+
 
 if __name__ == '__main__':
     main()
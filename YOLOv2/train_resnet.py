@@ -3,7 +3,6 @@ import argparse
 import os
 import time
 import torch
-from torch.utils.data import DataLoader
 from torch.optim import SGD
 from torch.optim.lr_scheduler import LambdaLR
 from tqdm import tqdm
@@ -12,6 +11,7 @@ from data import VOCClassificationDataset  # Use multi-label dataset
 from model import ResNet18
 import config
 from utils import plot_training_metrics
+from loader import make_loader, split_workers, LoaderTimer
 
 def main():
     parser = argparse.ArgumentParser("ResNet18 Classification Training")
@@ -19,6 +19,7 @@ def main():
     parser.add_argument("--epochs", type=int, default=50)
     parser.add_argument("--lr", type=float, default=1e-3)
     parser.add_argument("--save-last-checkpoint", action="store_true", default=False)
+    parser.add_argument("--num-workers", type=int, default=None, help="DataLoader workers shared by the train and val loaders, default one per available core")
     args = parser.parse_args()
 
     # Device
@@ -35,8 +36,9 @@ def main():
 
     train_ds = VOCClassificationDataset("train")
     val_ds = VOCClassificationDataset("val")
-    train_loader = DataLoader(train_ds, batch_size=args.batch_size, shuffle=True)
-    val_loader = DataLoader(val_ds, batch_size=args.batch_size, shuffle=False)
+    train_workers, val_workers = split_workers(1, args.num_workers)
+    train_loader = make_loader(train_ds, args.batch_size, shuffle=True, num_workers=train_workers)
+    val_loader = make_loader(val_ds, args.batch_size, num_workers=val_workers)
 
     model = ResNet18().to(device)
     optimizer = SGD(model.parameters(), lr=args.lr, momentum=0.9, weight_decay=5e-4)
@@ -69,10 +71,11 @@ def main():
         epoch_loss = 0.0
         t0 = time.time()
 
-        pbar = tqdm(train_loader, desc=f"Epoch {epoch+1}/{args.epochs}")
+        timer = LoaderTimer(train_loader)
+        pbar = tqdm(timer, desc=f"Epoch {epoch+1}/{args.epochs}")
         for imgs, labels in pbar:
-            imgs = imgs.to(device)
-            labels = labels.to(device)
+            imgs = imgs.to(device, non_blocking=True)
+            labels = labels.to(device, non_blocking=True)
 
             preds = model(imgs)
             loss = loss_fn(preds, labels)
@@ -89,7 +92,7 @@ def main():
         train_losses.append(avg_loss)
         train_times.append(elapsed)
 
-        print(f"[Epoch {epoch+1}] Avg Loss: {avg_loss:.4f} | Time: {elapsed:.1f}s")
+        print(f"[Epoch {epoch+1}] Avg Loss: {avg_loss:.4f} | Time: {elapsed:.1f}s | {timer.summary()}")
 
         if avg_loss < best_loss:
             best_loss = avg_loss
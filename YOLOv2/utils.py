@@ -3,40 +3,15 @@ from collections import Counter
 import os
 import matplotlib.pyplot as plt
 import config
+from grid import decode_corners, decode_iou
 
 def xywh_to_xyxy(box):
     """
     box: (N, S, S, B, 4) where x, y are relative to cell,
-         and w, h are log-scale relative to cell size
+         and w, h are relative to the image
     returns: (N, S, S, B, 4) in absolute xyxy image coordinates
     """
-    N, S, _, B, _ = box.shape
-    x, y, w, h = box.unbind(-1)
-
-    x_cell_size = config.IMG_SIZE[0] / S
-    y_cell_size = config.IMG_SIZE[1] / S
-
-    # Compute grid offsets
-    grid_y, grid_x = torch.meshgrid(
-        torch.arange(S, device=box.device),
-        torch.arange(S, device=box.device),
-        indexing='ij'
-    )
-    grid_x = grid_x.view(1, S, S, 1).expand(N, S, S, B)
-    grid_y = grid_y.view(1, S, S, 1).expand(N, S, S, B)
-
-    # Convert to absolute positions
-    x_abs = (grid_x + x) * x_cell_size
-    y_abs = (grid_y + y) * y_cell_size
-    w_abs = w * config.IMG_SIZE[0]
-    h_abs = h * config.IMG_SIZE[1]
-
-    x1 = x_abs - w_abs / 2
-    y1 = y_abs - h_abs / 2
-    x2 = x_abs + w_abs / 2
-    y2 = y_abs + h_abs / 2
-
-    return torch.stack([x1, y1, x2, y2], dim=-1)
+    return torch.stack(decode_corners(box), dim=-1)
 
 def batch_iou(a: torch.Tensor, b: torch.Tensor):
     """
@@ -48,47 +23,17 @@ def batch_iou(a: torch.Tensor, b: torch.Tensor):
     Compares iou across every pred box and target box.
     We want to pick the index with best iou match   
     """
+    return decode_iou(a, b)
 
-    a, b = a[..., :4], b[..., :4]
-
-    # Get absolute image corners
-    a = xywh_to_xyxy(a) # (N, S, S, B, 4)
-    b = xywh_to_xyxy(b) # (N, S, S, B, 4)
-
-    # Get area of a and b boxes
-    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
-    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
-
-    # Broadcast so we get B "iou options" for each box
-    a = a.unsqueeze(4) # (N, S, S, B, 1, 4)
-    b = b.unsqueeze(3) # (N, S, S, 1, B, 4)
-    area_a = area_a.unsqueeze(4) # (N, S, S, B, 1, 4)
-    area_b = area_b.unsqueeze(3) # (N, S, S, B, 1, 4)
-
-    # Overlapping intesection points
-    inter_x1 = torch.max(a[..., 0], b[..., 0])
-    inter_y1 = torch.max(a[..., 1], b[..., 1])
-    inter_x2 = torch.min(a[..., 2], b[..., 2])
-    inter_y2 = torch.min(a[..., 3], b[..., 3])
-
-    # Intersection area
-    inter_w = (inter_x2 - inter_x1).clamp(min=0)
-    inter_h = (inter_y2 - inter_y1).clamp(min=0)
-    inter = inter_w * inter_h
-
-    # IOU
-    union = area_a + area_b - inter
-    ious = inter / union
-    ious = torch.where(union > 0, ious, torch.zeros_like(ious)) # No NaN
-
-    return ious
-
-def batch_to_mAP_list(preds: torch.Tensor, targets: torch.Tensor):
+def batch_to_mAP_list(preds: torch.Tensor, targets: torch.Tensor, conf_threshold=None):
     """
     preds: (N, S, S, B * (5+C))
     targets: (N, S, S, B * (5+C))
+    conf_threshold: if given, only predictions with a higher confidence are kept
 
-    Converts model output and targets to coco mAP format
+    Converts model output and targets to coco mAP format. Target boxes with
+    confidence 0 are padding and left out. Boxes keep their cell, box order
+    and stay on the input device; the per image counts are the only sync.
     """
 
     N = preds.shape[0]
@@ -96,43 +41,42 @@ def batch_to_mAP_list(preds: torch.Tensor, targets: torch.Tensor):
     preds = preds.view(N, config.S, config.S, config.B, 5 + config.C)
     targets = targets.view(N, config.S, config.S, config.B, 5 + config.C)
 
-    # Get absolute image coordinates: (N, S, S, B, 5+C) => (N, S*S, B, 4)
-    preds_xyxy = xywh_to_xyxy(preds[..., :4]).view(N, config.S * config.S, config.B, 4)
-    targets_xyxy = xywh_to_xyxy(targets[..., :4]).view(N, config.S * config.S, config.B, 4)
+    # Absolute image coordinates, cells and boxes flattened: (N, S*S*B, 4)
+    pred_boxes = xywh_to_xyxy(preds[..., :4]).view(N, -1, 4)
+    target_boxes = xywh_to_xyxy(targets[..., :4]).view(N, -1, 4)
 
-    preds = preds.view(N, config.S * config.S, config.B, 5 + config.C)
-    targets = targets.view(N, config.S * config.S, config.B, 5 + config.C)
+    preds = preds.view(N, -1, 5 + config.C)
+    targets = targets.view(N, -1, 5 + config.C)
 
-    preds_list, targets_list = [], []
+    pred_scores = preds[..., 4]
+    pred_labels = preds[..., 5:].argmax(-1)
+    target_labels = targets[..., 5:].argmax(-1)
 
-    # Save boxes, scores, labels for each img in batch
-    for idx in range(N):
-        pred_boxes, pred_labels, pred_scores = [], [], []
-        target_boxes, target_labels = [], []
+    keep_preds = torch.ones_like(pred_scores, dtype=torch.bool) if conf_threshold is None else pred_scores > conf_threshold
+    keep_targets = targets[..., 4] > 0
 
-        for s in range(config.S * config.S):
-            for b in range(config.B):
-                pred_boxes.append(preds_xyxy[idx, s, b, :])
-                pred_labels.append(torch.argmax(preds[idx, s, b, 5:]).item())
-                pred_scores.append(preds[idx, s, b, 4])
+    # Move kept boxes to the front of each image (stable, so in order) and cut at the count
+    pred_order = torch.argsort(keep_preds.byte(), dim=1, descending=True, stable=True)
+    target_order = torch.argsort(keep_targets.byte(), dim=1, descending=True, stable=True)
+    pred_counts, target_counts = torch.stack([keep_preds.sum(1), keep_targets.sum(1)]).tolist()
 
-                target_boxes.append(targets_xyxy[idx, s, b, :])
-                target_labels.append(torch.argmax(targets[idx, s, b, 5:]).item())
+    pred_boxes = pred_boxes.gather(1, pred_order.unsqueeze(-1).expand(-1, -1, 4))
+    pred_scores = pred_scores.gather(1, pred_order)
+    pred_labels = pred_labels.gather(1, pred_order)
+    target_boxes = target_boxes.gather(1, target_order.unsqueeze(-1).expand(-1, -1, 4))
+    target_labels = target_labels.gather(1, target_order)
 
-        preds_list.append({
-            "boxes": torch.stack(pred_boxes),
-            "scores": torch.stack(pred_scores),
-            "labels": torch.tensor(pred_labels)
-        })
-
-        targets_list.append({
-            "boxes": torch.stack(target_boxes),
-            "labels": torch.tensor(target_labels)
-        })
+    preds_list = [
+        {"boxes": pred_boxes[i, :n], "scores": pred_scores[i, :n], "labels": pred_labels[i, :n]}
+        for i, n in enumerate(pred_counts)
+    ]
+    targets_list = [
+        {"boxes": target_boxes[i, :n], "labels": target_labels[i, :n]}
+        for i, n in enumerate(target_counts)
+    ]
 
     return preds_list, targets_list
 
-
 def plot_training_metrics(train_losses, map_scores, train_times, model_name, save_dir="images"):
     os.makedirs(f"{save_dir}/{model_name}", exist_ok=True)
 
@@ -6,6 +6,7 @@ import matplotlib.patches as patches
 from torchvision.ops import nms
 from torch.utils.data import DataLoader
 from data import VOCDataset
+from export import load_for_inference
 from model import YOLOv2ResNet, YOLOv2
 import config
 
@@ -26,10 +27,7 @@ device = torch.device(
 print(f"Using device: {device}, show_gt={SHOW_GT}")
 
 # Load model
-model = YOLOv2().to(device)
-state = torch.load("checkpoints/YOLOv2/best_model.pth", map_location=device)
-model.load_state_dict(state["model_state_dict"])
-model.eval()
+model = load_for_inference("YOLOv2", device)
 
 # Dataset
 dataset = VOCDataset("train")
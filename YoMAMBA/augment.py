@@ -0,0 +1,96 @@
+# Copied as YOLOv2/augment.py: the projects are standalone and don't import each other, fix both.
+import torch
+import torch.nn.functional as F
+
+import config
+
+
+class BatchAugment:
+    """
+    Batched, device side version of the training augmentations in
+    VOCDataset.image_transform (RandomAffine translate/scale + ColorJitter
+    brightness/saturation). Runs after collation on whatever device the batch
+    is on, drawing independent parameters for every sample from a seeded
+    generator, so worker processes only have to decode. After eval() it
+    returns its input unchanged, like the eval transform.
+    """
+
+    def __init__(self, translate=(0.2, 0.2), scale=(0.8, 1.2), brightness=0.5, saturation=0.5, seed=0):
+        self.translate = translate
+        self.scale = scale
+        self.brightness = (1 - brightness, 1 + brightness)
+        self.saturation = (1 - saturation, 1 + saturation)
+        self.seed = seed
+        self.epoch = 0
+        self.generator = None
+        self.training = True
+
+    def train(self, mode=True):
+        self.training = mode
+        return self
+
+    def eval(self):
+        return self.train(False)
+
+    def set_epoch(self, epoch):
+        # Reseed per epoch so resumed runs see the same augmentations
+        self.epoch = epoch
+        self.generator = None
+
+    def _uniform(self, low, high, n, device):
+        if self.generator is None or self.generator.device != device:
+            self.generator = torch.Generator(device=device)
+            self.generator.manual_seed(self.seed + self.epoch)
+        return low + (high - low) * torch.rand(n, device=device, generator=self.generator)
+
+    def __call__(self, images, boxes):
+        """
+        Input: images (N, 3, H, W) float in [0, 1], boxes (N, M, 4) xyxy pixels
+               (padding rows are transformed too and stay padding).
+        Output: augmented images and boxes.
+        """
+        if not self.training:
+            return images, boxes
+        N, _, H, W = images.shape
+        device = images.device
+
+        # Random affine: pixel translation (rounded like RandomAffine) and scale about the center
+        tx = torch.round(self._uniform(-self.translate[0] * W, self.translate[0] * W, N, device))
+        ty = torch.round(self._uniform(-self.translate[1] * H, self.translate[1] * H, N, device))
+        s = self._uniform(self.scale[0], self.scale[1], N, device)
+
+        # affine_grid maps output to input coordinates, so use the inverse transform
+        theta = torch.zeros((N, 2, 3), dtype=images.dtype, device=device)
+        theta[:, 0, 0] = 1 / s
+        theta[:, 1, 1] = 1 / s
+        theta[:, 0, 2] = -2 * tx / (W * s)
+        theta[:, 1, 2] = -2 * ty / (H * s)
+        grid = F.affine_grid(theta, list(images.shape), align_corners=False)
+        images = F.grid_sample(images, grid, mode="nearest", padding_mode="zeros", align_corners=False)
+
+        center = torch.tensor([W / 2, H / 2, W / 2, H / 2], device=device)
+        shift = torch.stack([tx, ty, tx, ty], dim=-1).unsqueeze(1)
+        boxes = (boxes - center) * s.view(N, 1, 1) + center + shift
+        boxes = torch.minimum(boxes.clamp(min=0), torch.tensor([W, H, W, H], device=device))
+
+        # Colour jitter: brightness and saturation (against the grayscale image),
+        # in a random order per sample like v2.ColorJitter
+        brightness = self._uniform(*self.brightness, N, device).view(N, 1, 1, 1)
+        saturation = self._uniform(*self.saturation, N, device).view(N, 1, 1, 1)
+        brightness_first = self._uniform(0, 1, N, device).view(N, 1, 1, 1) < 0.5
+        images = torch.where(
+            brightness_first,
+            adjust_saturation(adjust_brightness(images, brightness), saturation),
+            adjust_brightness(adjust_saturation(images, saturation), brightness),
+        )
+
+        return images, boxes
+
+
+def adjust_brightness(images, factor):
+    return (images * factor).clamp(0, 1)
+
+
+def adjust_saturation(images, factor):
+    gray = 0.299 * images[:, 0:1] + 0.587 * images[:, 1:2] + 0.114 * images[:, 2:3]
+    return (images * factor + gray * (1 - factor)).clamp(0, 1)
@@ -0,0 +1,89 @@
+import time
+import argparse
+
+import torch
+from torch.utils.data import DataLoader
+from torch.utils.flop_counter import FlopCounterMode
+
+import config
+from models.heads import HEADS
+from models.loading import load_from_checkpoint
+from utils.yolov1_utils import evaluate_mAP
+
+# Compares the detection heads (models/heads.py) on the same backbone: parameters and
+# FLOPs of the head, CPU latency of the whole model, and val mAP for every head given
+# a trained checkpoint (n/a otherwise):
+# uv run benchmark_heads.py [--use-mamba] [--ckpt conv=checkpoints/resnet18_conv/yolov1.pth ...]
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--use-mamba', action='store_true', help='Use Mamba backbone instead of ResNet18')
+parser.add_argument('--ckpt', action='append', default=[], metavar='HEAD=PATH', help='Trained checkpoint for a head, repeatable')
+parser.add_argument('--batch-size', type=int, default=1, help='Batch size of the latency measurement')
+parser.add_argument('--iters', type=int, default=10)
+parser.add_argument('--threads', type=int, default=None, help='torch.set_num_threads for the latency measurement')
+
+
+def model_class(use_mamba):
+    if use_mamba:
+        from models.yolov1_mamba import YoloV1_Mamba
+        return YoloV1_Mamba
+    from models.yolov1_resnet18 import YoloV1_Resnet18
+    return YoloV1_Resnet18
+
+
+def count_flops(module, x):
+    counter = FlopCounterMode(display=False)
+    with counter, torch.inference_mode():
+        module(x)
+    return counter.get_total_flops()
+
+
+def cpu_latency(model, x, iters):
+    with torch.inference_mode():
+        model(x) # warmup
+        start = time.perf_counter()
+        for _ in range(iters):
+            model(x)
+    return (time.perf_counter() - start) / iters
+
+
+def val_mAP(model_cls, ckpt_path, head):
+    from data import VOCDataset
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model = load_from_checkpoint(model_cls, ckpt_path, device, S=config.S, B=config.B, C=config.C, head=head)
+    loader = DataLoader(VOCDataset("val"), batch_size=64, shuffle=False, drop_last=False)
+    return evaluate_mAP(loader, model, iou_threshold=0.5, threshold=0.4, boxformat="midpoints", device=device,
+                        num_classes=config.C, S=config.S, B=config.B).item()
+
+
+def main():
+    args = parser.parse_args()
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    ckpts = dict(c.split("=", 1) for c in args.ckpt)
+    unknown = set(ckpts) - set(HEADS)
+    if unknown:
+        parser.error(f"Unknown head(s) {sorted(unknown)}, expected one of {HEADS}")
+
+    model_cls = model_class(args.use_mamba)
+    x = torch.randn(args.batch_size, 3, *config.IMG_SIZE)
+
+    print(f"{'head':<10} {'head params':>12} {'head GFLOPs':>12} {'latency (ms)':>13} {'val mAP':>8}")
+    for head in HEADS:
+        model = model_cls(S=config.S, B=config.B, C=config.C, head=head, load_pretrained=False).eval()
+
+        # The head's input is whatever the backbone produces, capture it once
+        features = []
+        hook = model.yolov1head.register_forward_pre_hook(lambda m, inputs: features.append(inputs[0]))
+        latency = cpu_latency(model, x, args.iters)
+        hook.remove()
+
+        params = sum(p.numel() for p in model.yolov1head.parameters())
+        flops = count_flops(model.yolov1head, features[0][:1])
+        mAP = f"{val_mAP(model_cls, ckpts[head], head):.4f}" if head in ckpts else "n/a"
+        print(f"{head:<10} {params / 1e6:>11.1f}M {flops / 1e9:>12.2f} {latency * 1e3:>13.1f} {mAP:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import os
+import sys
+import time
+import resource
+import argparse
+import tempfile
+import subprocess
+
+# Measures time and peak RSS from process start to a model ready for inference, each in a fresh process:
+#   eager: pretrained backbone + random head init, then load_state_dict from the checkpoint
+#   lazy:  empty (meta) init, then assign memory-mapped checkpoint tensors
+#   export: same as lazy, from the weight-only safetensors export (export.py)
+# uv run benchmark_startup.py [--use-mamba] [--ckpt path] [--repeats 3]
+START = time.perf_counter()
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--use-mamba', action='store_true', help='Use Mamba backbone instead of ResNet18')
+parser.add_argument('--ckpt', default=None, help='Checkpoint to load, a throwaway one is written if missing')
+parser.add_argument('--repeats', type=int, default=3)
+parser.add_argument('--mode', choices=["eager", "lazy", "export"], default=None, help=argparse.SUPPRESS)
+parser.add_argument('--export', default=None, help=argparse.SUPPRESS)
+
+
+def model_class(use_mamba):
+    if use_mamba:
+        from models.yolov1_mamba import YoloV1_Mamba
+        return YoloV1_Mamba
+    from models.yolov1_resnet18 import YoloV1_Resnet18
+    return YoloV1_Resnet18
+
+
+def peak_rss_mb():
+    # VmHWM starts fresh at exec, unlike ru_maxrss which keeps the forking parent's peak
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1e3
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def run_child(args):
+    import torch
+    import config
+    from models.loading import load_from_checkpoint, load_exported
+
+    model_cls = model_class(args.use_mamba)
+    if args.mode == "eager":
+        model = model_cls(S=config.S, B=config.B, C=config.C, head=config.HEAD)
+        checkpoint = torch.load(args.ckpt)
+        model.load_state_dict(checkpoint["model_state_dict"])
+        model.eval()
+    elif args.mode == "lazy":
+        model = load_from_checkpoint(model_cls, args.ckpt, "cpu", S=config.S, B=config.B, C=config.C, head=config.HEAD)
+    else:
+        model = load_exported(args.export, "cpu")
+
+    ready = time.perf_counter() - START
+    peak_rss = peak_rss_mb()
+
+    with torch.inference_mode():
+        model(torch.zeros(1, 3, *config.IMG_SIZE))
+    print(f"STARTUP {ready:.3f} {time.perf_counter() - START:.3f} {peak_rss:.0f}")
+
+
+def main():
+    args = parser.parse_args()
+    if args.mode is not None:
+        run_child(args)
+        return
+
+    current_model = "mamba" if args.use_mamba else "resnet18"
+    ckpt_path = args.ckpt or f"checkpoints/{current_model}/yolov1.pth"
+    import torch
+    import config
+    from models.loading import export_weights
+
+    tmp_dir = tempfile.TemporaryDirectory()
+    if not os.path.exists(ckpt_path):
+        ckpt_path = os.path.join(tmp_dir.name, "yolov1.pth")
+        model = model_class(args.use_mamba)(S=config.S, B=config.B, C=config.C, head=config.HEAD, load_pretrained=False)
+        torch.save({"model_state_dict": model.state_dict()}, ckpt_path)
+        print(f"No checkpoint found, using a throwaway one at {ckpt_path}")
+    export_path = os.path.join(tmp_dir.name, "yolov1.safetensors")
+    state_dict = torch.load(ckpt_path, map_location="cpu", weights_only=True)["model_state_dict"]
+    export_weights(state_dict, export_path, {"backbone": current_model, "head": config.HEAD, "S": config.S, "B": config.B, "C": config.C})
+
+    for mode in ["eager", "lazy", "export"]:
+        ready, first, peak_rss = [], [], []
+        for _ in range(args.repeats):
+            cmd = [sys.executable, __file__, "--mode", mode, "--ckpt", ckpt_path, "--export", export_path]
+            if args.use_mamba:
+                cmd.append("--use-mamba")
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                print(f"{current_model} {mode}: failed\n{result.stderr[-2000:]}")
+                break
+            ready_s, first_s, rss = result.stdout.rsplit("STARTUP", 1)[1].split()
+            ready.append(float(ready_s))
+            first.append(float(first_s))
+            peak_rss.append(float(rss))
+        else:
+            print(f"{current_model} {mode}: model ready in {min(ready):.2f}s (peak RSS {max(peak_rss):.0f} MB), "
+                  f"first prediction after {min(first):.2f}s")
+
+    tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+# Copied as YOLOv2/build_cache.py: the projects are standalone and don't import each other, fix both.
+import argparse
+
+from data import build_voc_cache
+import config
+
+# Decode and resize VOC once so VOCDataset can read from a memory-mapped cache
+parser = argparse.ArgumentParser()
+parser.add_argument('--image-sets', nargs='+', default=["train", "val"], help='VOC splits to cache')
+parser.add_argument('--cache-dir', default=config.CACHE_PATH, help='Where to write the cache')
+args = parser.parse_args()
+
+for image_set in args.image_sets:
+    build_voc_cache(image_set, args.cache_dir)
+    print(f"Cached VOC {image_set} to {args.cache_dir}")
@@ -3,6 +3,7 @@ IMG_SIZE = (448, 448)
 S = 7
 B = 2
 C = 20
+HEAD = "dense" # Detection head: "dense", "conv" or "separable" (see models/heads.py)
 EPSILON = 1e-6
 
 VOC_CLASSES = [
@@ -13,4 +14,5 @@ VOC_CLASSES = [
 ]
 
 DATA_PATH="../data"
+CACHE_PATH="../data/cache"
 EVAL_INTERVAL = 10
\ No newline at end of file
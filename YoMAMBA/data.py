@@ -1,6 +1,8 @@
+import os
 import torch
 import numpy as np
-from torch.utils.data import Dataset
+from tqdm import tqdm
+from torch.utils.data import Dataset, get_worker_info
 from torchvision.transforms import v2
 from torchvision.datasets import VOCDetection
 from torchvision.tv_tensors import BoundingBoxes, Image
@@ -8,9 +10,221 @@ import torchvision
 
 import config
 
+def parse_annotation(info, classes):
+    """
+    Input: VOC annotation dict and class name to index mapping.
+    Output: boxes (M, 4) xyxy rescaled to IMG_SIZE and class ids (M,).
+    """
+    labels = info["annotation"]["object"]
+    orig_img_size = info["annotation"]["size"]
+    orig_img_w, orig_img_h = int(orig_img_size["width"]), int(orig_img_size["height"])
+
+    if not isinstance(labels, list):
+        labels = [labels]
+
+    boxes = []
+    class_ids = []
+
+    for label in labels:
+        box = label["bndbox"]
+        xmin = int(box["xmin"]) * config.IMG_SIZE[0] / orig_img_w
+        xmax = int(box["xmax"]) * config.IMG_SIZE[0] / orig_img_w
+        ymin = int(box["ymin"]) * config.IMG_SIZE[1] / orig_img_h
+        ymax = int(box["ymax"]) * config.IMG_SIZE[1] / orig_img_h
+        boxes.append([xmin, ymin, xmax, ymax])
+        class_ids.append(classes[label["name"]])
+
+    boxes = torch.tensor(boxes, dtype=torch.float32)
+    class_ids = torch.tensor(class_ids, dtype=torch.int64)
+    return boxes, class_ids
+
+
+def cache_prefix(image_set, cache_dir=config.CACHE_PATH, img_size=config.IMG_SIZE):
+    """Cache files are named by split and image size, so projects with another IMG_SIZE never share them."""
+    return os.path.join(cache_dir, f"{image_set}_{img_size[0]}x{img_size[1]}")
+
+
+def build_voc_cache(image_set="train", cache_dir=config.CACHE_PATH):
+    """
+    One time compile step. Decodes every VOC image once, resizes it to IMG_SIZE and
+    writes it to a uint8 (N, 3, H, W) memory-mapped array. Boxes and classes of all
+    images are packed into one (total_objects, 5) array of [xmin, ymin, xmax, ymax,
+    class], with an (N + 1,) offset index into it.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    dataset = VOCDetection(root=config.DATA_PATH, download=False, year="2012", image_set=image_set, transform=None)
+    classes = {cls: idx for idx, cls in enumerate(config.VOC_CLASSES)}
+    prefix = cache_prefix(image_set, cache_dir)
+
+    images = np.lib.format.open_memmap(
+        f"{prefix}_images.tmp.npy", mode="w+", dtype=np.uint8,
+        shape=(len(dataset), 3, config.IMG_SIZE[1], config.IMG_SIZE[0])
+    )
+    offsets = np.zeros(len(dataset) + 1, dtype=np.int64)
+    packed = []
+
+    for idx in tqdm(range(len(dataset)), desc=f"Caching VOC {image_set}"):
+        image, info = dataset[idx]
+        boxes, class_ids = parse_annotation(info, classes)
+        # Same resize the online transform does
+        images[idx] = v2.functional.resize(Image(image), [config.IMG_SIZE[1], config.IMG_SIZE[0]]).numpy()
+        packed.append(torch.cat([boxes, class_ids.unsqueeze(1).float()], dim=1).numpy())
+        offsets[idx + 1] = offsets[idx] + len(boxes)
+
+    images.flush()
+    del images
+    np.save(f"{prefix}_boxes.npy", np.concatenate(packed).astype(np.float32))
+    np.save(f"{prefix}_offsets.npy", offsets)
+    # Images last, so a partially written cache is never picked up
+    os.replace(f"{prefix}_images.tmp.npy", f"{prefix}_images.npy")
+
+
+class VOCCache:
+    """
+    Zero-copy reader for a cache written by build_voc_cache. The image file is
+    memory-mapped lazily, so every DataLoader worker maps it on first access
+    instead of pickling it.
+    """
+
+    def __init__(self, image_set, cache_dir=config.CACHE_PATH, img_size=config.IMG_SIZE):
+        self.prefix = cache_prefix(image_set, cache_dir, img_size)
+        self.boxes = np.load(f"{self.prefix}_boxes.npy")
+        self.offsets = np.load(f"{self.prefix}_offsets.npy")
+        self.images = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        if self.images is None:
+            # Copy-on-write map: writable for torch, never touches the file
+            self.images = np.load(f"{self.prefix}_images.npy", mmap_mode="c")
+
+        objects = self.boxes[self.offsets[idx]:self.offsets[idx + 1]]
+        image = torch.from_numpy(self.images[idx])
+        boxes = torch.from_numpy(objects[:, :4].copy())
+        class_ids = torch.from_numpy(objects[:, 4].astype(np.int64))
+        return image, boxes, class_ids
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["images"] = None
+        return state
+
+    @staticmethod
+    def exists(image_set, cache_dir=config.CACHE_PATH, img_size=config.IMG_SIZE):
+        return os.path.exists(f"{cache_prefix(image_set, cache_dir, img_size)}_images.npy")
+
+
+# Same encoder as YOLOv2/data.py (YOLOv1 uses layout="yolov1", YOLOv2 layout="yolov2"), fix both.
+def encode_targets(boxes, class_ids, S=config.S, B=config.B, C=config.C, layout="yolov1", img_size=config.IMG_SIZE):
+    """
+    Vectorized YOLO target encoder.
+    Input: boxes (M, 4) or (N, M, 4) xyxy in pixels of img_size, class ids (M,) or
+           (N, M). Rows with a negative class id are padding and ignored, so a whole
+           padded batch can be encoded at once on any device.
+           layout "yolov1": (S, S, C + 5B) of [classes, conf, x, y, w, h, ...], w/h
+           relative to a cell, first box only, a later object overrides an earlier
+           one in the same cell.
+           layout "yolov2": (S, S, B * (5 + C)) of [x, y, w, h, conf, classes] per
+           box, w/h relative to the image, objects fill the free boxes of their cell
+           in order and extra objects are dropped.
+    Output: targets (S, S, depth) or (N, S, S, depth).
+    """
+    batched = boxes.dim() == 3
+    if not batched:
+        boxes, class_ids = boxes.unsqueeze(0), class_ids.unsqueeze(0)
+    N, M, _ = boxes.shape
+    device = boxes.device
+    boxes = boxes.float()
+
+    xmin, ymin, xmax, ymax = boxes.unbind(-1)
+    valid = class_ids >= 0
+
+    # Find cell to insert into
+    x_center = (xmin + xmax) / 2.0
+    y_center = (ymin + ymax) / 2.0
+    x_cell_size = img_size[0] / S
+    y_cell_size = img_size[1] / S
+    x_cell = (x_center // x_cell_size).long().clamp(0, S - 1)
+    y_cell = (y_center // y_cell_size).long().clamp(0, S - 1)
+
+    # Find x,y,w,h
+    x = (x_center - x_cell * int(x_cell_size)) / x_cell_size
+    y = (y_center - y_cell * int(y_cell_size)) / y_cell_size
+    if layout == "yolov1":
+        w = (xmax - xmin) / x_cell_size
+        h = (ymax - ymin) / y_cell_size
+    elif layout == "yolov2":
+        w = (xmax - xmin) / img_size[0]
+        h = (ymax - ymin) / img_size[1]
+    else:
+        raise ValueError(f"Unknown target layout: {layout}")
+
+    # (N, M, M) objects sharing a cell, resolved in object order
+    cell = y_cell * S + x_cell
+    same_cell = (cell.unsqueeze(2) == cell.unsqueeze(1)) & valid.unsqueeze(2) & valid.unsqueeze(1)
+    order = torch.arange(M, device=device)
+    one_hot = torch.nn.functional.one_hot(class_ids.clamp(min=0), C).float()
+    conf = torch.ones_like(x)
+
+    if layout == "yolov1":
+        later = order.unsqueeze(0) > order.unsqueeze(1)
+        keep = valid & ~(same_cell & later).any(dim=-1)
+        n, m = keep.nonzero(as_tuple=True)
+        target = torch.zeros((N, S, S, C + 5 * B), dtype=torch.float32, device=device)
+        label_vector = torch.cat([one_hot, torch.stack([conf, x, y, w, h], dim=-1)], dim=-1)
+        target[n, y_cell[n, m], x_cell[n, m], :C + 5] = label_vector[n, m]
+    else:
+        earlier = order.unsqueeze(0) < order.unsqueeze(1)
+        slot = (same_cell & earlier).sum(dim=-1)
+        keep = valid & (slot < B)
+        n, m = keep.nonzero(as_tuple=True)
+        target = torch.zeros((N, S, S, B, 5 + C), dtype=torch.float32, device=device)
+        label_vector = torch.cat([torch.stack([x, y, w, h, conf], dim=-1), one_hot], dim=-1)
+        target[n, y_cell[n, m], x_cell[n, m], slot[n, m]] = label_vector[n, m]
+        target = target.view(N, S, S, B * (5 + C))
+
+    return target if batched else target[0]
+
+
+def batch_buffer(shape, dtype):
+    """
+    Empty batch tensor. In a loader worker it is allocated in shared memory,
+    so collating into it is the only copy: the main process receives the
+    buffer itself instead of a copy of the batch.
+    """
+    buffer = torch.empty(shape, dtype=dtype)
+    return buffer.share_memory_() if get_worker_info() is not None else buffer
+
+
+def stack_batch(tensors):
+    """torch.stack into a batch_buffer."""
+    out = batch_buffer((len(tensors), *tensors[0].shape), tensors[0].dtype)
+    return torch.stack(tensors, out=out)
+
+
+def collate_boxes(batch):
+    """
+    Collate for VOCDataset(encode=False). Stacks images and pads boxes
+    with class id -1 so encode_targets can run on the whole batch later.
+    Output: images (N, 3, H, W), boxes (N, M, 4), class ids (N, M).
+    """
+    images, boxes, class_ids = zip(*batch)
+    max_objects = max(len(b) for b in boxes)
+    padded_boxes = batch_buffer((len(batch), max_objects, 4), torch.float32).zero_()
+    padded_class_ids = batch_buffer((len(batch), max_objects), torch.int64).fill_(-1)
+    for i, (b, c) in enumerate(zip(boxes, class_ids)):
+        padded_boxes[i, :len(b)] = b
+        padded_class_ids[i, :len(c)] = c
+    return stack_batch(images), padded_boxes, padded_class_ids
+
+
 class VOCDataset(Dataset):
-    def __init__(self, image_set="train"):
-        self.is_train = image_set == "train"
+    def __init__(self, image_set="train", use_cache=True, encode=True, augment=True):
+        self.encode = encode
+        # augment=False leaves train augmentation to BatchAugment after collation
+        self.is_train = image_set == "train" and augment
 
         self.image_transform = v2.Compose([
             v2.ToImage(),
@@ -24,75 +238,34 @@ class VOCDataset(Dataset):
             v2.ToDtype(torch.float32, scale=True),
         ])
 
-        self.dataset = VOCDetection(root=config.DATA_PATH, download=False, year="2012", image_set=image_set, transform=None)
         self.classes = {cls: idx for idx, cls in enumerate(config.VOC_CLASSES)}
 
+        # Read from the preprocessed cache if it was built (see build_cache.py)
+        self.cache = VOCCache(image_set) if use_cache and VOCCache.exists(image_set) else None
+        if self.cache is None:
+            self.dataset = VOCDetection(root=config.DATA_PATH, download=False, year="2012", image_set=image_set, transform=None)
+
     def __len__(self):
+        if self.cache is not None:
+            return len(self.cache)
         return len(self.dataset)
 
     def __getitem__(self, idx):
-        image, info = self.dataset[idx]
-
-        labels = info["annotation"]["object"]
-        orig_img_size = info["annotation"]["size"]
-        orig_img_w, orig_img_h = int(orig_img_size["width"]), int(orig_img_size["height"])
-
-        if not isinstance(labels, list):
-            labels = [labels]
-
-        boxes = []
-        class_ids = []
-
-        for label in labels:
-            box = label["bndbox"]
-            xmin = int(box["xmin"]) * config.IMG_SIZE[0] / orig_img_w
-            xmax = int(box["xmax"]) * config.IMG_SIZE[0] / orig_img_w
-            ymin = int(box["ymin"]) * config.IMG_SIZE[1] / orig_img_h
-            ymax = int(box["ymax"]) * config.IMG_SIZE[1] / orig_img_h
-            boxes.append([xmin, ymin, xmax, ymax])
-            class_ids.append(self.classes[label["name"]])
-
-        boxes = torch.tensor(boxes, dtype=torch.float32)
-        class_ids = torch.tensor(class_ids, dtype=torch.int64)
+        if self.cache is not None:
+            image, boxes, class_ids = self.cache[idx]
+        else:
+            image, info = self.dataset[idx]
+            boxes, class_ids = parse_annotation(info, self.classes)
 
         image = Image(image)
         boxes = BoundingBoxes(boxes, format="XYXY", canvas_size=config.IMG_SIZE)
 
         image, boxes = self.image_transform(image, boxes)
+        boxes = boxes.as_subclass(torch.Tensor)
+
+        # Leave encoding to the batch (see collate_boxes) if asked to
+        if not self.encode:
+            return image, boxes, class_ids
 
-        depth = config.C + 5 * config.B
-        target = torch.zeros((config.S, config.S, depth), dtype=torch.float32)
-
-        for i in range(len(boxes)):
-            xmin, ymin, xmax, ymax = boxes[i]
-            class_idx = class_ids[i]
-
-            # Class Label
-            one_hot = torch.zeros(config.C)
-            one_hot[class_idx] = 1
-
-            # Find cell to insert into
-            x_center = (xmin + xmax) / 2.0
-            y_center = (ymin + ymax) / 2.0
-            x_cell_size = config.IMG_SIZE[0] / config.S
-            y_cell_size = config.IMG_SIZE[1] / config.S
-            x_cell = min(int(x_center // x_cell_size), config.S - 1)
-            y_cell = min(int(y_center // y_cell_size), config.S - 1)
-
-            # Find x,y,w,h
-            x_cell_tl = x_cell * int(x_cell_size)
-            y_cell_tl = y_cell * int(y_cell_size)
-            x = (x_center - x_cell_tl) / x_cell_size
-            y = (y_center - y_cell_tl) / y_cell_size
-            w = (xmax - xmin) / x_cell_size
-            h = (ymax - ymin) / y_cell_size
-
-            # Construct label
-            bbox = torch.tensor([1.0, x, y, w, h])
-            empty = torch.tensor([0, 0, 0, 0, 0])
-            label_vector = torch.concat([one_hot, bbox, empty])
-
-            # Note: This will override previously placed label
-            target[y_cell, x_cell] = label_vector
-           
+        target = encode_targets(boxes, class_ids, layout="yolov1")
         return image, target
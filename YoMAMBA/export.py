@@ -0,0 +1,45 @@
+import os
+import time
+import argparse
+
+import torch
+
+import config
+from models.loading import DTYPES, export_weights, checkpoint_model_config
+
+# Weight-only inference export of a training checkpoint:
+#   uv run export.py [--use-mamba] [--dtype fp16]
+# writes checkpoints/<model>/yolov1.safetensors + yolov1.json, which
+# test_image.py, test_video.py and serve.py load instead of yolov1.pth
+# as long as the export is newer than the checkpoint.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--use-mamba', action='store_true', help='Use Mamba backbone instead of ResNet18')
+parser.add_argument('--ckpt', default=None, help='Training checkpoint, defaults to checkpoints/<model>/yolov1.pth')
+parser.add_argument('--out', default=None, help='Output file, defaults to checkpoints/<model>/yolov1.safetensors')
+parser.add_argument('--dtype', choices=list(DTYPES), default="fp32", help='Stored dtype of floating point weights')
+
+
+def main():
+    args = parser.parse_args()
+    current_model = "mamba" if args.use_mamba else "resnet18"
+    ckpt_path = args.ckpt or f"checkpoints/{current_model}/yolov1.pth"
+    out_path = args.out or f"checkpoints/{current_model}/yolov1.safetensors"
+    if not os.path.exists(ckpt_path):
+        print("Checkpoint does not exist")
+        return 1
+
+    start = time.perf_counter()
+    checkpoint = torch.load(ckpt_path, map_location="cpu", mmap=True, weights_only=True)
+    # What the checkpoint was trained with, config.py only for checkpoints that don't record it
+    default = {"backbone": current_model, "head": config.HEAD, "S": config.S, "B": config.B, "C": config.C}
+    model_config = checkpoint_model_config(checkpoint, default)
+    export_weights(checkpoint["model_state_dict"], out_path, model_config, DTYPES[args.dtype])
+
+    print(f"Exported {ckpt_path} ({os.path.getsize(ckpt_path) / 1e6:.1f} MB) to "
+          f"{out_path} ({os.path.getsize(out_path) / 1e6:.1f} MB) in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
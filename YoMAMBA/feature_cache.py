@@ -0,0 +1,167 @@
+import os
+import json
+import hashlib
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import Dataset, DataLoader, Sampler
+from tqdm import tqdm
+
+
+class SeededDataset(Dataset):
+    """
+    Makes the random augmentations of a dataset a pure function of
+    (index, seed), so every cached variant can be rebuilt exactly.
+    """
+
+    def __init__(self, dataset, seed):
+        self.dataset = dataset
+        self.seed = seed
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, idx):
+        with torch.random.fork_rng(devices=[]):
+            torch.manual_seed(self.seed * len(self.dataset) + idx)
+            return self.dataset[idx]
+
+
+def feature_cache_key(model, variants, img_size, S, B, C):
+    """
+    Everything the cached features and targets depend on: the settings and a
+    hash of the frozen weights and BatchNorm statistics (model.frozen_state_dict).
+    The detection head isn't part of it, the features are taken before it.
+    """
+    digest = hashlib.sha256()
+    for name, tensor in sorted(model.frozen_state_dict().items()):
+        digest.update(name.encode())
+        digest.update(tensor.detach().cpu().contiguous().reshape(-1).view(torch.uint8).numpy().tobytes())
+    return {"variants": variants, "img_size": list(img_size), "S": S, "B": B, "C": C, "frozen": digest.hexdigest()}
+
+
+def build_feature_cache(model, dataset, cache_dir, variants=8, batch_size=64, device="cuda", num_workers=0, key=None):
+    """
+    Runs the frozen part of the model (model.forward_frozen) once for every
+    (image, augmentation seed) and stores the activations as a float16
+    (variants, N, C, H, W) memory-mapped array next to the matching targets.
+    BatchNorm in the frozen layers uses its running statistics (eval mode).
+    key (see feature_cache_key) is stored with it, a cache already in
+    cache_dir is replaced.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    # Gone until the rebuild is complete, so the stale cache can't be picked up with the new key
+    if FeatureCacheDataset.exists(cache_dir):
+        os.remove(os.path.join(cache_dir, "features.npy"))
+    model.eval()
+    features, targets = None, None
+
+    for variant in range(variants):
+        loader = DataLoader(SeededDataset(dataset, variant), batch_size=batch_size, shuffle=False, num_workers=num_workers)
+        start = 0
+        for x, y in tqdm(loader, desc=f"Caching features {variant + 1}/{variants}"):
+            with torch.no_grad():
+                f = model.forward_frozen(x.to(device))
+
+            # Allocate once the feature shape is known
+            if features is None:
+                features = np.lib.format.open_memmap(
+                    os.path.join(cache_dir, "features.tmp.npy"), mode="w+", dtype=np.float16,
+                    shape=(variants, len(dataset), *f.shape[1:])
+                )
+                targets = np.lib.format.open_memmap(
+                    os.path.join(cache_dir, "targets.npy"), mode="w+", dtype=np.float32,
+                    shape=(variants, len(dataset), *y.shape[1:])
+                )
+
+            features[variant, start:start + len(x)] = f.half().cpu().numpy()
+            targets[variant, start:start + len(x)] = y.numpy()
+            start += len(x)
+
+    features.flush()
+    targets.flush()
+    del features, targets
+    with open(os.path.join(cache_dir, "meta.json"), "w") as f:
+        json.dump({"variants": variants, "images": len(dataset), "key": key}, f)
+    # Features last, so a partially written cache is never picked up
+    os.replace(os.path.join(cache_dir, "features.tmp.npy"), os.path.join(cache_dir, "features.npy"))
+
+
+class FeatureCacheDataset(Dataset):
+    """
+    Reads (features, target) pairs written by build_feature_cache. Item
+    variant * N + i is augmentation variant `variant` of image i; use
+    VariantSampler to draw one variant per epoch.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        with open(os.path.join(cache_dir, "meta.json")) as f:
+            meta = json.load(f)
+        self.variants, self.images = meta["variants"], meta["images"]
+        self.features, self.targets = None, None
+
+    def __len__(self):
+        return self.variants * self.images
+
+    def __getitem__(self, idx):
+        if self.features is None:
+            self.features = np.load(os.path.join(self.cache_dir, "features.npy"), mmap_mode="r")
+            self.targets = np.load(os.path.join(self.cache_dir, "targets.npy"), mmap_mode="r")
+
+        variant, image = divmod(idx, self.images)
+        features = torch.from_numpy(np.array(self.features[variant, image])).float()
+        target = torch.from_numpy(np.array(self.targets[variant, image]))
+        return features, target
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["features"], state["targets"] = None, None
+        return state
+
+    @staticmethod
+    def exists(cache_dir, key=None):
+        """True if cache_dir holds a complete cache, built with key if one is given."""
+        if not os.path.exists(os.path.join(cache_dir, "features.npy")):
+            return False
+        if key is None:
+            return True
+        with open(os.path.join(cache_dir, "meta.json")) as f:
+            return json.load(f).get("key") == key
+
+
+class VariantSampler(Sampler):
+    """Yields every image once per epoch, all from augmentation variant epoch % variants."""
+
+    def __init__(self, dataset, shuffle=True, seed=0):
+        self.dataset = dataset
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return self.dataset.images
+
+    def __iter__(self):
+        offset = (self.epoch % self.dataset.variants) * self.dataset.images
+        if self.shuffle:
+            generator = torch.Generator()
+            generator.manual_seed(self.seed + self.epoch)
+            order = torch.randperm(self.dataset.images, generator=generator)
+        else:
+            order = torch.arange(self.dataset.images)
+        return iter((order + offset).tolist())
+
+
+class TrainableHead(nn.Module):
+    """Runs only model.forward_trainable, for training on cached features."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model.forward_trainable(x)
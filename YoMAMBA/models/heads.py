@@ -0,0 +1,52 @@
+import torch.nn as nn
+
+from utils.recompute import CheckpointedSequential
+
+# Detection heads for the YOLOv1 models, selected with the head argument:
+#   "dense":     4 3x3 convs, then Linear(1024*S*S, 4096) -> Linear(4096, S*S*(C+5B)) as in the paper
+#   "conv":      same convs, then a 1x1 conv to C+5B channels per cell (no fully connected layers)
+#   "separable": like "conv" with depthwise-separable 3x3 convs
+# Every head is a CheckpointedSequential, so its activations can be recomputed
+# in backward instead of stored (train.py --checkpoint-segments).
+HEADS = ("dense", "conv", "separable")
+
+
+class CellsToVector(nn.Module):
+    """(N, C+5B, S, S) conv output -> (N, S*S*(C+5B)), the same layout as the dense head."""
+
+    def forward(self, x):
+        return x.permute(0, 2, 3, 1).flatten(1)
+
+
+def conv_block(in_channels, out_channels, stride=1, separable=False):
+    if separable:
+        return [
+            nn.Conv2d(in_channels, in_channels, kernel_size=3, stride=stride, padding=1, groups=in_channels),
+            nn.BatchNorm2d(in_channels),
+            nn.LeakyReLU(0.1),
+            nn.Conv2d(in_channels, out_channels, kernel_size=1),
+            nn.BatchNorm2d(out_channels),
+            nn.LeakyReLU(0.1),
+        ]
+    return [
+        nn.Conv2d(in_channels, out_channels, kernel_size=3, stride=stride, padding=1),
+        nn.BatchNorm2d(out_channels),
+        nn.LeakyReLU(0.1),
+    ]
+
+
+def conv_head(in_channels, S, B, C, stride, separable=False):
+    """
+    Fully convolutional head: the 4 conv blocks of the dense head (the second
+    one downsamples by stride to SxS) and a 1x1 conv predicting every cell.
+    """
+    layers = []
+    layers += conv_block(in_channels, 1024, separable=separable)
+    layers += conv_block(1024, 1024, stride=stride, separable=separable)
+    layers += conv_block(1024, 1024, separable=separable)
+    layers += conv_block(1024, 1024, separable=separable)
+    layers += [
+        nn.Conv2d(1024, C + B * 5, kernel_size=1),
+        CellsToVector(),
+    ]
+    return CheckpointedSequential(*layers)
@@ -0,0 +1,164 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+
+import torch
+import torch.nn as nn
+from safetensors import safe_open
+from safetensors.torch import save_file, load_file
+
+DTYPES = {"fp32": torch.float32, "fp16": torch.float16, "bf16": torch.bfloat16}
+
+
+@contextmanager
+def empty_init():
+    """
+    Parameters registered inside this context are moved to the meta device
+    right away, so constructing a model allocates no weight memory and the
+    default initializers run on meta tensors (free). Buffers stay real since
+    some are computed in __init__ and never saved.
+    """
+    register_parameter = nn.Module.register_parameter
+
+    def register_meta_parameter(module, name, param):
+        register_parameter(module, name, param)
+        if param is not None:
+            param = module._parameters[name]
+            module._parameters[name] = type(param)(param.to("meta"), requires_grad=param.requires_grad)
+
+    nn.Module.register_parameter = register_meta_parameter
+    try:
+        yield
+    finally:
+        nn.Module.register_parameter = register_parameter
+
+
+def load_from_checkpoint(model_cls, ckpt_path, device, **kwargs):
+    """
+    Builds model_cls(**kwargs, load_pretrained=False) without allocating or
+    initializing weights, then assigns the checkpoint tensors directly
+    (memory-mapped, no extra copy) instead of copying into fresh parameters.
+    Output: model in eval mode on device.
+    """
+    start = time.perf_counter()
+    with empty_init():
+        model = model_cls(**kwargs, load_pretrained=False)
+
+    checkpoint = torch.load(ckpt_path, map_location="cpu", mmap=True, weights_only=True)
+    model = _assign_weights(model, checkpoint["model_state_dict"], ckpt_path, device)
+    print(f"Loaded {ckpt_path} in {time.perf_counter() - start:.2f}s")
+    return model
+
+
+def _assign_weights(model, state_dict, path, device):
+    model.load_state_dict(state_dict, assign=True)
+
+    still_empty = [name for name, p in model.named_parameters() if p.is_meta]
+    if still_empty:
+        raise RuntimeError(f"{path} has no weights for: {', '.join(still_empty)}")
+
+    return model.to(device).eval()
+
+
+def _model_class(backbone):
+    # Imported on demand so ResNet models don't need transformers
+    if backbone == "mamba":
+        from models.yolov1_mamba import YoloV1_Mamba
+        return YoloV1_Mamba
+    if backbone == "resnet18":
+        from models.yolov1_resnet18 import YoloV1_Resnet18
+        return YoloV1_Resnet18
+    raise ValueError(f"Unknown backbone: {backbone}")
+
+
+def export_weights(state_dict, path, model_config, dtype=None):
+    """
+    Writes only the model weights as safetensors, floating point tensors cast
+    to dtype when given. model_config (backbone, head, S, B, C) is stored in the
+    file header and next to it as <path>.json.
+    """
+    tensors = {
+        name: (t.to(dtype) if dtype is not None and t.is_floating_point() else t).contiguous()
+        for name, t in state_dict.items()
+    }
+    model_config = dict(model_config, dtype=str(next(t.dtype for t in tensors.values() if t.is_floating_point())))
+    save_file(tensors, path, metadata={"config": json.dumps(model_config)})
+    with open(os.path.splitext(path)[0] + ".json", "w") as f:
+        json.dump(model_config, f, indent=2)
+
+
+def load_exported(path, device, dtype=torch.float32):
+    """
+    Loads a file written by export_weights. The tensors are memory-mapped, so
+    only a dtype cast (e.g. fp16 export to fp32 here) copies them.
+    Output: model in eval mode on device.
+    """
+    start = time.perf_counter()
+    with safe_open(path, framework="pt") as f:
+        model_config = json.loads(f.metadata()["config"])
+
+    state_dict = load_file(path)
+    if dtype is not None:
+        state_dict = {name: t.to(dtype) if t.is_floating_point() else t for name, t in state_dict.items()}
+
+    with empty_init():
+        model = _model_class(model_config["backbone"])(
+            S=model_config["S"], B=model_config["B"], C=model_config["C"], head=model_config.get("head", "dense"),
+            load_pretrained=False
+        )
+    model = _assign_weights(model, state_dict, path, device)
+    print(f"Loaded {path} in {time.perf_counter() - start:.2f}s")
+    return model
+
+
+def checkpoint_model_config(checkpoint, default):
+    """
+    The model_config (backbone, head, S, B, C) a training checkpoint was
+    trained with. Checkpoints from before train.py stored it get default
+    (config.py) instead. Either way it is checked against the weights.
+    """
+    model_config = checkpoint.get("model_config")
+    if model_config is None:
+        print("Checkpoint has no model_config, assuming the current config.py")
+        model_config = default
+    _check_head_shapes(checkpoint["model_state_dict"], model_config)
+    return model_config
+
+
+def _check_head_shapes(state_dict, model_config):
+    # Weights in head order: Linear (2D) and conv (4D), BatchNorm (1D) skipped
+    weights = [t for name, t in state_dict.items()
+               if name.startswith("yolov1head.") and name.endswith(".weight") and t.dim() in (2, 4)]
+    if any(t.dim() == 2 for t in weights):
+        head = "dense"
+    elif any(t.dim() == 4 and t.shape[1] == 1 and t.shape[0] > 1 for t in weights):
+        head = "separable" # depthwise convs
+    else:
+        head = "conv"
+
+    S, B, C = model_config["S"], model_config["B"], model_config["C"]
+    depth = weights[-1].shape[0] // (S * S if head == "dense" else 1)
+    linears = [t for t in weights if t.dim() == 2]
+    # The Mamba dense head always downsamples to 7x7 before its first Linear, the ResNet18 one to SxS
+    cells = 7 * 7 if model_config["backbone"] == "mamba" else S * S
+    if head != model_config["head"] or depth != C + 5 * B or (linears and linears[0].shape[1] != 1024 * cells):
+        raise ValueError(f"Checkpoint weights ({head} head) don't match model_config {model_config}")
+
+
+def load_for_inference(model_cls, ckpt_dir, device, **kwargs):
+    """
+    Loads the newer of yolov1.safetensors (see export.py) and the yolov1.pth
+    training checkpoint from ckpt_dir, so an export older than the
+    checkpoint (training went on after it) is not used.
+    Output: model in eval mode, None if neither file exists.
+    """
+    export_path = os.path.join(ckpt_dir, "yolov1.safetensors")
+    ckpt_path = os.path.join(ckpt_dir, "yolov1.pth")
+    if os.path.exists(export_path):
+        if not os.path.exists(ckpt_path) or os.path.getmtime(export_path) >= os.path.getmtime(ckpt_path):
+            return load_exported(export_path, device)
+        print(f"{export_path} is older than {ckpt_path}, loading the checkpoint (re-run export.py to update it)")
+    if os.path.exists(ckpt_path):
+        return load_from_checkpoint(model_cls, ckpt_path, device, **kwargs)
+    return None
@@ -0,0 +1,70 @@
+import json
+import copy
+import time
+import itertools
+
+import torch
+import torch.nn as nn
+from torch.ao.quantization import get_default_qconfig_mapping, default_dynamic_qconfig, quantize_dynamic
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+# Post-training int8 quantization for CPU inference (see quantize.py):
+#   CNN backbones: static int8 through FX graph mode. Conv+BN(+ReLU) are fused,
+#     conv weights are quantized per channel, activation ranges come from
+#     calibration images. The head's Linear layers are quantized dynamically
+#     (int8 weights, activation scale computed per batch), since their inputs
+#     vary too much for one calibrated range.
+#   Mamba: its backbone can't be FX traced, so only Linear layers are
+#     quantized (dynamic int8) and the rest stays fp32.
+# The result is saved as TorchScript, so loading it needs no model code.
+
+ENGINE = "x86"
+
+
+def quantize_int8(model, calibration_batches, backbone):
+    """
+    Input: fp32 model, iterable of (N, 3, H, W) calibration images, backbone name.
+    Output: quantized copy of model (CPU, eval mode), model itself is left untouched.
+    """
+    torch.backends.quantized.engine = ENGINE
+    model = copy.deepcopy(model).cpu().eval()
+
+    if backbone == "mamba":
+        return quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+    # The backbone is stored under a different name per model, and forward() slices
+    # it (resnet18), which FX can't trace. Backbone then head is the same computation.
+    layers = nn.Sequential(model.resnet18backbone if backbone == "resnet18" else model.backbone, model.yolov1head)
+
+    qconfig_mapping = get_default_qconfig_mapping(ENGINE).set_object_type(nn.Linear, default_dynamic_qconfig)
+    batches = iter(calibration_batches)
+    first = next(batches)
+    prepared = prepare_fx(layers, qconfig_mapping, (first[:1],))
+
+    start = time.perf_counter()
+    n_images = 0
+    with torch.no_grad():
+        for images in itertools.chain([first], batches):
+            prepared(images)
+            n_images += len(images)
+    print(f"Calibrated on {n_images} images in {time.perf_counter() - start:.1f}s")
+
+    return convert_fx(prepared).eval()
+
+
+def save_quantized(model, path, model_config, img_size=(448, 448)):
+    """Traces model to TorchScript and saves it with model_config (backbone, head, S, B, C) embedded."""
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(model, torch.zeros(1, 3, *img_size)))
+    torch.jit.save(traced, path, _extra_files={"config.json": json.dumps(dict(model_config, dtype="int8"))})
+
+
+def load_quantized(path):
+    """
+    Loads a file written by save_quantized.
+    Output: (model, model_config), model runs on CPU only.
+    """
+    torch.backends.quantized.engine = ENGINE
+    extra_files = {"config.json": ""}
+    model = torch.jit.load(path, map_location="cpu", _extra_files=extra_files)
+    return model, json.loads(extra_files["config.json"])
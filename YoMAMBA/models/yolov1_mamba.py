@@ -1,22 +1,35 @@
-import ssl
-import urllib.request
-
-# Override SSL context globally for downloads
-ssl._create_default_https_context = ssl._create_unverified_context
-
 import torch
 import torch.nn as nn
 import torchvision.models as models
 
-from transformers import AutoModel
+from models.heads import HEADS, conv_head
+from utils.recompute import CheckpointedSequential
+
+from transformers import AutoConfig, AutoModel
+
+MAMBAVISION = "nvidia/MambaVision-T-1K"
+
+
+def build_mambavision(load_pretrained=True):
+    if load_pretrained:
+        return AutoModel.from_pretrained(MAMBAVISION, trust_remote_code=True)
+
+    # Architecture only, weights come from a checkpoint. Prefer the local hub
+    # cache so startup needs no network round trip.
+    try:
+        config = AutoConfig.from_pretrained(MAMBAVISION, trust_remote_code=True, local_files_only=True)
+    except OSError:
+        config = AutoConfig.from_pretrained(MAMBAVISION, trust_remote_code=True)
+    return AutoModel.from_config(config, trust_remote_code=True)
 
 
 class YoloV1_Mamba(nn.Module):
-    def __init__(self, S = 7, B = 2, C = 20):
+    def __init__(self, S = 7, B = 2, C = 20, load_pretrained = True, head = "dense"):
         super(YoloV1_Mamba, self).__init__()
 
-        print("Using pretrained mambavision, last layer unfrozen")
-        mambavision = AutoModel.from_pretrained("nvidia/MambaVision-T-1K", trust_remote_code=True)
+        if load_pretrained:
+            print("Using pretrained mambavision, last layer unfrozen")
+        mambavision = build_mambavision(load_pretrained)
         for param in mambavision.parameters():
             param.requires_grad = False
         # Unfreeze the last feature extraction layer
@@ -30,36 +43,63 @@ class YoloV1_Mamba(nn.Module):
         #         print(name)
         
 
-        self.yolov1head = nn.Sequential(
-            nn.Conv2d(640, 1024, kernel_size=3, stride=1, padding=1),
-            nn.BatchNorm2d(1024),
-            nn.LeakyReLU(0.1),
-            nn.Conv2d(1024, 1024, kernel_size=3, stride=2, padding=1),  # 14x14 → 7x7
-            nn.BatchNorm2d(1024),
-            nn.LeakyReLU(0.1),
+        if head not in HEADS:
+            raise ValueError(f"Unknown head: {head}, expected one of {HEADS}")
+        if 14 % S != 0:
+            # The head downsamples the 14x14 backbone features by stride 14 // S
+            raise ValueError(f"S must divide 14 (the 14x14 backbone feature map), got S={S}")
+        if head == "dense":
+            self.yolov1head = CheckpointedSequential(
+                nn.Conv2d(640, 1024, kernel_size=3, stride=1, padding=1),
+                nn.BatchNorm2d(1024),
+                nn.LeakyReLU(0.1),
+                nn.Conv2d(1024, 1024, kernel_size=3, stride=2, padding=1),  # 14x14 → 7x7
+                nn.BatchNorm2d(1024),
+                nn.LeakyReLU(0.1),
 
-            nn.Conv2d(1024, 1024, kernel_size=3, stride=1, padding=1),
-            nn.BatchNorm2d(1024),
-            nn.LeakyReLU(0.1),
-            nn.Conv2d(1024, 1024, kernel_size=3, stride=1, padding=1),
-            nn.BatchNorm2d(1024),
-            nn.LeakyReLU(0.1),
+                nn.Conv2d(1024, 1024, kernel_size=3, stride=1, padding=1),
+                nn.BatchNorm2d(1024),
+                nn.LeakyReLU(0.1),
+                nn.Conv2d(1024, 1024, kernel_size=3, stride=1, padding=1),
+                nn.BatchNorm2d(1024),
+                nn.LeakyReLU(0.1),
 
-            nn.Flatten(),
-            nn.Linear(1024 * 7 * 7, 4096),
-            nn.Dropout(0.5),
-            nn.LeakyReLU(0.1),
-            nn.Linear(4096, S * S * (C + B * 5)),
-        )
+                nn.Flatten(),
+                nn.Linear(1024 * 7 * 7, 4096),
+                nn.Dropout(0.5),
+                nn.LeakyReLU(0.1),
+                nn.Linear(4096, S * S * (C + B * 5)),
+            )
+        else:
+            self.yolov1head = conv_head(640, S, B, C, stride=14 // S, separable=head == "separable")
 
 
-        self.random_weight_init()
+        # Skipped when a full checkpoint will be loaded over the weights anyway
+        if load_pretrained:
+            self.random_weight_init()
 
     def forward(self, x):
         out_avg_pool, features = self.backbone(x) # MAMBA supports any input resolution LOL!!! YAY
         x = features[3] # torch.Size([N, 640, 14, 14])
         x = self.yolov1head(x)
         return x
+
+    def forward_frozen(self, x):
+        # Whole backbone, cacheable once the last block is frozen too (see freeze_backbone)
+        out_avg_pool, features = self.backbone(x)
+        return features[3]
+
+    def forward_trainable(self, x):
+        return self.yolov1head(x)
+
+    def freeze_backbone(self):
+        # Head-only training from cached features[3] can't update the last block
+        for param in self.backbone.parameters():
+            param.requires_grad = False
+
+    def frozen_state_dict(self):
+        # Everything forward_frozen depends on, fingerprints the feature cache
+        return self.backbone.state_dict()
     
     def random_weight_init(self):
         for i in range(len(self.yolov1head)):
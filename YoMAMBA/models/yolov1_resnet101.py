@@ -8,9 +8,12 @@ import torch
 import torch.nn as nn
 import torchvision.models as models
 
+from models.heads import HEADS, conv_head
+from utils.recompute import CheckpointedSequential
+
 
 class YoloV1_Resnet101(nn.Module):
-    def __init__(self, S = 7, B = 2, C = 20):
+    def __init__(self, S = 7, B = 2, C = 20, head = "dense"):
         super(YoloV1_Resnet101, self).__init__()
 
         print("Using pretrained resnet101. Weights all frozen")
@@ -24,46 +27,69 @@ class YoloV1_Resnet101(nn.Module):
 
         self.backbone = nn.Sequential(*list(resnet.children())[:-2])
 
-        self.yolov1head = nn.Sequential (
-            # Block 5 (last two conv layers)
-            nn.Conv2d(in_channels = 2048, out_channels = 1024, 
-                      kernel_size = (3, 3), stride = 1,
-                      padding = 1),
-            nn.BatchNorm2d(1024),
-            nn.LeakyReLU(0.1),
-            nn.Conv2d(in_channels = 1024, out_channels = 1024, 
-                      kernel_size = (3, 3), stride = 2,
-                      padding = 1),
-            nn.BatchNorm2d(1024),
-            nn.LeakyReLU(0.1),
+        if head not in HEADS:
+            raise ValueError(f"Unknown head: {head}, expected one of {HEADS}")
+        if 14 % S != 0:
+            # The head downsamples the 14x14 backbone features by stride 14 // S
+            raise ValueError(f"S must divide 14 (the 14x14 backbone feature map), got S={S}")
+        if head == "dense":
+            self.yolov1head = CheckpointedSequential(
+                # Block 5 (last two conv layers)
+                nn.Conv2d(in_channels = 2048, out_channels = 1024, 
+                          kernel_size = (3, 3), stride = 1,
+                          padding = 1),
+                nn.BatchNorm2d(1024),
+                nn.LeakyReLU(0.1),
+                nn.Conv2d(in_channels = 1024, out_channels = 1024, 
+                          kernel_size = (3, 3), stride = 14 // S, # 14x14 -> SxS
+                          padding = 1),
+                nn.BatchNorm2d(1024),
+                nn.LeakyReLU(0.1),
            
-            # Block 6
-            nn.Conv2d(in_channels = 1024, out_channels = 1024, 
-                      kernel_size = (3, 3), stride = 1,
-                      padding = 1),
-            nn.BatchNorm2d(1024),
-            nn.LeakyReLU(0.1),
-            nn.Conv2d(in_channels = 1024, out_channels = 1024, 
-                      kernel_size = (3, 3), stride = 1,
-                      padding = 1),
-            nn.BatchNorm2d(1024),
-            nn.LeakyReLU(0.1),
+                # Block 6
+                nn.Conv2d(in_channels = 1024, out_channels = 1024, 
+                          kernel_size = (3, 3), stride = 1,
+                          padding = 1),
+                nn.BatchNorm2d(1024),
+                nn.LeakyReLU(0.1),
+                nn.Conv2d(in_channels = 1024, out_channels = 1024, 
+                          kernel_size = (3, 3), stride = 1,
+                          padding = 1),
+                nn.BatchNorm2d(1024),
+                nn.LeakyReLU(0.1),
 
-            # prediction block
-            nn.Flatten(),
-            nn.Linear(in_features = 1024 * S * S, out_features = 4096),
-            nn.Dropout(0.5),
-            nn.LeakyReLU(0.1),
-            nn.Linear(in_features = 4096, out_features = S * S * (C + B * 5)),
-            # reshape in loss to be (S, S, 30) with C + B * 5 = 30
-            )
+                # prediction block
+                nn.Flatten(),
+                nn.Linear(in_features = 1024 * S * S, out_features = 4096),
+                nn.Dropout(0.5),
+                nn.LeakyReLU(0.1),
+                nn.Linear(in_features = 4096, out_features = S * S * (C + B * 5)),
+                # reshape in loss to be (S, S, 30) with C + B * 5 = 30
+                )
+        else:
+            self.yolov1head = conv_head(2048, S, B, C, stride=14 // S, separable=head == "separable")
 
         self.random_weight_init()
 
     def forward(self, x):
-        x = self.backbone(x) # (N, 512, 14, 14)
-        x = self.yolov1head(x)
+        x = self.forward_frozen(x)
+        x = self.forward_trainable(x)
         return x
+
+    def forward_frozen(self, x):
+        # Whole backbone, it is never trained
+        return self.backbone(x) # (N, 2048, 14, 14)
+
+    def forward_trainable(self, x):
+        return self.yolov1head(x)
+
+    def freeze_backbone(self):
+        # Already frozen in __init__
+        pass
+
+    def frozen_state_dict(self):
+        # Everything forward_frozen depends on, fingerprints the feature cache
+        return self.backbone.state_dict()
     
     def random_weight_init(self):
         for i in range(len(self.yolov1head)):
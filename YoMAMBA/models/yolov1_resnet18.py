@@ -1,21 +1,19 @@
-import ssl
-import urllib.request
-
-# Override SSL context globally for downloads
-ssl._create_default_https_context = ssl._create_unverified_context
-
 import torch
 import torch.nn as nn
 
 import torchvision.models as models
 
+from models.heads import HEADS, conv_head
+from utils.recompute import CheckpointedSequential
+
 
 class YoloV1_Resnet18(nn.Module):
-    def __init__(self, S = 7, B = 2, C = 20):
+    def __init__(self, S = 7, B = 2, C = 20, load_pretrained = True, head = "dense"):
         super(YoloV1_Resnet18, self).__init__()
 
-        print("Using pretrained resnet18, layer4 unfrozen.")
-        resnet = models.resnet18(weights=models.ResNet18_Weights.IMAGENET1K_V1)
+        if load_pretrained:
+            print("Using pretrained resnet18, layer4 unfrozen.")
+        resnet = models.resnet18(weights=models.ResNet18_Weights.IMAGENET1K_V1 if load_pretrained else None)
         # Freeze all layers
         for param in resnet.parameters():
             param.requires_grad = False
@@ -25,48 +23,75 @@ class YoloV1_Resnet18(nn.Module):
 
         self.resnet18backbone = nn.Sequential(*list(resnet.children())[:-2])
 
-        self.yolov1head = nn.Sequential (
-            # Block 5 (last two conv layers)
-            # Since the last ResNet 18 layer consists of a (3x3, 512) conv layer
-            # we adjust the input size of the yolo head from 1024 to 512.
-            nn.Conv2d(in_channels = 512, out_channels = 1024, 
-                      kernel_size = (3, 3), stride = 1,
-                      padding = 1),
-            nn.BatchNorm2d(1024),
-            nn.LeakyReLU(0.1),
-            nn.Conv2d(in_channels = 1024, out_channels = 1024, 
-                      kernel_size = (3, 3), stride = 2,
-                      padding = 1),
-            nn.BatchNorm2d(1024),
-            nn.LeakyReLU(0.1),
+        if head not in HEADS:
+            raise ValueError(f"Unknown head: {head}, expected one of {HEADS}")
+        if 14 % S != 0:
+            # The head downsamples the 14x14 backbone features by stride 14 // S
+            raise ValueError(f"S must divide 14 (the 14x14 backbone feature map), got S={S}")
+        if head == "dense":
+            self.yolov1head = CheckpointedSequential(
+                # Block 5 (last two conv layers)
+                # Since the last ResNet 18 layer consists of a (3x3, 512) conv layer
+                # we adjust the input size of the yolo head from 1024 to 512.
+                nn.Conv2d(in_channels = 512, out_channels = 1024, 
+                          kernel_size = (3, 3), stride = 1,
+                          padding = 1),
+                nn.BatchNorm2d(1024),
+                nn.LeakyReLU(0.1),
+                nn.Conv2d(in_channels = 1024, out_channels = 1024, 
+                          kernel_size = (3, 3), stride = 14 // S, # 14x14 -> SxS
+                          padding = 1),
+                nn.BatchNorm2d(1024),
+                nn.LeakyReLU(0.1),
            
-            # Block 6
-            nn.Conv2d(in_channels = 1024, out_channels = 1024, 
-                      kernel_size = (3, 3), stride = 1,
-                      padding = 1),
-            nn.BatchNorm2d(1024),
-            nn.LeakyReLU(0.1),
-            nn.Conv2d(in_channels = 1024, out_channels = 1024, 
-                      kernel_size = (3, 3), stride = 1,
-                      padding = 1),
-            nn.BatchNorm2d(1024),
-            nn.LeakyReLU(0.1),
+                # Block 6
+                nn.Conv2d(in_channels = 1024, out_channels = 1024, 
+                          kernel_size = (3, 3), stride = 1,
+                          padding = 1),
+                nn.BatchNorm2d(1024),
+                nn.LeakyReLU(0.1),
+                nn.Conv2d(in_channels = 1024, out_channels = 1024, 
+                          kernel_size = (3, 3), stride = 1,
+                          padding = 1),
+                nn.BatchNorm2d(1024),
+                nn.LeakyReLU(0.1),
 
-            # prediction block
-            nn.Flatten(),
-            nn.Linear(in_features = 1024 * S * S, out_features = 4096),
-            nn.Dropout(0.5),
-            nn.LeakyReLU(0.1),
-            nn.Linear(in_features = 4096, out_features = S * S * (C + B * 5)),
-            # reshape in loss to be (S, S, 30) with C + B * 5 = 30
-            )
+                # prediction block
+                nn.Flatten(),
+                nn.Linear(in_features = 1024 * S * S, out_features = 4096),
+                nn.Dropout(0.5),
+                nn.LeakyReLU(0.1),
+                nn.Linear(in_features = 4096, out_features = S * S * (C + B * 5)),
+                # reshape in loss to be (S, S, 30) with C + B * 5 = 30
+                )
+        else:
+            self.yolov1head = conv_head(512, S, B, C, stride=14 // S, separable=head == "separable")
 
-        self.random_weight_init()
+        # Skipped when a full checkpoint will be loaded over the weights anyway
+        if load_pretrained:
+            self.random_weight_init()
 
     def forward(self, x):
-        x = self.resnet18backbone(x) # (N, 512, 14, 14)
+        x = self.forward_frozen(x)
+        x = self.forward_trainable(x)
+        return x
+
+    def forward_frozen(self, x):
+        # Frozen stem + layer1..layer3, cacheable for head-only training
+        return self.resnet18backbone[:-1](x) # (N, 256, 28, 28)
+
+    def forward_trainable(self, x):
+        x = self.resnet18backbone[-1](x) # layer4: (N, 512, 14, 14)
         x = self.yolov1head(x)
         return x
+
+    def freeze_backbone(self):
+        # Nothing beyond layer3 is ever cached, so layer4 stays trainable
+        pass
+
+    def frozen_state_dict(self):
+        # Everything forward_frozen depends on, fingerprints the feature cache
+        return self.resnet18backbone[:-1].state_dict()
     
     def random_weight_init(self):
         for i in range(len(self.yolov1head)):
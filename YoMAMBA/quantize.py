@@ -0,0 +1,105 @@
+import os
+import time
+import argparse
+
+import torch
+from torch.utils.data import DataLoader, Subset
+
+import config
+from models.loading import load_from_checkpoint
+from models.quantization import quantize_int8, save_quantized, load_quantized
+from utils.yolov1_utils import evaluate_mAP
+
+# Post-training int8 quantization for CPU inference:
+#   uv run quantize.py [--use-mamba] [--calibration-images 256] [--eval-images 512]
+# calibrates on the first VOC val images, writes checkpoints/<model>/yolov1_int8.pt
+# (TorchScript, see models/quantization.py) and compares it to fp32 on the next
+# val images (mAP) and on random input (latency, throughput).
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--use-mamba', action='store_true', help='Use Mamba backbone instead of ResNet18')
+parser.add_argument('--ckpt', default=None, help='Training checkpoint, defaults to checkpoints/<model>/yolov1.pth')
+parser.add_argument('--out', default=None, help='Output file, defaults to checkpoints/<model>/yolov1_int8.pt')
+parser.add_argument('--calibration-images', type=int, default=256)
+parser.add_argument('--eval-images', type=int, default=512, help='Val images for the mAP comparison, 0 to skip it')
+parser.add_argument('--batch-size', type=int, default=16, help='Batch size of the throughput measurement')
+parser.add_argument('--iters', type=int, default=10)
+parser.add_argument('--threads', type=int, default=None, help='torch.set_num_threads for the measurements')
+
+
+def model_class(use_mamba):
+    if use_mamba:
+        from models.yolov1_mamba import YoloV1_Mamba
+        return YoloV1_Mamba
+    from models.yolov1_resnet18 import YoloV1_Resnet18
+    return YoloV1_Resnet18
+
+
+def time_forward(model, batch_size, iters):
+    x = torch.randn(batch_size, 3, *config.IMG_SIZE)
+    with torch.inference_mode():
+        model(x) # warmup
+        start = time.perf_counter()
+        for _ in range(iters):
+            model(x)
+    return (time.perf_counter() - start) / iters
+
+
+def val_mAP(model, dataset):
+    loader = DataLoader(dataset, batch_size=32, shuffle=False)
+    return evaluate_mAP(loader, model, iou_threshold=0.5, threshold=0.4, boxformat="midpoints", device="cpu",
+                        num_classes=config.C, S=config.S, B=config.B).item()
+
+
+def main():
+    from data import VOCDataset
+
+    args = parser.parse_args()
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    current_model = "mamba" if args.use_mamba else "resnet18"
+    ckpt_path = args.ckpt or f"checkpoints/{current_model}/yolov1.pth"
+    out_path = args.out or f"checkpoints/{current_model}/yolov1_int8.pt"
+    if not os.path.exists(ckpt_path):
+        print("Checkpoint does not exist")
+        return 1
+
+    model = load_from_checkpoint(model_class(args.use_mamba), ckpt_path, "cpu", S=config.S, B=config.B, C=config.C, head=config.HEAD)
+
+    val_ds = VOCDataset("val")
+    n_calibration = min(len(val_ds), args.calibration_images)
+    calibration_ds = Subset(val_ds, range(n_calibration))
+    calibration_batches = (images for images, _ in DataLoader(calibration_ds, batch_size=32, shuffle=False))
+
+    quantized = quantize_int8(model, calibration_batches, current_model)
+    model_config = {"backbone": current_model, "head": config.HEAD, "S": config.S, "B": config.B, "C": config.C}
+    save_quantized(quantized, out_path, model_config, config.IMG_SIZE)
+    print(f"Saved {out_path} ({os.path.getsize(out_path) / 1e6:.1f} MB, fp32 checkpoint {os.path.getsize(ckpt_path) / 1e6:.1f} MB)")
+
+    # Measure the saved artifact, not the in-memory model
+    quantized, _ = load_quantized(out_path)
+
+    results = {}
+    for name, m in [("fp32", model), ("int8", quantized)]:
+        latency = time_forward(m, 1, args.iters)
+        throughput = args.batch_size / time_forward(m, args.batch_size, max(1, args.iters // 2))
+        results[name] = (latency, throughput)
+
+    eval_ds = Subset(val_ds, range(n_calibration, min(len(val_ds), n_calibration + args.eval_images)))
+    evaluate = len(eval_ds) > 0
+    if evaluate:
+        for name, m in [("fp32", model), ("int8", quantized)]:
+            results[name] += (val_mAP(m, eval_ds),)
+
+    print(f"{'':<5} {'latency (ms)':>13} {'images/s':>9} {'val mAP':>8}")
+    for name, (latency, throughput, *mAP) in results.items():
+        mAP = f"{mAP[0]:.4f}" if mAP else "n/a"
+        print(f"{name:<5} {latency * 1e3:>13.1f} {throughput:>9.1f} {mAP:>8}")
+    if evaluate:
+        print(f"mAP delta {results['int8'][2] - results['fp32'][2]:+.4f} on {len(eval_ds)} val images, "
+              f"speedup {results['fp32'][0] / results['int8'][0]:.2f}x at batch 1")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import socket
+import argparse
+import threading
+import socketserver
+import http.client
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+import torch
+
+import config
+from utils.batched_inference import BatchedDetector
+
+# Long-running detection service:
+#   uv run serve.py [--use-mamba] [--port 8000 | --unix /tmp/yomamba.sock]
+#   curl --data-binary @images/sample.png localhost:8000/detect
+# Load generator against a running server:
+#   uv run serve.py --load-test --concurrency 16 --requests 1000
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--use-mamba', action='store_true', help='Use Mamba backbone instead of ResNet18')
+parser.add_argument('--host', default='127.0.0.1')
+parser.add_argument('--port', type=int, default=8000)
+parser.add_argument('--unix', default=None, help='Serve on (or load test) this Unix socket instead of TCP')
+parser.add_argument('--device', default="cuda" if torch.cuda.is_available() else "cpu")
+parser.add_argument('--max-batch-size', type=int, default=16, help='Max images per inference batch')
+parser.add_argument('--int8', action='store_true', help='Serve the CPU int8 model written by quantize.py')
+parser.add_argument('--max-wait-ms', type=float, default=5, help='Max time a request waits for its batch to fill')
+parser.add_argument('--load-test', action='store_true', help='Run the load generator against a running server')
+parser.add_argument('--concurrency', type=int, default=16, help='Load test client threads')
+parser.add_argument('--requests', type=int, default=500, help='Load test requests in total')
+parser.add_argument('--image', default='images/sample.png', help='Load test image')
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def make_handler(detector):
+    class DetectHandler(BaseHTTPRequestHandler):
+        # Keep-alive so clients don't reconnect per image
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if self.path == "/health":
+                self.send_json(200, {"status": "ok"})
+            else:
+                self.send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/detect":
+                self.send_json(404, {"error": "not found"})
+                return
+            start = time.perf_counter()
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            frame = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                self.send_json(400, {"error": "could not decode image"})
+                return
+
+            frame = cv2.resize(frame, (detector.img_size, detector.img_size))
+            boxes = detector.submit(frame).result()
+            detections = [
+                {
+                    "class": config.VOC_CLASSES[int(box[0])],
+                    "class_id": int(box[0]),
+                    "score": box[1],
+                    "box": box[2:], # x, y, w, h midpoints relative to the image
+                }
+                for box in boxes
+            ]
+            self.send_json(200, {"detections": detections, "latency_ms": (time.perf_counter() - start) * 1000})
+
+        def send_json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def address_string(self):
+            # Unix socket peers have no address
+            return self.client_address[0] if self.client_address else "unix"
+
+        def log_message(self, format, *args):
+            pass
+
+    return DetectHandler
+
+
+def load_model(use_mamba, device, int8=False):
+    # Imported here so the load generator doesn't need the model dependencies
+    from models.quantization import load_quantized
+
+    current_model = "mamba" if use_mamba else "resnet18"
+    if int8:
+        int8_path = f"checkpoints/{current_model}/yolov1_int8.pt"
+        if device != "cpu":
+            print("The int8 model runs on CPU only, use --device cpu")
+            exit(1)
+        if not os.path.exists(int8_path):
+            print(f"{int8_path} does not exist, run quantize.py first")
+            exit(1)
+        model, model_config = load_quantized(int8_path)
+        if (model_config["S"], model_config["B"], model_config["C"]) != (config.S, config.B, config.C):
+            print(f"{int8_path} was quantized for a different S, B, C than config.py")
+            exit(1)
+        print(f"Using {current_model} int8")
+        return model
+
+    from models.yolov1_resnet18 import YoloV1_Resnet18
+    from models.yolov1_mamba import YoloV1_Mamba
+    from models.loading import load_for_inference
+
+    model_cls = YoloV1_Mamba if use_mamba else YoloV1_Resnet18
+
+    model = load_for_inference(model_cls, f"checkpoints/{current_model}", device, S=config.S, B=config.B, C=config.C, head=config.HEAD)
+    if model is None:
+        print("Checkpoint does not exist")
+        exit(1)
+    print(f"Using {current_model}")
+    return model
+
+
+def serve(args):
+    model = load_model(args.use_mamba, args.device, args.int8)
+    detector = BatchedDetector(model, args.device, max_batch_size=args.max_batch_size, max_wait=args.max_wait_ms / 1000,
+                               S=config.S, B=config.B, C=config.C)
+    detector.warmup()
+
+    handler = make_handler(detector)
+    if args.unix:
+        if os.path.exists(args.unix):
+            os.remove(args.unix)
+        server = UnixHTTPServer(args.unix, handler)
+        print(f"Serving on unix:{args.unix}")
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), handler)
+        server.daemon_threads = True
+        print(f"Serving on http://{args.host}:{args.port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        detector.close()
+
+
+def load_test(args):
+    """Sends args.requests images from args.concurrency keep-alive clients and reports latency percentiles."""
+    frame = cv2.imread(args.image) if os.path.exists(args.image) else None
+    if frame is None:
+        frame = np.random.randint(0, 256, (448, 448, 3), dtype=np.uint8)
+    # Clients are expected to send network-sized JPEGs
+    body = cv2.imencode(".jpg", cv2.resize(frame, (448, 448)))[1].tobytes()
+
+    latencies = []
+    failures = {} # error message -> count
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+
+    def connect():
+        return UnixHTTPConnection(args.unix) if args.unix else http.client.HTTPConnection(args.host, args.port)
+
+    def client():
+        conn = connect()
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    break
+            start = time.perf_counter()
+            try:
+                conn.request("POST", "/detect", body=body, headers={"Content-Type": "application/octet-stream"})
+                response = conn.getresponse()
+                response.read()
+                error = None if response.status == 200 else f"HTTP {response.status}"
+            except (OSError, http.client.HTTPException) as e:
+                error = f"{type(e).__name__}: {e}"
+                conn.close()
+                conn = connect() # the connection state is unknown after an error
+            with lock:
+                if error is None:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    failures[error] = failures.get(error, 0) + 1
+        conn.close()
+
+    threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    print(f"{len(latencies)} requests succeeded, {sum(failures.values())} failed, concurrency {args.concurrency}")
+    for error, count in failures.items():
+        print(f"  {count} x {error}")
+    if len(latencies) == 0:
+        print("No request succeeded, no throughput or latency to report")
+        return 1
+    print(f"Throughput: {len(latencies) / wall:.1f} img/s")
+    print(f"Latency p50: {np.percentile(latencies, 50):.1f} ms | p99: {np.percentile(latencies, 99):.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.load_test:
+        exit(load_test(args))
+    else:
+        serve(args)
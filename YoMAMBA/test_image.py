@@ -6,7 +6,9 @@ import torchvision.transforms as T
 from utils.yolov1_utils import non_max_suppression, cellboxes_to_boxes, draw_bounding_box
 from models.yolov1_resnet18 import YoloV1_Resnet18
 from models.yolov1_mamba import YoloV1_Mamba
+from models.loading import load_for_inference
 import argparse
+import config
 
 transform = T.Compose([T.ToTensor()])
 device = "cuda" if torch.cuda.is_available() else "cpu"
@@ -22,25 +24,22 @@ use_resnet18_backbone = not use_mamba_backbone
 
 if use_mamba_backbone:
     current_model = "mamba"
-    model = YoloV1_Mamba(S=7, B=2, C=20).to(device)
+    model_cls = YoloV1_Mamba
     print("Using Mamba")
 elif use_resnet18_backbone:
     current_model = "resnet18"
-    model = YoloV1_Resnet18(S=7, B=2, C=20).to(device)
+    model_cls = YoloV1_Resnet18
     print("Specifiy whether to use mamba with --use-mamba flag")
     print("Using ResNet18")
 else:
     print("No backbone was specified")
     exit(1)
 
-# Load model
-ckpt_path = f"checkpoints/{current_model}/yolov1.pth"
-if not os.path.exists(ckpt_path):
+# Load model, architecture only, the checkpoint provides every weight
+model = load_for_inference(model_cls, f"checkpoints/{current_model}", device, S=config.S, B=config.B, C=config.C, head=config.HEAD)
+if model is None:
     print("Checkpoint does not exist")
     exit(1)
-checkpoint = torch.load(ckpt_path)
-model.load_state_dict(checkpoint["model_state_dict"])
-model.eval()
 
 # Load and process image
 image_path = 'images/sample.png'
@@ -51,7 +50,7 @@ input_image = transform(frame).unsqueeze(0).to(device)
 # Run detection
 with torch.no_grad():
     preds = model(input_image)
-    get_bboxes = cellboxes_to_boxes(preds)
+    get_bboxes = cellboxes_to_boxes(preds, config.S, config.B, config.C)
     bboxes = non_max_suppression(get_bboxes[0], iou_threshold=0.5, threshold=0.4, boxformat="midpoints")
 
 # Draw and save
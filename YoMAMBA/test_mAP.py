@@ -2,20 +2,21 @@ import os
 import torch
 import time
 from tqdm import tqdm
-from torch.utils.data import DataLoader
 from models.yolov1_resnet18 import YoloV1_Resnet18
 from models.yolov1_mamba import YoloV1_Mamba
 
-from utils.yolov1_utils import get_bboxes, mean_average_precision as mAP
+from utils.yolov1_utils import evaluate_mAP
+from utils.loader import make_loader, split_workers, LoaderTimer
 from data import VOCDataset
 import argparse
+import config
 
 
 device = "cuda"
 batch_size = 64
 weight_decay = 5e-4
 epochs = 140
-nworkers = 14 # Supposedly faster: https://chtalhaanwar.medium.com/pytorch-num-workers-a-tip-for-speedy-training-ed127d825db7
+nworkers = None # DataLoader workers shared by both loaders, None for one per available core (see utils/loader.py)
 save_last_model = True
 save_checkpoints = True
 checkpoint_interval = 10
@@ -36,10 +37,10 @@ def main():
     # Select model
     if use_mamba_backbone:
         current_model = "mamba"
-        model = YoloV1_Mamba(S=7, B=2, C=20).to(device)
+        model = YoloV1_Mamba(S=config.S, B=config.B, C=config.C, head=config.HEAD).to(device)
     elif use_resnet18_backbone:
         current_model = "resnet18"
-        model = YoloV1_Resnet18(S=7, B=2, C=20).to(device)
+        model = YoloV1_Resnet18(S=config.S, B=config.B, C=config.C, head=config.HEAD).to(device)
     else:
         print("No backbone was specified")
         return 1
@@ -47,31 +48,24 @@ def main():
     ckpt_path = f"{ckpt_dir}/resnet18_adj_lr_yolov1.cpt"
 
     if os.path.exists(ckpt_path):
-        checkpoint = torch.load(ckpt_path)
+        checkpoint = torch.load(ckpt_path, map_location=device)
         model.load_state_dict(checkpoint["model_state_dict"])
         last_epoch = checkpoint["epoch"]
         print(f"Checkpoint from epoch:{last_epoch + 1} successfully loaded.")
         
     # Dataset
-    def collate_fn(batch):
-        images, targets = zip(*batch)
-        images = torch.stack(images)
-        targets = torch.stack(targets)
-        return images, targets
-
     train_ds = VOCDataset("train")
     val_ds = VOCDataset("val")
-    train_loader = DataLoader(train_ds, batch_size=batch_size, shuffle=True, collate_fn=collate_fn, drop_last=True)
-    val_loader = DataLoader(val_ds, batch_size=batch_size, shuffle=False, collate_fn=collate_fn, drop_last=True)
+    train_workers, val_workers = split_workers(1, nworkers)
+    train_loader = LoaderTimer(make_loader(train_ds, batch_size, shuffle=True, drop_last=True, num_workers=train_workers))
+    val_loader = LoaderTimer(make_loader(val_ds, batch_size, drop_last=True, num_workers=val_workers))
     
     if mAP_train:
-        pred_bbox, target_bbox = get_bboxes(train_loader, model, iou_threshold = 0.5, threshold = 0.4)
-        train_mAP_val = mAP(pred_bbox, target_bbox, iou_threshold = 0.5, boxformat="midpoints")
-        print(f"Train {train_mAP_val}")
+        train_mAP_val = evaluate_mAP(train_loader, model, iou_threshold = 0.5, threshold = 0.4, boxformat="midpoints", num_classes=config.C, S=config.S, B=config.B)
+        print(f"Train {train_mAP_val} ({train_loader.summary()})")
     if mAP_val:
-        val_pred_bbox, val_target_bbox = get_bboxes(val_loader, model, iou_threshold = 0.5, threshold = 0.4)
-        val_mAP_val = mAP(val_pred_bbox, val_target_bbox, iou_threshold = 0.5, boxformat="midpoints")
-        print(f"Val {val_mAP_val}")
+        val_mAP_val = evaluate_mAP(val_loader, model, iou_threshold = 0.5, threshold = 0.4, boxformat="midpoints", num_classes=config.C, S=config.S, B=config.B)
+        print(f"Val {val_mAP_val} ({val_loader.summary()})")
             
     
             
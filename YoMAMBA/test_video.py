@@ -9,9 +9,12 @@ import torchvision.transforms as T
 import torchvision.transforms.functional as TF
 from models.yolov1_resnet18 import YoloV1_Resnet18
 from models.yolov1_mamba import YoloV1_Mamba
+from models.loading import load_for_inference
 import matplotlib.pyplot as plt
 from utils.yolov1_utils import draw_bounding_box
+from utils.video_pipeline import VideoPipeline
 import argparse
+import config
 from tqdm import tqdm
 
 transform = T.Compose([T.ToTensor()])
@@ -20,6 +23,9 @@ device = "cuda" if torch.cuda.is_available() else "cpu"
 # Select model
 parser = argparse.ArgumentParser()
 parser.add_argument('--use-mamba', action='store_true', help='Use Mamba backbone instead of ResNet18')
+parser.add_argument('--batch-size', type=int, default=8, help='Max frames per inference batch')
+parser.add_argument('--max-latency', type=float, default=0.05, help='Max seconds a frame waits for its batch to fill')
+parser.add_argument('--queue-size', type=int, default=64, help='Frames buffered between pipeline stages')
 args = parser.parse_args()
 
 # Model selection logic
@@ -29,67 +35,47 @@ use_resnet18_backbone = not use_mamba_backbone
 
 if use_mamba_backbone:
     current_model = "mamba"
-    model = YoloV1_Mamba(S=7, B=2, C=20).to(device)
+    model_cls = YoloV1_Mamba
     print("Using Mamba")
 elif use_resnet18_backbone:
     current_model = "resnet18"
-    model = YoloV1_Resnet18(S=7, B=2, C=20).to(device)
+    model_cls = YoloV1_Resnet18
     print("Specifiy whether to use mamba with --use-mamba flag")
     print("Using ResNet18")
 else:
     print("No backbone was specified")
     exit(1)
 
-# Load model
-ckpt_path = f"checkpoints/{current_model}/yolov1.pth"
-if not os.path.exists(ckpt_path):
+# Load model, architecture only, the checkpoint provides every weight
+model = load_for_inference(model_cls, f"checkpoints/{current_model}", device, S=config.S, B=config.B, C=config.C, head=config.HEAD)
+if model is None:
     print("Checkpoint does not exist")
     exit(1)
-checkpoint = torch.load(ckpt_path)
-model.load_state_dict(checkpoint["model_state_dict"])
-model.eval()
 
 # video captioning
 video_path = 'video/sample_video.mp4'
+output_path = 'video/yolo_output.webm'
 cap = cv2.VideoCapture(video_path)
 
-fps = 0
-fps_start = 0
-prev = 0 
-video_rec = cv2.VideoWriter(f'video/yolo_output.webm', 
+video_rec = cv2.VideoWriter(output_path,
                          cv2.VideoWriter_fourcc(*'VP80'),  # VP80 is the WebM-compatible codec
                          30, (448, 448))
 
 def can_use_imshow():
     return os.environ.get('DISPLAY') is not None or os.name == 'nt'
 
+# Decode, inference and encode overlap; frames are batched for the model
+pipeline = VideoPipeline(model, device, batch_size=args.batch_size, max_latency=args.max_latency,
+                         queue_size=args.queue_size, iou_threshold=0.5, threshold=0.4,
+                         S=config.S, B=config.B, C=config.C)
+
 total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
 with tqdm(total=total_frames, desc="Processing video") as pbar:
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frame = np.array(frame)
-        frame = cv2.resize(frame, (448, 448))
-        input_frame = cv2.resize(frame, (448, 448))
-        fps_end = time.time() 
-        time_diff = fps_end - fps_start
-        fps = int(1 / (time_diff - prev)) if time_diff - prev > 0 else 0
-        prev = fps_end
-        height, width = frame.shape[:2]
-        fps_txt = "FPS: {}".format(fps)
-        frame = cv2.putText(frame, fps_txt, (width - 90, 20), cv2.FONT_HERSHEY_TRIPLEX, 0.5, (255, 255, 255), 1)
-
-        input_frame = transform(input_frame).unsqueeze(0).to(device)
-        preds = model(input_frame)
-        get_bboxes = cellboxes_to_boxes(preds)
-        bboxes = non_max_suppression(get_bboxes[0], iou_threshold=0.5, threshold=0.4, boxformat="midpoints")
-        frame = draw_bounding_box(frame, bboxes, test=True)
-
-        video_rec.write(frame)
-        pbar.update(1)
+    stats = pipeline.run(cap, video_rec, progress=pbar)
 
 video_rec.release()
 cap.release()
 cv2.destroyAllWindows()
-print(f"Video processed in real time and saved to video/yolo_output.mp4")
+print(f"Processed {stats['frames']} frames at {stats['end_to_end_fps']:.1f} FPS end to end")
+print(f"Sustained FPS per stage: read {stats['read_fps']:.1f}, infer {stats['infer_fps']:.1f}, write {stats['write_fps']:.1f}")
+print(f"Video saved to {output_path}")
@@ -0,0 +1,53 @@
+import torch
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import utils.amp
+from utils.amp import MixedPrecision, GradientAccumulator, tune_micro_batch
+
+
+def grads_after(batches, batch_size, accum_steps):
+    torch.manual_seed(0)
+    model = torch.nn.Linear(4, 3)
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.0) # lr 0 keeps the weights, grads are kept below
+    accumulator = GradientAccumulator(optimizer, MixedPrecision("fp32", "cpu"), batch_size, accum_steps)
+
+    grads = []
+    optimizer.step = lambda: grads.append(model.weight.grad.clone())
+    for x, y in batches:
+        loss = torch.nn.functional.mse_loss(model(x), y) * 3 # per sample mean, like the YOLO losses
+        accumulator.backward(loss, x.shape[0])
+    accumulator.flush()
+    return grads, accumulator.optimizer_steps
+
+
+def test_accumulated_gradient_matches_full_batch():
+    x, y = torch.randn(8, 4), torch.randn(8, 3)
+    full, _ = grads_after([(x, y)], batch_size=8, accum_steps=1)
+    micro, steps = grads_after([(x[i:i + 2], y[i:i + 2]) for i in range(0, 8, 2)], batch_size=8, accum_steps=4)
+    assert steps == 1
+    assert torch.allclose(micro[0], full[0], atol=1e-6)
+
+
+def test_partial_group_is_rescaled():
+    # 10 samples with 8 per step: the trailing 2 samples step on their own, as a batch of 2
+    x, y = torch.randn(10, 4), torch.randn(10, 3)
+    micro, steps = grads_after([(x[i:i + 2], y[i:i + 2]) for i in range(0, 10, 2)], batch_size=8, accum_steps=4)
+    tail, _ = grads_after([(x[8:], y[8:])], batch_size=2, accum_steps=1)
+    assert steps == 2
+    assert torch.allclose(micro[1], tail[0], atol=1e-6)
+
+
+def test_tune_micro_batch_picks_fastest_that_fits(monkeypatch):
+    # ms per step by micro-batch: 8 has the most samples/s, 32 runs out of memory
+    step_ms = {1: 1.0, 2: 1.5, 4: 2.0, 8: 3.0, 16: 8.0}
+
+    def fake_step_time(model, loss_fn, x, y, *args, **kwargs):
+        if x.shape[0] not in step_ms:
+            raise torch.cuda.OutOfMemoryError("CUDA out of memory")
+        return step_ms[x.shape[0]] / 1000
+
+    monkeypatch.setattr(utils.amp, "benchmark_step_time", fake_step_time)
+    x, y = torch.zeros(2, 4), torch.zeros(2, 3)
+    assert tune_micro_batch(torch.nn.Linear(4, 3), None, x, y, batch_size=32) == (8, 4)
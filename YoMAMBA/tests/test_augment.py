@@ -0,0 +1,35 @@
+import sys
+import os
+
+import torch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from augment import BatchAugment
+
+
+def box_image(boxes, H=64, W=64):
+    """One image per box, white inside the (integer xyxy) box and black elsewhere."""
+    images = torch.zeros(len(boxes), 3, H, W)
+    for image, (x1, y1, x2, y2) in zip(images, boxes.long().tolist()):
+        image[:, y1:y2, x1:x2] = 1
+    return images
+
+
+def test_boxes_follow_the_affine_transform():
+    boxes = torch.tensor([[16., 16., 40., 32.], [8., 20., 30., 50.], [24., 10., 44., 30.], [20., 20., 36., 36.]])
+    augment = BatchAugment(brightness=0, saturation=0) # geometry only
+    augmented, moved = augment(box_image(boxes), boxes.unsqueeze(1))
+
+    for image, box in zip(augmented, moved[:, 0]):
+        ys, xs = torch.nonzero(image[0] > 0.5, as_tuple=True)
+        found = torch.stack([xs.min(), ys.min(), xs.max() + 1, ys.max() + 1]).float()
+        # Nearest sampling, so the drawn box edges are within a pixel of the transformed box
+        assert torch.allclose(found, box, atol=1.5), (found, box)
+
+
+def test_eval_is_identity():
+    images = torch.rand(2, 3, 32, 32)
+    boxes = torch.tensor([[[1., 2., 10., 12.]], [[5., 5., 20., 30.]]])
+    out_images, out_boxes = BatchAugment().eval()(images, boxes)
+    assert torch.equal(out_images, images)
+    assert torch.equal(out_boxes, boxes)
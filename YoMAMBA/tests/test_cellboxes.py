@@ -0,0 +1,26 @@
+import torch
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.yolov1_utils import convert_cellboxes, cellboxes_to_boxes
+
+
+def test_convert_cellboxes_picks_most_confident_box():
+    S, B, C = 14, 3, 20
+    preds = torch.zeros(1, S, S, C + B * 5)
+    preds[0, 2, 5, 3] = 1.0 # class 3
+    preds[0, 2, 5, C + 10:C + 15] = torch.tensor([0.9, 0.5, 0.5, 0.2, 0.4]) # third box wins
+    preds[0, 2, 5, C:C + 5] = torch.tensor([0.3, 0.1, 0.1, 0.1, 0.1])
+
+    converted = convert_cellboxes(preds.flatten(1), S, B, C)
+    assert converted.shape == (1, S, S, 6)
+    expected = torch.tensor([3, 0.9, (5 + 0.5) / S, (2 + 0.5) / S, 0.2 / S, 0.4 / S])
+    assert torch.allclose(converted[0, 2, 5], expected)
+
+
+def test_cellboxes_to_boxes_lists():
+    preds = torch.randn(2, 7 * 7 * 30)
+    boxes = cellboxes_to_boxes(preds)
+    assert len(boxes) == 2 and len(boxes[0]) == 49
+    assert boxes[1][10] == convert_cellboxes(preds)[1].reshape(49, 6)[10].tolist()
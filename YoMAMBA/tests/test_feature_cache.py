@@ -0,0 +1,41 @@
+import sys
+import os
+
+import torch
+import torch.nn as nn
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from feature_cache import build_feature_cache, feature_cache_key, FeatureCacheDataset
+
+
+class TinyModel(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.backbone = nn.Sequential(nn.Conv2d(3, 4, kernel_size=3, padding=1), nn.BatchNorm2d(4))
+
+    def forward_frozen(self, x):
+        return self.backbone(x)
+
+    def frozen_state_dict(self):
+        return self.backbone.state_dict()
+
+
+def test_cache_is_rebuilt_when_key_changes(tmp_path):
+    torch.manual_seed(0)
+    model = TinyModel()
+    dataset = [(torch.randn(3, 8, 8), torch.randn(7, 7, 30)) for _ in range(4)]
+    key = feature_cache_key(model, 2, (8, 8), 7, 2, 20)
+
+    assert not FeatureCacheDataset.exists(tmp_path, key)
+    build_feature_cache(model, dataset, tmp_path, variants=2, batch_size=2, device="cpu", key=key)
+    assert FeatureCacheDataset.exists(tmp_path, key)
+    assert len(FeatureCacheDataset(tmp_path)) == 8
+
+    # Other grid settings or changed frozen weights/statistics invalidate it
+    assert not FeatureCacheDataset.exists(tmp_path, feature_cache_key(model, 2, (8, 8), 5, 2, 20))
+    model.backbone[1].running_mean += 1
+    new_key = feature_cache_key(model, 2, (8, 8), 7, 2, 20)
+    assert not FeatureCacheDataset.exists(tmp_path, new_key)
+
+    build_feature_cache(model, dataset, tmp_path, variants=2, batch_size=2, device="cpu", key=new_key)
+    assert FeatureCacheDataset.exists(tmp_path, new_key)
@@ -0,0 +1,27 @@
+import torch
+import pytest
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from models.heads import conv_head
+from models.yolov1_resnet18 import YoloV1_Resnet18
+
+
+def test_conv_head_cell_layout():
+    # Output i*S*D + j*D + k must be channel k of cell (i, j), the layout the dense head and the loss use
+    S, B, C = 7, 2, 20
+    head = conv_head(64, S, B, C, stride=2, separable=True).eval()
+    x = torch.randn(2, 64, 2 * S, 2 * S)
+    with torch.no_grad():
+        maps = head[:-1](x)
+        out = head(x)
+
+    assert maps.shape == (2, C + B * 5, S, S)
+    assert out.shape == (2, S * S * (C + B * 5))
+    assert torch.equal(out.view(2, S, S, C + B * 5), maps.permute(0, 2, 3, 1))
+
+
+def test_grid_must_divide_feature_map():
+    with pytest.raises(ValueError, match="S must divide 14"):
+        YoloV1_Resnet18(S=5, load_pretrained=False)
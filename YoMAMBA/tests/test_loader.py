@@ -0,0 +1,18 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.loader import split_workers, EVAL_WORKERS
+
+
+def test_split_workers_stays_within_budget():
+    for total in range(0, 33):
+        train_workers, eval_workers = split_workers(2, total)
+        assert train_workers + 2 * eval_workers == total
+        assert 0 <= eval_workers <= EVAL_WORKERS
+        assert train_workers >= eval_workers
+
+
+def test_split_workers_gives_training_the_rest():
+    assert split_workers(2, 31) == (31 - 2 * EVAL_WORKERS, EVAL_WORKERS)
+    assert split_workers(2, 1) == (1, 0)
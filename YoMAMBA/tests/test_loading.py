@@ -0,0 +1,58 @@
+import sys
+import os
+
+import pytest
+import torch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from models.loading import checkpoint_model_config, export_weights, load_for_inference
+from models.yolov1_resnet18 import YoloV1_Resnet18
+
+
+def model_config(head, S=7, B=2, C=20):
+    return {"backbone": "resnet18", "head": head, "S": S, "B": B, "C": C}
+
+
+@pytest.mark.parametrize("head,S", [("dense", 2), ("conv", 7), ("separable", 7)])
+def test_checkpoint_model_config_matches_weights(head, S):
+    checkpoint = {"model_state_dict": YoloV1_Resnet18(S=S, head=head, load_pretrained=False).state_dict()}
+    assert checkpoint_model_config(checkpoint, model_config(head, S)) == model_config(head, S)
+
+    stored = dict(checkpoint, model_config=model_config(head, S))
+    assert checkpoint_model_config(stored, model_config("conv", S=14, C=10)) == model_config(head, S)
+
+    with pytest.raises(ValueError):
+        checkpoint_model_config(checkpoint, model_config(head, S, C=10))
+    with pytest.raises(ValueError):
+        checkpoint_model_config(checkpoint, model_config("separable" if head == "conv" else "conv", S))
+
+
+@pytest.mark.parametrize("S", [2, 7, 14])
+def test_checkpoint_model_config_mamba_dense_head(S):
+    # Shapes of YoloV1_Mamba's dense head, on meta (building the model needs transformers)
+    state_dict = {
+        "yolov1head.0.weight": torch.empty(1024, 640, 3, 3, device="meta"),
+        "yolov1head.13.weight": torch.empty(4096, 1024 * 7 * 7, device="meta"),
+        "yolov1head.16.weight": torch.empty(S * S * 30, 4096, device="meta"),
+    }
+    mamba_config = dict(model_config("dense", S), backbone="mamba")
+    assert checkpoint_model_config({"model_state_dict": state_dict}, mamba_config) == mamba_config
+    if S != 7:
+        with pytest.raises(ValueError):
+            checkpoint_model_config({"model_state_dict": state_dict}, model_config("dense", S))
+
+
+def test_load_for_inference_prefers_newer_file(tmp_path):
+    model = YoloV1_Resnet18(head="conv", load_pretrained=False)
+    torch.save({"model_state_dict": model.state_dict()}, tmp_path / "yolov1.pth")
+    export_weights({k: torch.zeros_like(v) for k, v in model.state_dict().items()}, str(tmp_path / "yolov1.safetensors"), model_config("conv"))
+    os.utime(tmp_path / "yolov1.pth", (0, 0))
+
+    kwargs = {"S": 7, "B": 2, "C": 20, "head": "conv"}
+    loaded = load_for_inference(YoloV1_Resnet18, str(tmp_path), "cpu", **kwargs)
+    assert torch.all(loaded.yolov1head[0].weight == 0) # the export
+
+    os.utime(tmp_path / "yolov1.safetensors", (0, 0))
+    os.utime(tmp_path / "yolov1.pth")
+    loaded = load_for_inference(YoloV1_Resnet18, str(tmp_path), "cpu", **kwargs)
+    assert torch.equal(loaded.yolov1head[0].weight, model.yolov1head[0].weight) # the newer checkpoint
@@ -0,0 +1,60 @@
+import torch
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from loss.yolov1_loss import YoloV1Loss, YoloV1LossReference
+
+
+def make_batch(N=4, S=7, B=2, C=20, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    preds = torch.randn(N, S * S * (C + B * 5), generator=generator)
+    target = torch.zeros(N, S, S, C + B * 5)
+    has_obj = torch.rand(N, S, S, generator=generator) < 0.2
+    classes = torch.randint(0, C, (N, S, S), generator=generator)
+    target[..., :C] = torch.nn.functional.one_hot(classes, C) * has_obj.unsqueeze(-1)
+    target[..., C] = has_obj.float()
+    target[..., C + 1:C + 5] = torch.rand(N, S, S, 4, generator=generator) * has_obj.unsqueeze(-1)
+    return preds, target
+
+
+def test_loss_matches_reference():
+    preds, target = make_batch()
+    preds_ref = preds.clone().requires_grad_()
+    preds = preds.requires_grad_()
+
+    loss = YoloV1Loss()(preds, target)
+    loss_ref = YoloV1LossReference()(preds_ref, target)
+    loss.backward()
+    loss_ref.backward()
+
+    assert torch.allclose(loss, loss_ref, rtol=1e-5)
+    assert torch.allclose(preds.grad, preds_ref.grad, rtol=1e-4, atol=1e-6)
+
+
+def test_loss_tied_boxes_use_first_box():
+    preds, target = make_batch(seed=1)
+    preds = preds.reshape(-1, 7, 7, 30)
+    preds[..., 26:30] = preds[..., 21:25] # identical boxes, different confidences
+    assert torch.allclose(YoloV1Loss()(preds, target), YoloV1LossReference()(preds, target), rtol=1e-5)
+
+
+def test_loss_generic_layout_trains_best_iou_box():
+    S, B, C = 14, 3, 20
+    preds = torch.zeros(1, S, S, C + B * 5)
+    target = torch.zeros(1, S, S, C + B * 5)
+    target[0, 4, 9, 2] = 1.0
+    target[0, 4, 9, C:C + 5] = torch.tensor([1.0, 0.5, 0.5, 0.4, 0.4])
+    # Box 1 overlaps the target best, boxes 0 and 2 barely
+    preds[0, 4, 9, C:C + 15] = torch.tensor([
+        0.2, 0.1, 0.1, 0.1, 0.1,
+        0.3, 0.5, 0.5, 0.3, 0.3,
+        0.9, 0.9, 0.9, 0.1, 0.1,
+    ])
+    preds.requires_grad_()
+
+    YoloV1Loss(S, B, C)(preds.flatten(1), target).backward()
+    grad = preds.grad[0, 4, 9, C:].reshape(B, 5)
+    assert grad[1].abs().sum() > 0
+    # Non-responsible boxes only get the no object confidence term, which is zero in an object cell
+    assert torch.all(grad[[0, 2]] == 0)
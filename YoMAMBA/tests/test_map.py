@@ -0,0 +1,47 @@
+import random
+import torch
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.yolov1_utils import DetectionEvaluator, mean_average_precision
+
+
+def random_box():
+    return [round(random.random(), 1), round(random.random(), 1), round(random.random() * 0.5, 2), round(random.random() * 0.5, 2)]
+
+
+def test_evaluator_matches_mean_average_precision():
+    random.seed(0)
+    for _ in range(20):
+        num_images, num_classes = random.randint(1, 10), random.choice([3, 20])
+        true_boxes = [[i, random.randrange(num_classes), 1.0] + random_box() for i in range(num_images) for _ in range(random.randint(1, 4))]
+        pred_boxes = [[i, random.randrange(num_classes), round(random.random(), 1)] + random_box() for i in range(num_images) for _ in range(random.randint(0, 8))]
+
+        # Near duplicates of the ground truths so some detections match
+        for box in true_boxes:
+            if random.random() < 0.6:
+                pred_boxes.append(box[:2] + [round(random.random(), 1)] + [v + random.uniform(-0.03, 0.03) for v in box[3:]])
+        random.shuffle(pred_boxes)
+
+        for boxformat in ["midpoints", "corners"]:
+            expected = mean_average_precision(pred_boxes, true_boxes, 0.5, boxformat, num_classes)
+            evaluator = DetectionEvaluator(0.5, boxformat, num_classes)
+            evaluator.update_from_lists(pred_boxes, true_boxes)
+            assert torch.equal(torch.as_tensor(expected), evaluator.compute())
+
+
+def test_evaluator_streaming_update():
+    # [class_pred, prob_score, x, y, w, h], one image per row
+    preds = torch.tensor([
+        [[0, 0.9, 0.55, 0.2, 0.3, 0.2], [0, 0.8, 0.35, 0.6, 0.3, 0.2], [0, 0.0, 0.0, 0.0, 0.0, 0.0]],
+        [[1, 0.7, 0.8, 0.7, 0.2, 0.2], [0, 0.0, 0.0, 0.0, 0.0, 0.0], [0, 0.0, 0.0, 0.0, 0.0, 0.0]],
+    ])
+    trues = torch.tensor([
+        [[0, 1.0, 0.55, 0.2, 0.3, 0.2], [0, 1.0, 0.35, 0.6, 0.3, 0.2]],
+        [[1, 1.0, 0.8, 0.7, 0.2, 0.2], [0, 0.0, 0.0, 0.0, 0.0, 0.0]],
+    ])
+    evaluator = DetectionEvaluator()
+    evaluator.update(preds[:1], torch.tensor([2]), trues[:1], torch.tensor([2]))
+    evaluator.update(preds[1:], torch.tensor([1]), trues[1:], trues[1:, :, 1] > 0.5)
+    assert torch.isclose(evaluator.compute(), torch.tensor(1.0), atol=1e-4)
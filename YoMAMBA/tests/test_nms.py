@@ -0,0 +1,48 @@
+import torch
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.yolov1_utils import batched_non_max_suppression, non_max_suppression, intersection_over_union
+
+
+def reference_nms(bboxes, iou_threshold, threshold, boxformat):
+    # Original list based NMS, one IoU per box pair
+    bboxes = [box for box in bboxes if box[1] > threshold]
+    bboxes = sorted(bboxes, key=lambda x: x[1], reverse=True)
+    bboxes_after_nms = []
+    while bboxes:
+        chosen_box = bboxes.pop(0)
+        bboxes = [
+            box for box in bboxes
+            if box[0] != chosen_box[0]
+            or intersection_over_union(torch.tensor(chosen_box[2:]), torch.tensor(box[2:]), boxformat=boxformat) < iou_threshold
+        ]
+        bboxes_after_nms.append(chosen_box)
+    return bboxes_after_nms
+
+
+def random_preds(N, M=49, num_classes=3):
+    preds = torch.rand(N, M, 6)
+    preds[..., 0] = torch.randint(0, num_classes, (N, M)).float()
+    preds[..., 1] = torch.round(preds[..., 1] * 10) / 10 # Force score ties
+    preds[..., 4:] *= 0.5
+    return preds
+
+
+def test_batched_matches_list_nms():
+    torch.manual_seed(0)
+    for boxformat in ["midpoints", "corners"]:
+        preds = random_preds(16)
+        boxes, counts = batched_non_max_suppression(preds, iou_threshold=0.5, threshold=0.4, boxformat=boxformat)
+        for idx in range(preds.shape[0]):
+            expected = reference_nms(preds[idx].tolist(), 0.5, 0.4, boxformat)
+            assert boxes[idx, :counts[idx]].tolist() == expected
+            assert torch.all(boxes[idx, counts[idx]:] == 0)
+
+
+def test_list_wrapper():
+    torch.manual_seed(1)
+    bboxes = random_preds(1)[0].tolist()
+    assert non_max_suppression(bboxes, 0.5, 0.4, "midpoints") == reference_nms(bboxes, 0.5, 0.4, "midpoints")
+    assert non_max_suppression([], 0.5, 0.4) == []
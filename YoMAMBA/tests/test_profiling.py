@@ -0,0 +1,48 @@
+import json
+import sys
+import os
+
+import torch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.profiling import StepProfiler
+
+
+def run_loop(profiler, model, optimizer, batches, epoch):
+    for x, y in profiler.iterate(batches, epoch):
+        with profiler.stage("forward"):
+            out = model(x)
+        with profiler.stage("backward"):
+            torch.nn.functional.mse_loss(out, y).backward()
+            optimizer.step()
+            optimizer.zero_grad()
+
+
+def test_step_records(tmp_path):
+    model = torch.nn.Linear(4, 2)
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+    profiler = StepProfiler(str(tmp_path), "cpu", optimizer, tensorboard=False, trace_steps=(1, 2))
+    batches = [(torch.randn(8, 4), torch.randn(8, 2)) for _ in range(3)]
+    run_loop(profiler, model, optimizer, batches, epoch=0)
+    run_loop(profiler, model, optimizer, batches[:1], epoch=1)
+    assert "img/s" in profiler.summary()
+    profiler.close()
+
+    records = [json.loads(line) for line in open(tmp_path / "profile.jsonl")]
+    assert [(r["epoch"], r["step"]) for r in records] == [(0, 0), (0, 1), (0, 2), (1, 3)]
+    for r in records:
+        assert {"data", "forward", "backward", "optimizer", "total", "images_per_s", "max_rss_mb"} <= set(r)
+        assert r["samples"] == 8
+        # Stages are exclusive, so they add up to at most the step time
+        stages = r["data"] + r["forward"] + r["backward"] + r["optimizer"]
+        assert stages <= r["total"] + 1e-6
+    assert (tmp_path / "trace_steps_1-2.json").exists()
+
+
+def test_disabled_is_passthrough():
+    profiler = StepProfiler(None, "cpu", enabled=False)
+    assert list(profiler.iterate([1, 2], epoch=0)) == [1, 2]
+    with profiler.stage("forward"):
+        pass
+    assert profiler.summary() == ""
+    profiler.close()
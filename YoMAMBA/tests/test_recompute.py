@@ -0,0 +1,57 @@
+import copy
+import sys
+import os
+
+import torch
+import torch.nn as nn
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.recompute import CheckpointedSequential, set_checkpoint_segments, split_layers
+
+
+def small_head():
+    torch.manual_seed(0)
+    return CheckpointedSequential(
+        nn.Conv2d(3, 8, kernel_size=3, padding=1), nn.BatchNorm2d(8), nn.LeakyReLU(0.1),
+        nn.Conv2d(8, 8, kernel_size=3, stride=2, padding=1), nn.BatchNorm2d(8), nn.LeakyReLU(0.1),
+        nn.Flatten(), nn.Linear(8 * 4 * 4, 32), nn.Dropout(0.5), nn.LeakyReLU(0.1), nn.Linear(32, 10),
+    )
+
+
+def train_step(model, x):
+    torch.manual_seed(1) # same dropout mask for every model
+    out = model(x)
+    out.square().mean().backward()
+    return out.detach(), [p.grad for p in model.parameters()], [b.clone() for b in model.buffers()]
+
+
+def test_split_layers():
+    chunks = split_layers(list(range(11)), 3)
+    assert [len(c) for c in chunks] == [4, 3, 4]
+    assert sum(chunks, []) == list(range(11))
+    assert len(split_layers(list(range(2)), 4)) == 2
+
+
+def test_checkpointing_matches_plain_training():
+    x = torch.randn(4, 3, 8, 8)
+    plain = small_head().train()
+    expected = train_step(plain, x)
+
+    for segments in [1, 3, 11]:
+        model = copy.deepcopy(plain)
+        model.zero_grad()
+        for b, b0 in zip(model.buffers(), small_head().buffers()):
+            b.copy_(b0)
+        assert set_checkpoint_segments(model, segments) == 1
+        out, grads, buffers = train_step(model, x)
+        assert torch.allclose(out, expected[0])
+        for g, g0 in zip(grads, expected[1]):
+            assert torch.allclose(g, g0, atol=1e-6)
+        # The recomputation must not update the BatchNorm statistics twice
+        for b, b0 in zip(buffers, expected[2]):
+            assert torch.equal(b, b0)
+
+
+def test_state_dict_unchanged():
+    model = small_head()
+    assert list(model.state_dict()) == list(nn.Sequential(*model).state_dict())
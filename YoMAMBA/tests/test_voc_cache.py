@@ -0,0 +1,23 @@
+import sys
+import os
+
+import numpy as np
+import torch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from data import VOCCache, cache_prefix
+
+
+def test_cache_is_keyed_by_image_size(tmp_path):
+    prefix = cache_prefix("train", str(tmp_path), (4, 6))
+    np.save(f"{prefix}_images.npy", np.arange(2 * 3 * 6 * 4, dtype=np.uint8).reshape(2, 3, 6, 4))
+    np.save(f"{prefix}_boxes.npy", np.array([[0, 0, 2, 3, 5]], dtype=np.float32))
+    np.save(f"{prefix}_offsets.npy", np.array([0, 1, 1], dtype=np.int64))
+
+    assert VOCCache.exists("train", str(tmp_path), (4, 6))
+    assert not VOCCache.exists("train", str(tmp_path), (448, 448))
+
+    image, boxes, class_ids = VOCCache("train", str(tmp_path), (4, 6))[0]
+    assert image.shape == (3, 6, 4)
+    assert torch.equal(boxes, torch.tensor([[0., 0., 2., 3.]]))
+    assert class_ids.tolist() == [5]
@@ -1,63 +1,119 @@
 import os
 import torch
 import time
+import argparse
 from tqdm import tqdm
+from torch.utils.data import default_collate
 import torch.optim as optim
-from torch.utils.data import DataLoader
 from loss.yolov1_loss import YoloV1Loss
 from torch.optim.lr_scheduler import LambdaLR
 from models.yolov1_resnet18 import YoloV1_Resnet18
 from models.yolov1_resnet101 import YoloV1_Resnet101
 from models.yolov1_mamba import YoloV1_Mamba
 
-from utils.yolov1_utils import get_bboxes, mean_average_precision as mAP
-from data import VOCDataset
+from utils.yolov1_utils import evaluate_mAP
+from utils.background_eval import BackgroundEvaluator
+from utils.checkpoint import CheckpointWriter
+from utils.loader import make_loader, split_workers, LoaderTimer
+from utils.amp import MixedPrecision, GradientAccumulator, prepare_model, prepare_input, benchmark_settings, benchmark_step_time, tune_micro_batch
+from utils.recompute import set_checkpoint_segments, checkpointing_report
+from utils.profiling import StepProfiler
+from data import VOCDataset, collate_boxes, encode_targets
+from feature_cache import build_feature_cache, feature_cache_key, FeatureCacheDataset, VariantSampler, TrainableHead
+import config
+from augment import BatchAugment
 
 
-device = "cuda"
-batch_size = 64
+device = "cuda" if torch.cuda.is_available() else "cpu"
+batch_size = 64 # Samples per optimizer step, loaded as --accum-steps micro-batches
 weight_decay = 5e-4
 epochs = 140
-nworkers = 14 # Supposedly faster: https://chtalhaanwar.medium.com/pytorch-num-workers-a-tip-for-speedy-training-ed127d825db7
+nworkers = None # DataLoader workers shared by all loaders, None for one per available core (see utils/loader.py)
 save_last_model = True
 save_checkpoints = True
 checkpoint_interval = 10
+keep_last_checkpoints = 3 # epoch_N.pth files kept on disk
 eval_interval = 10
+async_eval = True # Evaluate weight snapshots in a background thread while training continues
+gpu_augment = False # Augment whole batches on the training device instead of per sample in workers
+feature_cache_variants = 8 # Augmented copies of the train set kept in the feature cache
 
 # Select Model
 use_resnet18_backbone = False
 use_resnet101_backbone = False
 use_mamba_backbone = True
 
+# Performance mode
+parser = argparse.ArgumentParser()
+parser.add_argument('--precision', choices=["fp32", "bf16", "fp16"], default="fp32", help='Autocast dtype, fp16 adds loss scaling')
+parser.add_argument('--channels-last', action='store_true', help='Use channels-last memory format')
+parser.add_argument('--compile', action='store_true', help='torch.compile the model and the loss')
+parser.add_argument('--benchmark', action='store_true', help='Report step time for every setting before training')
+parser.add_argument('--checkpoint-segments', type=int, default=0, help='Recompute the detection head in backward in this many segments (activation checkpointing), 0 = off')
+parser.add_argument('--checkpoint-report', action='store_true', help='Report peak memory and step time with and without activation checkpointing before training')
+parser.add_argument('--accum-steps', type=int, default=1, help='Micro-batches per optimizer step (gradient accumulation)')
+parser.add_argument('--auto-micro-batch', action='store_true', help='Pick the fastest micro-batch (samples/s) that fits in memory, sets --accum-steps')
+parser.add_argument('--feature-cache', action='store_true', help='Train only the layers after the frozen backbone, from cached features')
+parser.add_argument('--profile', action='store_true', help='Log per-step stage timings, images/s and peak memory to metrics/<model>/profile (JSONL + TensorBoard)')
+parser.add_argument('--profile-trace', type=int, nargs=2, default=None, metavar=('FIRST', 'LAST'), help='Also record a torch.profiler trace of these global train steps (implies --profile)')
+
 # Train Model
-def train(train_loader, model, optimizer, loss_fn, scheduler, epoch):
+def train(train_loader, model, optimizer, loss_fn, scheduler, epoch, augment=None, amp=None, step_model=None, accumulator=None, profiler=None, channels_last=False):
     """
     Input: train loader (torch loader), model (torch model), optimizer (torch optimizer)
-          loss function (torch custom yolov1 loss).
-    Output: loss (torch float).
+          loss function (torch custom yolov1 loss), optional batch augmentation
+          (loader then yields raw boxes, see collate_boxes), mixed precision
+          settings, the (compiled) module to run forward with and the gradient
+          accumulator stepping the optimizer (one step per loader batch by default)
+          and the StepProfiler timing each stage (off by default), and whether
+          inputs are converted to channels-last.
+    Output: loss (torch float), epoch time and the part of it spent waiting for data.
     """
+    amp = amp or MixedPrecision("fp32", device)
+    step_model = step_model or model
+    accumulator = accumulator or GradientAccumulator(optimizer, amp, train_loader.batch_size)
+    profiler = profiler or StepProfiler(None, device, enabled=False)
     model.train()
+    if augment is not None:
+        augment.set_epoch(epoch)
 
     total_loss = 0.0
     t0 = time.time()
-    pbar = tqdm(train_loader, desc=f"Train: Epoch {epoch+1}/{epochs}")
-    for x, y in pbar:
-        x, y = x.to(device), y.to(device)
-        
-        out = model(x)
-        loss = loss_fn(out, y)
-        
-        optimizer.zero_grad()
-        loss.backward()
-        optimizer.step()
+    timer = LoaderTimer(train_loader)
+    pbar = tqdm(profiler.iterate(timer, epoch), total=len(timer), desc=f"Train: Epoch {epoch+1}/{epochs}")
+    for batch in pbar:
+        with profiler.stage("h2d"):
+            batch = [t.to(device, non_blocking=True) for t in batch]
+        if augment is not None:
+            with profiler.stage("augment"):
+                x, boxes, class_ids = batch
+                x, boxes = augment(x, boxes)
+                y = encode_targets(boxes, class_ids, layout="yolov1")
+        else:
+            x, y = batch
+
+        x = prepare_input(x, channels_last)
+        with profiler.stage("forward"), amp.autocast():
+            out = step_model(x)
+        with profiler.stage("loss"):
+            loss = loss_fn(out.float(), y)
+        with profiler.stage("backward"):
+            accumulator.backward(loss, x.shape[0]) # includes the optimizer step every accum_steps batches
 
-        total_loss += loss.item()
-        pbar.set_postfix({'loss': loss.item()})
+        with profiler.stage("sync"):
+            loss_value = loss.item()
+        total_loss += loss_value
+        pbar.set_postfix({'loss': loss_value})
 
+    # Every epoch ends on an optimizer step, so the per epoch LR schedule is the same for any accum_steps
+    accumulator.flush()
     scheduler.step()
     elapsed = time.time() - t0
     avg_loss = total_loss / len(train_loader)
-    return avg_loss, elapsed
+    print(f"Train: Epoch {epoch+1}/{epochs} {timer.summary()}")
+    if profiler.enabled:
+        print(f"Train: Epoch {epoch+1}/{epochs} {profiler.summary()}")
+    return avg_loss, elapsed, timer.data_time
     
 def val(val_loader, model, loss_fn, epoch):
     """
@@ -72,7 +128,7 @@ def val(val_loader, model, loss_fn, epoch):
         t0 = time.time()
         pbar = tqdm(val_loader, desc=f"Val: Epoch: {epoch+1}/{epochs}")
         for x, y in val_loader:
-            x, y = x.to(device), y.to(device)
+            x, y = x.to(device, non_blocking=True), y.to(device, non_blocking=True)
 
             out = model(x)
             loss = loss_fn(out, y)
@@ -83,24 +139,44 @@ def val(val_loader, model, loss_fn, epoch):
         elapsed = time.time() - t0
         avg_loss = total_loss / len(val_loader)
         return avg_loss, elapsed
+
+def evaluate(train_loader, val_loader, model, loss_fn, epoch):
+    """
+    Input: train and val loaders (torch loader), model (torch model), loss function
+          (torch custom yolov1 loss).
+    Output: dict with val loss, val time, train mAP and val mAP.
+    """
+    val_loss_value, val_time = val(val_loader, model, loss_fn, epoch)
+    train_mAP_val = evaluate_mAP(train_loader, model, iou_threshold = 0.5, threshold = 0.4, boxformat="midpoints", num_classes=config.C, S=config.S, B=config.B)
+    val_mAP_val = evaluate_mAP(val_loader, model, iou_threshold = 0.5, threshold = 0.4, boxformat="midpoints", num_classes=config.C, S=config.S, B=config.B)
+    return {
+        "val_loss": val_loss_value,
+        "val_time": val_time,
+        "train_mAP": train_mAP_val.item(),
+        "val_mAP": val_mAP_val.item()
+    }
     
-def main():
+def main(args):
     # Select model
     if use_mamba_backbone:
         lr = 1e-5
         current_model = "mamba"
-        model = YoloV1_Mamba(S=7, B=2, C=20).to(device)
+        model = YoloV1_Mamba(S=config.S, B=config.B, C=config.C, head=config.HEAD).to(device)
     elif use_resnet18_backbone:
         lr =  1e-5
         current_model = "resnet18"
-        model = YoloV1_Resnet18(S=7, B=2, C=20).to(device)
+        model = YoloV1_Resnet18(S=config.S, B=config.B, C=config.C, head=config.HEAD).to(device)
     elif use_resnet101_backbone:
         lr =  1e-5
         current_model = "resnet101"
-        model = YoloV1_Resnet101(S=7, B=2, C=20).to(device)
+        model = YoloV1_Resnet101(S=config.S, B=config.B, C=config.C, head=config.HEAD).to(device)
     else:
         print("No backbone was specified")
         return 1
+    if args.checkpoint_segments:
+        # Before the micro-batch is tuned, so it gets the memory checkpointing frees
+        n = set_checkpoint_segments(model, args.checkpoint_segments)
+        print(f"Activation checkpointing: {n} Sequential(s) in {args.checkpoint_segments} segment(s)")
 
     ckpt_dir = f"checkpoints/{current_model}"
     metric_dir = f"metrics/{current_model}"
@@ -111,7 +187,8 @@ def main():
     
     # Load training settings and metrics
     optimizer = optim.Adam(model.parameters(), lr=lr, weight_decay = weight_decay)
-    loss_fn = YoloV1Loss()
+    loss_fn = YoloV1Loss(S=config.S, B=config.B, C=config.C)
+    amp = MixedPrecision(args.precision, device)
 
     train_loss_list = []
     train_mAP_list = []
@@ -119,12 +196,16 @@ def main():
     val_mAP_list = []
     val_loss_list = []
     val_times_list = []
+    ckpt_blocked_list = []
+    train_data_wait_list = []
     last_epoch = 0
 
     if os.path.exists(ckpt_path):
-        checkpoint = torch.load(ckpt_path)
+        checkpoint = torch.load(ckpt_path, map_location=device)
         model.load_state_dict(checkpoint["model_state_dict"])
         optimizer.load_state_dict(checkpoint["optimizer_state_dict"])
+        if "scaler_state_dict" in checkpoint:
+            amp.load_state_dict(checkpoint["scaler_state_dict"])
         last_epoch = checkpoint["epoch"]
         print(f"Checkpoint from epoch:{last_epoch + 1} successfully loaded.")
 
@@ -136,6 +217,8 @@ def main():
         val_loss_list = m["val_losses"]
         val_mAP_list = m["val_mAP"]
         val_times_list = m["val_times"]
+        ckpt_blocked_list = m.get("checkpoint_blocked_times", [])
+        train_data_wait_list = m.get("train_data_wait_times", [])
 
     def lr_lambda(epoch):
         if epoch <= 5: return 1 + 9 * (epoch / 5)     # linearly from 1× to 10×
@@ -145,23 +228,102 @@ def main():
     scheduler = LambdaLR(optimizer, lr_lambda=lr_lambda, last_epoch=last_epoch if last_epoch > 0 else -1)
 
     # Dataset
-    def collate_fn(batch):
-        images, targets = zip(*batch)
-        images = torch.stack(images)
-        targets = torch.stack(targets)
-        return images, targets
-
-    train_ds = VOCDataset("train")
+    # With gpu_augment workers only decode, augmentation and encoding happen per batch
+    augment = BatchAugment() if gpu_augment else None
+    train_ds = VOCDataset("train", augment=not gpu_augment, encode=not gpu_augment)
+    eval_train_ds = VOCDataset("train") if gpu_augment else train_ds
     val_ds = VOCDataset("val")
-    train_loader = DataLoader(train_ds, batch_size=batch_size, shuffle=True, collate_fn=collate_fn, drop_last=True)
-    val_loader = DataLoader(val_ds, batch_size=batch_size, shuffle=False, collate_fn=collate_fn, drop_last=True)
+
+    # Loaders yield micro-batches, batch_size samples are accumulated per optimizer step
+    accum_steps = args.accum_steps
+    if args.auto_micro_batch:
+        x, y = default_collate([eval_train_ds[i] for i in range(min(len(eval_train_ds), 8))])
+        _, accum_steps = tune_micro_batch(model, loss_fn, x.to(device), y.to(device), batch_size, args.precision, args.channels_last, args.compile)
+    accumulator = GradientAccumulator(optimizer, amp, batch_size, accum_steps)
+    micro_batch_size = accumulator.micro_batch_size
+
+    # The default collate stacks (image, target) pairs, in shared memory when it runs in a worker.
+    # The eval loaders get a few of the workers, the training loader (built below) the rest
+    train_workers, eval_workers = split_workers(2, nworkers)
+    val_loader = make_loader(val_ds, micro_batch_size, drop_last=True, num_workers=eval_workers)
+    eval_train_loader = make_loader(eval_train_ds, micro_batch_size, drop_last=True, num_workers=eval_workers)
+
+    def record_eval(epoch, result):
+        val_loss_list.append(result["val_loss"])
+        val_times_list.append(result["val_time"])
+        train_mAP_list.append(result["train_mAP"])
+        val_mAP_list.append(result["val_mAP"])
+        print(
+            f"Epoch {epoch + 1} | "
+            f"Val Loss: {result['val_loss']:.4f} ({result['val_time']:.2f}s) | "
+            f"Train mAP: {result['train_mAP']:.4f} | Val mAP: {result['val_mAP']:.4f}"
+        )
+
+    # Checkpoints and metrics are serialized in the background, training only waits for the CPU copy
+    ckpt_writer = CheckpointWriter(keep_last=keep_last_checkpoints)
+
+    def save_metrics():
+        return ckpt_writer.save({
+            "train_losses": train_loss_list,
+            "train_mAP": train_mAP_list,
+            "train_times": train_times_list,
+            "val_losses": val_loss_list,
+            "val_mAP": val_mAP_list,
+            "val_times": val_times_list,
+            "checkpoint_blocked_times": ckpt_blocked_list,
+            "train_data_wait_times": train_data_wait_list
+        }, metric_path, slot="metrics")
+
+    # Evaluation only uses the eval loaders, so it can run in the background next to training
+    evaluator = None
+    if async_eval:
+        evaluator = BackgroundEvaluator(
+            model,
+            lambda eval_model, epoch: evaluate(eval_train_loader, val_loader, eval_model, loss_fn, epoch)
+        )
+
+    # Startup benchmark on one real batch, before the model is prepared for training
+    if args.benchmark:
+        x, y = next(iter(eval_train_loader))
+        benchmark_settings(model, loss_fn, x.to(device), y.to(device))
+    if args.checkpoint_report:
+        x, y = next(iter(eval_train_loader))
+        x, y = x.to(device), y.to(device)
+        checkpointing_report(model, sorted({0, 1, 2, 4, args.checkpoint_segments}), lambda: benchmark_step_time(
+            model, loss_fn, x, y, args.precision, args.channels_last, steps=3, warmup=1))
+
+    # Head-only training: run the frozen backbone once per (image, augmentation) and train from disk
+    train_sampler = None
+    if args.feature_cache:
+        model.freeze_backbone()
+        cache_dir = os.path.join(config.CACHE_PATH, f"features_{current_model}")
+        cache_key = feature_cache_key(model, feature_cache_variants, config.IMG_SIZE, config.S, config.B, config.C)
+        if not FeatureCacheDataset.exists(cache_dir, cache_key):
+            # Missing, or built with other settings or backbone weights
+            build_feature_cache(model, VOCDataset("train"), cache_dir, variants=feature_cache_variants, batch_size=micro_batch_size, device=device, key=cache_key)
+        cache_ds = FeatureCacheDataset(cache_dir)
+        train_sampler = VariantSampler(cache_ds)
+        train_loader = make_loader(cache_ds, micro_batch_size, sampler=train_sampler, drop_last=True, num_workers=train_workers)
+        augment = None
+    else:
+        train_loader = make_loader(train_ds, micro_batch_size, shuffle=True, collate_fn=collate_boxes if gpu_augment else None, drop_last=True, num_workers=train_workers)
+
+    step_model = prepare_model(TrainableHead(model) if args.feature_cache else model, args.channels_last, args.compile)
+    train_loss_fn = YoloV1Loss(S=config.S, B=config.B, C=config.C, compile=True) if args.compile else loss_fn
+
+    # Per-step instrumentation, see utils/profiling.py
+    profiler = StepProfiler(f"{metric_dir}/profile", device, optimizer, enabled=args.profile or args.profile_trace is not None,
+                            trace_steps=args.profile_trace)
 
     for epoch in range(last_epoch, epochs):
+        if train_sampler is not None:
+            train_sampler.set_epoch(epoch)
         
         # Train Step
-        train_loss_value, train_time = train(train_loader, model, optimizer, loss_fn, scheduler, epoch)
+        train_loss_value, train_time, data_wait = train(train_loader, model, optimizer, train_loss_fn, scheduler, epoch, augment, amp, step_model, accumulator, profiler, args.channels_last)
         train_loss_list.append(train_loss_value)
         train_times_list.append(train_time)
+        train_data_wait_list.append(data_wait)
 
         print(
             f"Epoch {epoch + 1} | "
@@ -171,46 +333,42 @@ def main():
 
         # Evaluate: Val loss, train mAP, val mAP
         if epoch == 0 or (epoch + 1) % eval_interval == 0:
-            val_loss_value, val_time = val(val_loader, model, loss_fn, epoch)
-            val_loss_list.append(val_loss_value)
-            val_times_list.append(val_time)
-            pred_bbox, target_bbox = get_bboxes(train_loader, model, iou_threshold = 0.5, threshold = 0.4)
-            val_pred_bbox, val_target_bbox = get_bboxes(val_loader, model, iou_threshold = 0.5, threshold = 0.4)                                
-            train_mAP_val = mAP(pred_bbox, target_bbox, iou_threshold = 0.5, boxformat="midpoints")
-            val_mAP_val = mAP(val_pred_bbox, val_target_bbox, iou_threshold = 0.5, boxformat="midpoints")
-            train_mAP_list.append(train_mAP_val.item())
-            val_mAP_list.append(val_mAP_val.item())
-            
-            print(
-                f"Val Loss: {val_loss_value:.4f} ({val_time:.2f}s) | "
-                f"Train mAP: {train_mAP_val:.4f} | Val mAP: {val_mAP_val:.4f}"
-            )
+            if evaluator is not None:
+                evaluator.submit(epoch, model)
+            else:
+                record_eval(epoch, evaluate(eval_train_loader, val_loader, model, loss_fn, epoch))
 
-        if save_last_model:
-            torch.save({
-                "epoch": epoch+1,
-                "model_state_dict": model.state_dict(),
-                "optimizer_state_dict": optimizer.state_dict()
-            }, ckpt_path)
-            torch.save({
-                "train_losses": train_loss_list,
-                "train_mAP": train_mAP_list,
-                "train_times": train_times_list,
-                "val_losses": val_loss_list,
-                "val_mAP": val_mAP_list,
-                "val_times": val_times_list
-            }, metric_path)
-            print(f"Saved last model and metrics")
+        # Collect any background evaluations that finished during this epoch
+        if evaluator is not None:
+            for eval_epoch, result in evaluator.poll():
+                record_eval(eval_epoch, result)
 
+        history_path = None
         if save_checkpoints and (epoch + 1) % checkpoint_interval == 0:
-            torch.save({
+            history_path = os.path.join(ckpt_dir, f"epoch_{epoch+1}.pth")
+
+        if save_last_model or history_path:
+            blocked = ckpt_writer.save({
                 "epoch": epoch+1,
                 "model_state_dict": model.state_dict(),
-                "optimizer_state_dict": optimizer.state_dict()
-            }, os.path.join(ckpt_dir, f"epoch_{epoch+1}.pth"))
-            print(f"Checkpoint at {epoch + 1} stored")
-            
-    
+                "optimizer_state_dict": optimizer.state_dict(),
+                "scaler_state_dict": amp.state_dict(),
+                "model_config": {"backbone": current_model, "head": config.HEAD, "S": config.S, "B": config.B, "C": config.C}
+            }, [ckpt_path] if save_last_model else [], history_path)
+            ckpt_blocked_list.append(blocked)
+            print(f"Queued checkpoint{f' and {history_path}' if history_path else ''} (blocked {blocked:.2f}s)")
+
+        if save_last_model:
+            save_metrics()
+
+    # Wait for the last background evaluations and checkpoint writes before exiting
+    if evaluator is not None:
+        for eval_epoch, result in evaluator.close():
+            record_eval(eval_epoch, result)
+        save_metrics()
+    ckpt_writer.close()
+    profiler.close()
+    print(f"Training blocked on checkpoints for {ckpt_writer.blocked_time:.2f}s in total")
             
 if __name__ == "__main__":
-    main()
+    main(parser.parse_args())
@@ -0,0 +1,206 @@
+# Copied as YOLOv2/amp.py: the projects are standalone and don't import each other, fix both.
+import gc
+import copy
+import time
+
+import torch
+
+PRECISIONS = {"fp32": None, "bf16": torch.bfloat16, "fp16": torch.float16}
+
+
+class MixedPrecision:
+    """
+    Autocast + loss scaling for one training precision. fp16 uses a GradScaler,
+    bf16 has the fp32 exponent range and runs unscaled (works on CPU too), and
+    fp32 turns everything off so the training loop is unchanged.
+    """
+
+    def __init__(self, precision="fp32", device="cuda"):
+        self.precision = precision
+        self.dtype = PRECISIONS[precision]
+        self.device_type = torch.device(device).type
+        self.scaler = torch.amp.GradScaler(self.device_type, enabled=precision == "fp16")
+
+    def autocast(self):
+        return torch.autocast(self.device_type, dtype=self.dtype, enabled=self.dtype is not None)
+
+    def backward(self, loss):
+        self.scaler.scale(loss).backward()
+
+    def step(self, optimizer):
+        self.scaler.step(optimizer)
+        self.scaler.update()
+
+    def state_dict(self):
+        return self.scaler.state_dict()
+
+    def load_state_dict(self, state):
+        self.scaler.load_state_dict(state)
+
+
+class GradientAccumulator:
+    """
+    Steps the optimizer once every accum_steps micro-batches, so a batch of
+    batch_size samples is trained as accum_steps micro-batches of
+    batch_size // accum_steps. Each micro-batch loss (a per-sample mean) is
+    weighted by its share of the full batch, so the accumulated gradient is
+    the one of a single batch_size batch. flush() steps on a trailing,
+    smaller group and rescales its gradient to the samples it actually had.
+    """
+
+    def __init__(self, optimizer, amp, batch_size, accum_steps=1):
+        if batch_size % accum_steps != 0:
+            raise ValueError(f"batch size {batch_size} is not divisible into {accum_steps} micro-batches")
+        self.optimizer = optimizer
+        self.amp = amp
+        self.batch_size = batch_size
+        self.accum_steps = accum_steps
+        self.micro_batch_size = batch_size // accum_steps
+        self.micro_steps = 0 # since the last optimizer step
+        self.samples = 0
+        self.optimizer_steps = 0
+
+    def backward(self, loss, n):
+        """
+        Input: mean loss of a micro-batch of n samples.
+        Output: True if this call stepped the optimizer.
+        """
+        self.amp.backward(loss * (n / self.batch_size))
+        self.micro_steps += 1
+        self.samples += n
+        if self.micro_steps == self.accum_steps:
+            return self.flush()
+        return False
+
+    def flush(self):
+        """Steps on the gradients accumulated so far, if any. Output: True if it stepped."""
+        if self.micro_steps == 0:
+            return False
+        if self.samples != self.batch_size:
+            scale = self.batch_size / self.samples
+            for group in self.optimizer.param_groups:
+                for p in group["params"]:
+                    if p.grad is not None:
+                        p.grad.mul_(scale)
+
+        self.amp.step(self.optimizer)
+        self.optimizer.zero_grad()
+        self.micro_steps = 0
+        self.samples = 0
+        self.optimizer_steps += 1
+        return True
+
+
+def prepare_model(model, channels_last=False, compile=False):
+    """
+    Output: the module to run forward passes with. The original model keeps
+    owning the weights, so checkpoints stay free of torch.compile prefixes.
+    """
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    if compile:
+        return torch.compile(model)
+    return model
+
+
+def prepare_input(x, channels_last=False):
+    return x.contiguous(memory_format=torch.channels_last) if channels_last else x
+
+
+def benchmark_step_time(model, loss_fn, x, y, precision="fp32", channels_last=False, compile=False, steps=5, warmup=2):
+    """
+    Times full train steps (forward, loss, backward, optimizer) on a copy of the
+    model so the real weights and BatchNorm statistics are untouched.
+    Output: seconds per step (float).
+    """
+    model = copy.deepcopy(model).train()
+    amp = MixedPrecision(precision, x.device)
+    step_model = prepare_model(model, channels_last, compile)
+    step_loss = torch.compile(loss_fn) if compile else loss_fn
+    x = prepare_input(x, channels_last)
+    optimizer = torch.optim.SGD([p for p in model.parameters() if p.requires_grad], lr=0.0)
+
+    for i in range(warmup + steps):
+        if i == warmup:
+            _synchronize(x.device)
+            t0 = time.perf_counter()
+        with amp.autocast():
+            out = step_model(x)
+        loss = step_loss(out.float(), y)
+        optimizer.zero_grad()
+        amp.backward(loss)
+        amp.step(optimizer)
+
+    _synchronize(x.device)
+    return (time.perf_counter() - t0) / steps
+
+
+def benchmark_settings(model, loss_fn, x, y, compile=True, steps=5):
+    """
+    Startup benchmark. Prints the train step time for every precision, with and
+    without channels-last and torch.compile, on one real batch.
+    Output: list of (setting, seconds per step or None if unsupported).
+    """
+    settings = []
+    for precision in PRECISIONS:
+        for channels_last in [False, True]:
+            for use_compile in ([False, True] if compile else [False]):
+                settings.append((precision, channels_last, use_compile))
+
+    results = []
+    for precision, channels_last, use_compile in settings:
+        name = f"{precision}{' +channels_last' if channels_last else ''}{' +compile' if use_compile else ''}"
+        try:
+            step_time = benchmark_step_time(model, loss_fn, x, y, precision, channels_last, use_compile, steps=steps)
+            print(f"{name:<32} {step_time * 1000:8.1f} ms/step | {x.shape[0] / step_time:7.1f} img/s")
+        except Exception as e:
+            step_time = None
+            print(f"{name:<32} unsupported ({type(e).__name__}: {e})")
+        results.append(((precision, channels_last, use_compile), step_time))
+
+    return results
+
+
+def tune_micro_batch(model, loss_fn, x, y, batch_size, precision="fp32", channels_last=False, compile=False, steps=3):
+    """
+    Times every micro-batch that divides batch_size (batch_size / 2^k), from
+    small to large until one runs out of memory, and picks the one with the
+    most samples/s. x, y is one real batch, repeated to each candidate size.
+    The step runs on a copy of the model, so the sizes that fit are on the
+    safe side. Prints samples/s for every candidate tried.
+    Output: micro-batch size and the accumulation steps it needs.
+    """
+    candidates = [batch_size]
+    while candidates[-1] % 2 == 0:
+        candidates.append(candidates[-1] // 2)
+
+    best, best_throughput = None, 0.0
+    for size in reversed(candidates):
+        repeats = -(-size // x.shape[0])
+        xb = x.repeat(repeats, *[1] * (x.dim() - 1))[:size]
+        yb = y.repeat(repeats, *[1] * (y.dim() - 1))[:size]
+        try:
+            step_time = benchmark_step_time(model, loss_fn, xb, yb, precision, channels_last, compile, steps=steps, warmup=1)
+        except RuntimeError as e: # torch.cuda.OutOfMemoryError is one, MPS raises a plain RuntimeError
+            if "out of memory" not in str(e):
+                raise
+            print(f"micro-batch {size:>5}: out of memory")
+            break
+        finally:
+            del xb, yb
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        print(f"micro-batch {size:>5}: {step_time * 1000:8.1f} ms/step | {size / step_time:7.1f} samples/s")
+        if size / step_time > best_throughput:
+            best, best_throughput = size, size / step_time
+
+    if best is None:
+        raise RuntimeError("Not even a micro-batch of 1 fits in memory")
+    print(f"Using micro-batch {best} x {batch_size // best} accumulation steps")
+    return best, batch_size // best
+
+
+def _synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
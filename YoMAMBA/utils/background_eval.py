@@ -0,0 +1,86 @@
+import copy
+import queue
+import threading
+from contextlib import nullcontext
+
+import torch
+
+
+class BackgroundEvaluator:
+    """
+    Evaluates snapshots of a model in a background thread so training can keep
+    going. The evaluator owns a private copy of the model; submit() clones the
+    current weights into it and eval_fn(model, epoch) runs on the worker thread
+    (on its own CUDA stream when available). Finished results are collected
+    with poll(), and close() waits for anything still running.
+    """
+
+    def __init__(self, model, eval_fn):
+        self.model = copy.deepcopy(model)
+        self.model.requires_grad_(False)
+        self.eval_fn = eval_fn
+
+        # One pending snapshot at most, submit() blocks if eval falls behind
+        self.jobs = queue.Queue(maxsize=1)
+        self.results = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, epoch, model):
+        # Device side clone, cheap compared to a host copy
+        with torch.no_grad():
+            state = {k: v.detach().clone() for k, v in model.state_dict().items()}
+        ready = None
+        if torch.cuda.is_available():
+            ready = torch.cuda.Event()
+            ready.record()
+        self.jobs.put((epoch, state, ready))
+
+    def poll(self):
+        """
+        Output: list of (epoch, result) for every evaluation finished so far,
+                in submission order.
+        """
+        finished = []
+        while True:
+            try:
+                epoch, result, error = self.results.get_nowait()
+            except queue.Empty:
+                return finished
+            if error is not None:
+                raise RuntimeError(f"Background evaluation for epoch {epoch + 1} failed") from error
+            finished.append((epoch, result))
+
+    def close(self):
+        """Waits for pending evaluations and returns their results."""
+        self.jobs.put(None)
+        self.thread.join()
+        return self.poll()
+
+    def _run(self):
+        stream = torch.cuda.Stream() if torch.cuda.is_available() else None
+
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            epoch, state, ready = job
+
+            try:
+                with torch.cuda.stream(stream) if stream is not None else nullcontext():
+                    if ready is not None:
+                        stream.wait_event(ready)
+                    self.model.load_state_dict(state)
+                    if stream is not None:
+                        # The clones come from the default stream's memory pool, keep it from
+                        # reusing them before this stream's copies have read them
+                        for t in state.values():
+                            if t.is_cuda:
+                                t.record_stream(stream)
+                    del state
+                    result = self.eval_fn(self.model, epoch)
+                    if stream is not None:
+                        stream.synchronize()
+                self.results.put((epoch, result, None))
+            except Exception as e:
+                self.results.put((epoch, None, e))
@@ -0,0 +1,114 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+import torch
+
+from utils.yolov1_utils import convert_cellboxes, batched_non_max_suppression
+
+
+class BatchedDetector:
+    """
+    Serves detection requests from many threads with one model. submit()
+    queues a frame and returns a Future; a worker thread groups queued frames
+    into micro-batches, sent once max_batch_size frames are waiting or
+    max_wait seconds after the first one arrived.
+
+    Inputs are copied into preallocated host/device buffers and padded to a
+    few fixed batch sizes (powers of two up to max_batch_size), so the model
+    only ever sees a handful of static shapes.
+    """
+
+    def __init__(self, model, device, max_batch_size=16, max_wait=0.005, img_size=448,
+                 iou_threshold=0.5, threshold=0.4, S=7, B=2, C=20):
+        self.model = model.eval()
+        self.device = torch.device(device)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.img_size = img_size
+        self.iou_threshold = iou_threshold
+        self.threshold = threshold
+        self.S, self.B, self.C = S, B, C
+
+        self.buckets = sorted({min(2 ** i, max_batch_size) for i in range(max_batch_size.bit_length() + 1)})
+        pin = self.device.type == "cuda"
+        self.host_buffer = torch.empty((max_batch_size, img_size, img_size, 3), dtype=torch.uint8, pin_memory=pin)
+        self.input_buffer = torch.empty((max_batch_size, 3, img_size, img_size), dtype=torch.float32, device=self.device)
+
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def warmup(self):
+        """Runs every padded batch size once so the first requests don't pay for it."""
+        for bucket in self.buckets:
+            with torch.inference_mode():
+                self.model(self.input_buffer[:bucket].zero_())
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+
+    def submit(self, frame):
+        """
+        Input: (img_size, img_size, 3) uint8 frame, BGR like cv2.imread.
+        Output: Future of a list of [class_pred, prob_score, x, y, w, h] boxes after NMS,
+                x/y/w/h relative to the image.
+        """
+        future = Future()
+        self.requests.put((frame, future))
+        return future
+
+    def close(self):
+        self.requests.put(None)
+        self.thread.join()
+
+    def detect(self, frames):
+        n = len(frames)
+        bucket = next(b for b in self.buckets if b >= n)
+        for i, frame in enumerate(frames):
+            self.host_buffer[i].copy_(torch.from_numpy(frame))
+
+        # Same scaling as T.ToTensor(); padded slots keep stale data and are ignored
+        x = self.input_buffer[:bucket]
+        x.copy_(self.host_buffer[:bucket].permute(0, 3, 1, 2), non_blocking=True)
+        x.div_(255)
+
+        with torch.inference_mode():
+            preds = self.model(x)[:n]
+            boxes = convert_cellboxes(preds, self.S, self.B, self.C).reshape(n, self.S * self.S, -1)
+            boxes[..., 0] = boxes[..., 0].long()
+            boxes, counts = batched_non_max_suppression(boxes, iou_threshold=self.iou_threshold,
+                                                        threshold=self.threshold, boxformat="midpoints")
+
+        # One device sync per batch
+        boxes, counts = boxes.tolist(), counts.tolist()
+        return [b[:c] for b, c in zip(boxes, counts)]
+
+    def _run(self):
+        closed = False
+        while not closed:
+            request = self.requests.get()
+            if request is None:
+                return
+            batch = [request]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                try:
+                    request = self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    closed = True
+                    break
+                batch.append(request)
+
+            frames, futures = zip(*batch)
+            try:
+                results = self.detect(frames)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, result in zip(futures, results):
+                future.set_result(result)
@@ -0,0 +1,126 @@
+# Copied as YOLOv2/checkpoint.py: the projects are standalone and don't import each other, fix both (YOLOv2's copy has no history rotation).
+import os
+import time
+import queue
+import threading
+from collections import deque
+
+import torch
+
+
+class CheckpointWriter:
+    """
+    Saves checkpoints without stalling training. save() only copies the
+    tensors of a state dict into reusable CPU buffers (pinned when they come
+    from the GPU, so the copy is asynchronous); torch.save runs on a
+    background thread and writes to a temp file that is renamed over the
+    target, so a crash never leaves a truncated checkpoint.
+
+    Each slot ("checkpoint", "metrics", ...) owns one set of buffers, so a
+    save waits only if the previous save of the same slot is still being
+    written. Files passed as history_path (e.g. epoch_N.pth) are pruned to
+    the keep_last most recent ones. blocked_time is the total time save()
+    held up training.
+    """
+
+    def __init__(self, keep_last=3):
+        self.keep_last = keep_last
+        self.blocked_time = 0.0
+        self.buffers = {}
+        self.pending = {} # slot -> Event set once its buffers are free again
+        self.history = deque()
+        self.error = None
+
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def save(self, state, paths, history_path=None, slot="checkpoint"):
+        """
+        Input: state (nested dicts/lists of tensors and python values), path or list of
+               paths it is written to, optional history file that is rotated, buffer slot.
+        Output: seconds this call blocked the caller.
+        """
+        start = time.perf_counter()
+        self._raise_error()
+        paths = [paths] if isinstance(paths, str) else list(paths)
+
+        # Buffers are reused per slot, so wait until the previous write from them is done
+        if slot in self.pending:
+            self.pending[slot].wait()
+            self._raise_error()
+
+        snapshot = self._snapshot(state, self.buffers.setdefault(slot, {}), ())
+        ready = None
+        if torch.cuda.is_available():
+            ready = torch.cuda.Event()
+            ready.record()
+
+        done = threading.Event()
+        self.pending[slot] = done
+        self.jobs.put((snapshot, paths, history_path, ready, done))
+
+        blocked = time.perf_counter() - start
+        self.blocked_time += blocked
+        return blocked
+
+    def close(self):
+        """Waits for every queued write."""
+        self.jobs.put(None)
+        self.thread.join()
+        self._raise_error()
+
+    def _snapshot(self, obj, buffers, key):
+        if isinstance(obj, torch.Tensor):
+            buffer = buffers.get(key)
+            if buffer is None or buffer.shape != obj.shape or buffer.dtype != obj.dtype:
+                buffer = torch.empty(obj.shape, dtype=obj.dtype, pin_memory=obj.is_cuda)
+                buffers[key] = buffer
+            buffer.copy_(obj.detach(), non_blocking=True)
+            return buffer
+        if isinstance(obj, dict):
+            return {k: self._snapshot(v, buffers, key + (k,)) for k, v in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            return type(obj)(self._snapshot(v, buffers, key + (i,)) for i, v in enumerate(obj))
+        return obj
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            snapshot, paths, history_path, ready, done = job
+
+            try:
+                if ready is not None:
+                    ready.synchronize()
+                for path in paths + ([history_path] if history_path else []):
+                    self._write(snapshot, path)
+                if history_path:
+                    self._rotate(history_path)
+            except Exception as e:
+                self.error = e
+            finally:
+                done.set()
+
+    def _write(self, snapshot, path):
+        # Atomic: readers see either the old file or the complete new one
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            torch.save(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _rotate(self, path):
+        if path in self.history:
+            self.history.remove(path)
+        self.history.append(path)
+        while len(self.history) > self.keep_last:
+            old = self.history.popleft()
+            if os.path.exists(old):
+                os.remove(old)
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise RuntimeError("Background checkpoint write failed") from self.error
@@ -0,0 +1,83 @@
+# Copied as YOLOv2/loader.py: the projects are standalone and don't import each other, fix both.
+import os
+import time
+
+import torch
+from torch.utils.data import DataLoader
+
+
+def available_workers():
+    """Cores this process may run on, minus one for the main process."""
+    if hasattr(os, "sched_getaffinity"):
+        cores = len(os.sched_getaffinity(0))
+    else:
+        cores = os.cpu_count() or 1
+    return max(0, cores - 1)
+
+
+EVAL_WORKERS = 2 # most workers an eval loader gets, eval runs every few epochs
+
+
+def split_workers(eval_loaders, total=None):
+    """
+    Splits one worker budget (total, default available_workers()) between a
+    training loader and eval_loaders eval loaders, so a script's loaders
+    together never run more workers than there are cores. Each eval loader
+    gets up to EVAL_WORKERS, the training loader the rest.
+    Output: (training loader workers, workers per eval loader).
+    """
+    if total is None:
+        total = available_workers()
+    eval_workers = min(EVAL_WORKERS, total // (eval_loaders + 1))
+    return total - eval_workers * eval_loaders, eval_workers
+
+
+def make_loader(dataset, batch_size, shuffle=False, sampler=None, collate_fn=None, drop_last=False, num_workers=None):
+    """
+    DataLoader with the settings every training and eval script uses:
+    num_workers workers (None for one per available core, scripts with
+    several loaders split the cores with split_workers), kept alive across
+    epochs, and page-locked batches when training on CUDA so
+    .to(device, non_blocking=True) overlaps the copy.
+    collate_fn must be a module-level function so it pickles for spawned workers.
+    """
+    if num_workers is None:
+        num_workers = available_workers()
+
+    return DataLoader(
+        dataset, batch_size=batch_size, shuffle=shuffle, sampler=sampler, collate_fn=collate_fn,
+        drop_last=drop_last, num_workers=num_workers, pin_memory=torch.cuda.is_available(),
+        persistent_workers=num_workers > 0
+    )
+
+
+class LoaderTimer:
+    """
+    Iterates a loader and splits each pass into time spent waiting for the
+    next batch (data_time) and everything the loop does with it (compute_time).
+    CUDA work counts where the loop syncs (e.g. loss.item()).
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.data_time = 0.0
+        self.compute_time = 0.0
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        self.data_time = 0.0
+        self.compute_time = 0.0
+        start = time.perf_counter()
+        for batch in self.loader:
+            fetched = time.perf_counter()
+            self.data_time += fetched - start
+            yield batch
+            start = time.perf_counter()
+            self.compute_time += start - fetched
+
+    def summary(self):
+        total = self.data_time + self.compute_time
+        share = self.data_time / total if total > 0 else 0.0
+        return f"data wait {self.data_time:.1f}s, compute {self.compute_time:.1f}s ({share:.0%} waiting on data)"
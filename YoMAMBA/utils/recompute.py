@@ -0,0 +1,117 @@
+# Copied as YOLOv2/recompute.py: the projects are standalone and don't import each other, fix both.
+import gc
+from contextlib import contextmanager, nullcontext
+
+import torch
+import torch.nn as nn
+from torch.utils.checkpoint import checkpoint
+
+# Activation checkpointing: a checkpointed chunk of layers keeps only its input
+# for backward and runs its forward a second time during backward to get the
+# activations back. Less memory per sample (bigger batches) for one extra
+# forward of the checkpointed layers.
+
+
+class CheckpointedSequential(nn.Sequential):
+    """
+    nn.Sequential whose layers can be checkpointed in training. With
+    segments > 0 the layers are split into that many chunks of about equal
+    length, each checkpointed: more segments keep more chunk inputs alive but
+    recompute less at once. segments=0 (the default) is a plain nn.Sequential,
+    and eval or no_grad forwards never checkpoint. Same state dict as nn.Sequential.
+    """
+
+    def __init__(self, *args, segments=0):
+        super().__init__(*args)
+        self.segments = segments
+
+    def forward(self, x):
+        if self.segments == 0 or not (self.training and torch.is_grad_enabled()):
+            return super().forward(x)
+        for layers in split_layers(list(self), self.segments):
+            x = checkpoint(run_layers, layers, x, use_reentrant=False,
+                           context_fn=lambda layers=layers: (nullcontext(), keep_batchnorm_stats(layers)))
+        return x
+
+
+def split_layers(layers, segments):
+    """Splits a list of layers into min(segments, len(layers)) consecutive chunks of about equal length."""
+    segments = min(segments, len(layers))
+    bounds = [round(i * len(layers) / segments) for i in range(segments + 1)]
+    return [layers[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+def run_layers(layers, x):
+    for layer in layers:
+        x = layer(x)
+    return x
+
+
+@contextmanager
+def keep_batchnorm_stats(layers):
+    """
+    The recomputation runs BatchNorm in train mode again, which would update
+    its running statistics a second time per step. Restores them afterwards.
+    """
+    norms = [m for layer in layers for m in layer.modules() if isinstance(m, nn.modules.batchnorm._BatchNorm)]
+    saved = [[b.clone() for b in m.buffers()] for m in norms]
+    try:
+        yield
+    finally:
+        with torch.no_grad():
+            for m, buffers in zip(norms, saved):
+                for b, value in zip(m.buffers(), buffers):
+                    b.copy_(value)
+
+
+def set_checkpoint_segments(model, segments):
+    """
+    Sets segments (0 = off) on every CheckpointedSequential in model, i.e. the
+    layers each model marks as worth checkpointing.
+    Output: number of Sequentials set.
+    """
+    if segments < 0:
+        raise ValueError(f"segments must be >= 0, got {segments}")
+    sequentials = [m for m in model.modules() if isinstance(m, CheckpointedSequential)]
+    for m in sequentials:
+        m.segments = segments
+    return len(sequentials)
+
+
+def checkpointing_report(model, segment_options, step_time_fn):
+    """
+    Prints peak memory (CUDA only) and step time of a train step for every
+    number of segments in segment_options, relative to the first one (pass
+    0, no checkpointing, first). step_time_fn() runs the steps on model and
+    returns seconds per step, e.g. amp.benchmark_step_time on one real batch.
+    model's own setting is restored.
+    Output: list of (segments, peak bytes or None, seconds per step).
+    """
+    original = [(m, m.segments) for m in model.modules() if isinstance(m, CheckpointedSequential)]
+    device = next(model.parameters()).device
+    cuda = device.type == "cuda"
+
+    results = []
+    try:
+        for segments in segment_options:
+            set_checkpoint_segments(model, segments)
+            gc.collect()
+            if cuda:
+                torch.cuda.empty_cache()
+                torch.cuda.reset_peak_memory_stats(device)
+            step_time = step_time_fn()
+            peak = torch.cuda.max_memory_allocated(device) if cuda else None
+            results.append((segments, peak, step_time))
+    finally:
+        for m, segments in original:
+            m.segments = segments
+
+    base_peak, base_time = results[0][1], results[0][2]
+    print(f"{'segments':>8} {'peak memory (MB)':>17} {'ms/step':>9}")
+    for segments, peak, step_time in results:
+        name = "off" if segments == 0 else str(segments)
+        memory = "n/a" if peak is None else f"{peak / 2**20:.0f} ({peak / base_peak:.0%})"
+        print(f"{name:>8} {memory:>17} {step_time * 1000:>9.1f} ({step_time / base_time:.2f}x)")
+    if not cuda:
+        print("Peak memory is measured on CUDA only")
+    return results
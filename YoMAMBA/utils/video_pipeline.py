@@ -0,0 +1,206 @@
+import time
+import queue
+import threading
+from collections import deque
+
+import cv2
+import numpy as np
+import torch
+
+from utils.yolov1_utils import convert_cellboxes, batched_non_max_suppression, draw_bounding_box
+
+
+class StageMeter:
+    """
+    Counts frames and busy time for one pipeline stage. fps() is the rate the
+    stage sustains while working, i.e. what it could deliver if it never had
+    to wait on its neighbours.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+        self.busy = 0.0
+
+    def add(self, frames, seconds):
+        self.frames += frames
+        self.busy += seconds
+
+    def fps(self):
+        return self.frames / self.busy if self.busy > 0 else 0.0
+
+
+class VideoPipeline:
+    """
+    Runs detection on a video with three overlapping stages connected by
+    bounded queues:
+        reader thread  -> cap.read() and resize
+        inference      -> micro-batches of up to batch_size frames, a batch is
+                          sent once full or max_latency seconds after its
+                          first frame arrived
+        writer thread  -> draw boxes and FPS overlay, video writer
+    While the model is busy the reader decodes ahead and the writer encodes
+    behind, so long offline videos keep the model saturated.
+    """
+
+    _END = object()
+
+    def __init__(self, model, device, batch_size=8, max_latency=0.05, queue_size=64, img_size=448,
+                 iou_threshold=0.5, threshold=0.4, S=7, B=2, C=20):
+        self.model = model
+        self.device = device
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.queue_size = queue_size
+        self.img_size = img_size
+        self.iou_threshold = iou_threshold
+        self.threshold = threshold
+        self.S, self.B, self.C = S, B, C
+
+    def run(self, cap, video_rec, progress=None):
+        """
+        Input: opened cv2.VideoCapture and cv2.VideoWriter, optional tqdm bar.
+        Output: dict of sustained FPS per stage, end-to-end FPS and frame count.
+        """
+        frames_q = queue.Queue(maxsize=self.queue_size)
+        results_q = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        errors = []
+        meters = {name: StageMeter(name) for name in ("read", "infer", "write")}
+
+        def guarded(fn, out_q):
+            def run():
+                try:
+                    fn()
+                except Exception as e:
+                    errors.append(e)
+                    stop.set()
+                finally:
+                    if out_q is not None:
+                        self._put(out_q, self._END, stop)
+            return run
+
+        def read():
+            while not stop.is_set():
+                start = time.perf_counter()
+                ret, frame = cap.read()
+                if not ret:
+                    return
+                frame = cv2.resize(frame, (self.img_size, self.img_size))
+                meters["read"].add(1, time.perf_counter() - start)
+                self._put(frames_q, frame, stop)
+
+        def write():
+            # Rolling window of write times for the on-frame FPS overlay
+            stamps = deque(maxlen=30)
+            while True:
+                item = self._get(results_q, stop)
+                if item is self._END:
+                    return
+                frames, bboxes = item
+                start = time.perf_counter()
+                for frame, boxes in zip(frames, bboxes):
+                    stamps.append(time.perf_counter())
+                    fps = (len(stamps) - 1) / (stamps[-1] - stamps[0]) if len(stamps) > 1 else 0
+                    height, width = frame.shape[:2]
+                    fps_txt = "FPS: {}".format(int(fps))
+                    frame = cv2.putText(frame, fps_txt, (width - 90, 20), cv2.FONT_HERSHEY_TRIPLEX, 0.5, (255, 255, 255), 1)
+                    frame = draw_bounding_box(frame, boxes, test=True)
+                    video_rec.write(frame)
+                meters["write"].add(len(frames), time.perf_counter() - start)
+                if progress is not None:
+                    progress.update(len(frames))
+
+        reader = threading.Thread(target=guarded(read, frames_q), daemon=True)
+        writer = threading.Thread(target=guarded(write, None), daemon=True)
+        wall_start = time.perf_counter()
+        reader.start()
+        writer.start()
+
+        try:
+            done = False
+            while not done and not stop.is_set():
+                frames, done = self._next_batch(frames_q, stop)
+                if not frames:
+                    break
+                start = time.perf_counter()
+                bboxes = self.detect(frames)
+                meters["infer"].add(len(frames), time.perf_counter() - start)
+                self._put(results_q, (frames, bboxes), stop)
+        except BaseException:
+            stop.set()
+            raise
+        finally:
+            # Let the writer drain what is queued, then release the reader
+            self._put(results_q, self._END, stop)
+            writer.join()
+            stop.set()
+            reader.join()
+
+        if errors:
+            raise RuntimeError("Video pipeline stage failed") from errors[0]
+
+        wall = time.perf_counter() - wall_start
+        stats = {f"{name}_fps": meter.fps() for name, meter in meters.items()}
+        stats["frames"] = meters["write"].frames
+        stats["end_to_end_fps"] = meters["write"].frames / wall if wall > 0 else 0.0
+        return stats
+
+    def detect(self, frames):
+        """
+        Input: list of (H, W, 3) uint8 frames.
+        Output: per frame list of [class_pred, prob_score, x, y, w, h] boxes after NMS.
+        """
+        # Same scaling as T.ToTensor(), done once for the whole batch on device
+        x = torch.from_numpy(np.stack(frames)).to(self.device, non_blocking=True)
+        x = x.permute(0, 3, 1, 2).float().div_(255)
+
+        with torch.inference_mode():
+            preds = self.model(x)
+            boxes = convert_cellboxes(preds, self.S, self.B, self.C).reshape(len(frames), self.S * self.S, -1)
+            boxes[..., 0] = boxes[..., 0].long()
+            boxes, counts = batched_non_max_suppression(boxes, iou_threshold=self.iou_threshold,
+                                                        threshold=self.threshold, boxformat="midpoints")
+
+        # One device sync per batch
+        boxes, counts = boxes.tolist(), counts.tolist()
+        return [b[:n] for b, n in zip(boxes, counts)]
+
+    def _next_batch(self, frames_q, stop):
+        """Blocks for the first frame, then fills the batch until it is full or max_latency has passed."""
+        first = self._get(frames_q, stop)
+        if first is self._END:
+            return [], True
+        frames = [first]
+        deadline = time.perf_counter() + self.max_latency
+        while len(frames) < self.batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                frame = frames_q.get(timeout=timeout) if timeout > 0 else frames_q.get_nowait()
+            except queue.Empty:
+                break
+            if frame is self._END:
+                return frames, True
+            frames.append(frame)
+        return frames, False
+
+    @staticmethod
+    def _put(q, item, stop):
+        # Bounded put that gives up once the pipeline is shutting down
+        while True:
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if stop.is_set():
+                    return
+
+    @staticmethod
+    def _get(q, stop):
+        # Blocking get that returns _END once the pipeline is shutting down and q is drained
+        while True:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():
+                    return VideoPipeline._END
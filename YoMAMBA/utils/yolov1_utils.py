@@ -168,84 +168,174 @@ def mean_avg_precision(bboxes_preds, bboxes_targets, iou_threshold = 0.5,
     return sum(avg_precision) / len(avg_precision)
 
 def get_bboxes(loader, model, iou_threshold, threshold, pred_format="cells", boxformat="midpoints",
-    device="cuda" if torch.cuda.is_available() else "cpu"):
+    device="cuda" if torch.cuda.is_available() else "cpu", S=7, B=2, C=20):
     
-    all_pred_boxes = []
-    all_true_boxes = []
+    pred_batches = []
+    true_batches = []
 
     # make sure model is in eval before get bboxes
     model.eval()
     train_idx = 0
 
     for batch_idx, (x, labels) in enumerate(loader):
-        x = x.to(device)
-        labels = labels.to(device)
+        x = x.to(device, non_blocking=True)
+        labels = labels.to(device, non_blocking=True)
 
         with torch.no_grad():
             predictions = model(x)
 
+        # Decode, threshold and NMS stay on device
         batch_size = x.shape[0]
-        true_bboxes = cellboxes_to_boxes(labels)
-        bboxes = cellboxes_to_boxes(predictions)
+        image_idx = torch.arange(train_idx, train_idx + batch_size, device=x.device)
+        bboxes = convert_cellboxes(predictions, S, B, C).reshape(batch_size, S * S, -1)
+        nms_boxes, nms_counts = batched_non_max_suppression(bboxes, iou_threshold=iou_threshold, threshold=threshold, boxformat=boxformat)
+        pred_mask = torch.arange(S * S, device=x.device).unsqueeze(0) < nms_counts.unsqueeze(1)
+        pred_batches.append((image_idx.unsqueeze(1).expand_as(pred_mask)[pred_mask], nms_boxes[pred_mask]))
 
-        for idx in range(batch_size):
-            nms_boxes = non_max_suppression(bboxes[idx], iou_threshold=iou_threshold, threshold=threshold,boxformat=boxformat)
+        # many will get converted to 0 pred
+        true_bboxes = convert_cellboxes(labels, S, B, C).reshape(batch_size, S * S, -1)
+        true_mask = true_bboxes[..., 1].double() > threshold
+        true_batches.append((image_idx.unsqueeze(1).expand_as(true_mask)[true_mask], true_bboxes[true_mask]))
 
-            for nms_box in nms_boxes:
-                all_pred_boxes.append([train_idx] + nms_box)
+        train_idx += batch_size
 
-            for box in true_bboxes[idx]:
-                # many will get converted to 0 pred
-                if box[1] > threshold:
-                    all_true_boxes.append([train_idx] + box)
+    #model.train()
+    return _to_box_lists(pred_batches), _to_box_lists(true_batches)
 
-            train_idx += 1
 
-    #model.train()
-    return all_pred_boxes, all_true_boxes
+def _to_box_lists(batches):
+    """Materializes (image index, boxes) tensor pairs as [train_idx, *box] lists."""
+    if not batches:
+        return []
+    image_idx = torch.cat([idx for idx, _ in batches]).tolist()
+    boxes = torch.cat([boxes for _, boxes in batches]).tolist()
+    return [[idx] + box for idx, box in zip(image_idx, boxes)]
+
 
+def evaluate_mAP(loader, model, iou_threshold, threshold, boxformat="midpoints", num_classes=20,
+    device="cuda" if torch.cuda.is_available() else "cpu", S=7, B=2):
+    """
+    Same as get_bboxes followed by mean_average_precision, but streams each
+    batch into a DetectionEvaluator instead of building Python lists.
+    Output: mean average precision (tensor)
+    """
 
+    evaluator = DetectionEvaluator(iou_threshold=iou_threshold, boxformat=boxformat, num_classes=num_classes)
 
-def convert_cellboxes(predictions, S=7):
+    # make sure model is in eval before get bboxes
+    model.eval()
+
+    for x, labels in loader:
+        x = x.to(device, non_blocking=True)
+        labels = labels.to(device, non_blocking=True)
+
+        with torch.no_grad():
+            predictions = model(x)
+
+        batch_size = x.shape[0]
+        bboxes = convert_cellboxes(predictions, S, B, num_classes).reshape(batch_size, S * S, -1)
+        nms_boxes, nms_counts = batched_non_max_suppression(bboxes, iou_threshold=iou_threshold, threshold=threshold, boxformat=boxformat)
+
+        # many will get converted to 0 pred
+        true_bboxes = convert_cellboxes(labels, S, B, num_classes).reshape(batch_size, S * S, -1)
+        evaluator.update(nms_boxes, nms_counts, true_bboxes, true_bboxes[..., 1].double() > threshold)
+
+    return evaluator.compute()
+
+
+def convert_cellboxes(predictions, S=7, B=2, C=20):
     """
     Converts bounding boxes output from Yolo with
     an image split size of S into entire image ratios
-    rather than relative to cell ratios. 
+    rather than relative to cell ratios. Stays on the
+    device of predictions.
+    Output: (N, S, S, 6) tensor of [class_pred, best confidence, x, y, w, h]
     """
 
-    predictions = predictions.to("cpu")
     batch_size = predictions.shape[0]
-    predictions = predictions.reshape(batch_size, 7, 7, 30)
-    bboxes1 = predictions[..., 21:25]
-    bboxes2 = predictions[..., 26:30]
-    scores = torch.cat( (predictions[..., 20].unsqueeze(0), predictions[..., 25].unsqueeze(0)), dim=0 )
-    best_box = scores.argmax(0).unsqueeze(-1)
-    best_boxes = bboxes1 * (1 - best_box) + best_box * bboxes2
-    cell_indices = torch.arange(7).repeat(batch_size, 7, 1).unsqueeze(-1)
-    x = 1 / S * (best_boxes[..., :1] + cell_indices)
-    y = 1 / S * (best_boxes[..., 1:2] + cell_indices.permute(0, 2, 1, 3))
+    predictions = predictions.reshape(batch_size, S, S, C + B * 5)
+    # B boxes of [confidence, x, y, w, h] after the class scores
+    boxes = predictions[..., C:].reshape(batch_size, S, S, B, 5)
+    best_confidence, best_box = boxes[..., 0].max(dim=-1, keepdim=True)
+    best_boxes = torch.gather(boxes[..., 1:], 3, best_box.unsqueeze(-1).expand(-1, -1, -1, 1, 4)).squeeze(3)
+    cell_indices = torch.arange(S, device=predictions.device)
+    x = 1 / S * (best_boxes[..., :1] + cell_indices.view(1, 1, S, 1))
+    y = 1 / S * (best_boxes[..., 1:2] + cell_indices.view(1, S, 1, 1))
     w_h = 1 / S * best_boxes[..., 2:4]
     converted_bboxes = torch.cat((x, y, w_h), dim=-1)
-    predicted_class = predictions[..., :20].argmax(-1).unsqueeze(-1)
-    best_confidence = torch.max(predictions[..., 20], predictions[..., 25]).unsqueeze(-1)
+    predicted_class = predictions[..., :C].argmax(-1).unsqueeze(-1)
     converted_preds = torch.cat( (predicted_class, best_confidence, converted_bboxes), dim=-1 )
 
     return converted_preds
 
 
-def cellboxes_to_boxes(out, S=7):
-    converted_pred = convert_cellboxes(out).reshape(out.shape[0], S * S, -1)
+def cellboxes_to_boxes(out, S=7, B=2, C=20):
+    converted_pred = convert_cellboxes(out, S, B, C).reshape(out.shape[0], S * S, -1)
     converted_pred[..., 0] = converted_pred[..., 0].long()
-    all_bboxes = []
 
-    for ex_idx in range(out.shape[0]):
-        bboxes = []
+    # One device sync for the whole batch
+    return converted_pred.tolist()
 
-        for bbox_idx in range(S * S):
-            bboxes.append([x.item() for x in converted_pred[ex_idx, bbox_idx, :]])
-        all_bboxes.append(bboxes)
 
-    return all_bboxes
+def batched_non_max_suppression(predictions, iou_threshold, threshold, boxformat="midpoints"):
+    """
+    Class-aware Non Max Suppression over a whole batch of predictions.
+    Parameters:
+        predictions (tensor): (N, M, 6) boxes per image, each specified as
+        [class_pred, prob_score, x1, y1, x2, y2], e.g. straight from convert_cellboxes
+        reshaped to (N, S*S, 6)
+        iou_threshold (float): boxes of the same class overlapping a kept box
+        by at least this IoU are removed
+        threshold (float): threshold to remove predicted bboxes (independent of IoU)
+        boxformat (str): "midpoints" or "corners" used to specify bboxes
+    Returns:
+        tensor: (N, M, 6) kept boxes sorted by score, zero padded past the count
+        tensor: (N,) number of kept boxes per image
+    """
+    keep, order = _nms_keep_mask(predictions, iou_threshold, threshold, boxformat)
+    counts = keep.sum(dim=1)
+
+    # Move kept boxes to the front while preserving score order
+    packed = torch.argsort((~keep).to(torch.uint8), dim=1, stable=True)
+    order = torch.gather(order, 1, packed)
+    kept_boxes = torch.gather(predictions, 1, order.unsqueeze(-1).expand_as(predictions))
+    slots = torch.arange(predictions.shape[1], device=predictions.device)
+    kept_boxes = kept_boxes * (slots.unsqueeze(0) < counts.unsqueeze(1)).unsqueeze(-1)
+
+    return kept_boxes, counts
+
+
+def _nms_keep_mask(predictions, iou_threshold, threshold, boxformat):
+    """
+    Returns a (N, M) keep mask over the score-sorted boxes and the (N, M)
+    sort order that maps sorted positions back to the input.
+    """
+    N, M, _ = predictions.shape
+    scores = predictions[..., 1]
+
+    # Stable sort so ties keep their input order, like sorted() does
+    order = torch.argsort(scores, dim=1, descending=True, stable=True)
+    boxes = torch.gather(predictions, 1, order.unsqueeze(-1).expand_as(predictions))
+    # Compare in float64 like the Python list version does
+    candidates = boxes[..., 1].double() > threshold
+
+    # Pairwise IoU between every box of an image: (N, M, M)
+    ious = intersection_over_union(
+        boxes[..., 2:].unsqueeze(2),
+        boxes[..., 2:].unsqueeze(1),
+        boxformat=boxformat,
+    ).squeeze(-1)
+    same_class = boxes[..., 0].unsqueeze(2) == boxes[..., 0].unsqueeze(1)
+    suppresses = same_class & (ious >= iou_threshold)
+
+    # Greedy pass over score rank, vectorized across the batch. A box survives
+    # if no higher scoring kept box of the same class overlaps it.
+    keep = torch.zeros((N, M), dtype=torch.bool, device=predictions.device)
+    for i in range(M):
+        suppressed = (keep[:, :i] & suppresses[:, :i, i]).any(dim=1)
+        keep[:, i] = candidates[:, i] & ~suppressed
+
+    return keep, order
 
 
 def non_max_suppression(bboxes, iou_threshold, threshold, boxformat="corners"):
@@ -263,28 +353,12 @@ def non_max_suppression(bboxes, iou_threshold, threshold, boxformat="corners"):
 
     assert type(bboxes) == list
 
-    bboxes = [box for box in bboxes if box[1] > threshold]
-    bboxes = sorted(bboxes, key=lambda x: x[1], reverse=True)
-    bboxes_after_nms = []
-
-    while bboxes:
-        chosen_box = bboxes.pop(0)
-
-        bboxes = [
-            box
-            for box in bboxes
-            if box[0] != chosen_box[0]
-            or intersection_over_union(
-                torch.tensor(chosen_box[2:]),
-                torch.tensor(box[2:]),
-                boxformat=boxformat,
-            )
-            < iou_threshold
-        ]
+    if not bboxes:
+        return []
 
-        bboxes_after_nms.append(chosen_box)
-
-    return bboxes_after_nms
+    # Thin wrapper around the batched engine, returns the original box lists
+    keep, order = _nms_keep_mask(torch.tensor([bboxes]), iou_threshold, threshold, boxformat)
+    return [bboxes[idx] for idx in order[0][keep[0]].tolist()]
 
 
 def mean_average_precision(
@@ -393,6 +467,187 @@ def mean_average_precision(
     return sum(average_precisions) / len(average_precisions)
 
 
+class _GrowableArray:
+    """Preallocated numpy array that doubles its capacity when full."""
+
+    def __init__(self, width, dtype, capacity=4096):
+        self.data = np.empty((capacity, width), dtype=dtype)
+        self.size = 0
+
+    def append(self, rows):
+        needed = self.size + len(rows)
+        if needed > len(self.data):
+            grown = np.empty((max(needed, 2 * len(self.data)), self.data.shape[1]), dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:needed] = rows
+        self.size = needed
+
+    def view(self):
+        return self.data[:self.size]
+
+
+class DetectionEvaluator:
+    """
+    Streaming replacement for mean_average_precision. Detections and ground
+    truths are accumulated per batch into preallocated arrays tagged with their
+    (image, class), and compute() does the greedy matching for all of them at
+    once with a vectorized IoU matrix. Results are identical to
+    mean_average_precision on the same boxes.
+    """
+
+    def __init__(self, iou_threshold=0.5, boxformat="midpoints", num_classes=20, chunk_size=65536):
+        self.iou_threshold = iou_threshold
+        self.boxformat = boxformat
+        self.num_classes = num_classes
+        self.chunk_size = chunk_size
+        self.reset()
+
+    def reset(self):
+        # image index, class, score (float64 like the Python lists) and box
+        self.pred_keys = _GrowableArray(2, np.int64)
+        self.pred_scores = _GrowableArray(1, np.float64)
+        self.pred_boxes = _GrowableArray(4, np.float32)
+        self.true_keys = _GrowableArray(2, np.int64)
+        self.true_boxes = _GrowableArray(4, np.float32)
+        self.num_images = 0
+
+    def update(self, pred_boxes, pred_counts, true_boxes, true_counts):
+        """
+        Input: padded predictions (N, M, 6) with their per-image counts (N,),
+               e.g. from batched_non_max_suppression, and ground truths in the same
+               format. Counts may also be a (N, M) boolean mask of valid rows.
+               Rows are [class_pred, prob_score, x1, y1, x2, y2].
+        """
+        batch_size = pred_boxes.shape[0]
+        image_idx = torch.arange(self.num_images, self.num_images + batch_size)
+        self._add(pred_boxes, pred_counts, image_idx, is_pred=True)
+        self._add(true_boxes, true_counts, image_idx, is_pred=False)
+        self.num_images += batch_size
+
+    def update_from_lists(self, pred_boxes, true_boxes):
+        """
+        Input: lists in the mean_average_precision format
+               [train_idx, class_prediction, prob_score, x1, y1, x2, y2]
+        """
+        pred_ids = [box[0] for box in pred_boxes]
+        true_ids = [box[0] for box in true_boxes]
+        _, image_idx = np.unique(np.array(pred_ids + true_ids, dtype=np.float64), return_inverse=True)
+        image_idx = image_idx.astype(np.int64) + self.num_images
+
+        pred_image_idx, true_image_idx = image_idx[:len(pred_ids)], image_idx[len(pred_ids):]
+        preds = np.array([box[1:] for box in pred_boxes], dtype=np.float64).reshape(-1, 6)
+        trues = np.array([box[1:] for box in true_boxes], dtype=np.float64).reshape(-1, 6)
+
+        self.pred_keys.append(np.stack([pred_image_idx, preds[:, 0].astype(np.int64)], axis=1))
+        self.pred_scores.append(preds[:, 1:2])
+        self.pred_boxes.append(preds[:, 2:])
+        self.true_keys.append(np.stack([true_image_idx, trues[:, 0].astype(np.int64)], axis=1))
+        self.true_boxes.append(trues[:, 2:])
+        self.num_images = int(image_idx.max()) + 1 if len(image_idx) else self.num_images
+
+    def _add(self, boxes, counts, image_idx, is_pred):
+        if counts.dim() == 1:
+            slots = torch.arange(boxes.shape[1], device=counts.device)
+            counts = slots.unsqueeze(0) < counts.unsqueeze(1)
+        image_idx = image_idx.to(counts.device).unsqueeze(1).expand_as(counts)
+
+        # Single device to host copy per batch
+        rows = boxes[counts].cpu()
+        image_idx = image_idx[counts].cpu().numpy()
+        keys = np.stack([image_idx, rows[:, 0].long().numpy()], axis=1)
+
+        if is_pred:
+            self.pred_keys.append(keys)
+            self.pred_scores.append(rows[:, 1:2].double().numpy())
+            self.pred_boxes.append(rows[:, 2:].float().numpy())
+        else:
+            self.true_keys.append(keys)
+            self.true_boxes.append(rows[:, 2:].float().numpy())
+
+    def compute(self):
+        """
+        Output: mean average precision across classes with ground truths (tensor)
+        """
+        C = self.num_classes
+        pred_keys, pred_scores = self.pred_keys.view(), self.pred_scores.view()[:, 0]
+        true_keys = self.true_keys.view()
+
+        keep = (pred_keys[:, 1] >= 0) & (pred_keys[:, 1] < C)
+        pred_keys, pred_scores, pred_boxes = pred_keys[keep], pred_scores[keep], self.pred_boxes.view()[keep]
+        keep = (true_keys[:, 1] >= 0) & (true_keys[:, 1] < C)
+        true_keys, true_boxes = true_keys[keep], self.true_boxes.view()[keep]
+
+        # Pad ground truths per (image, class) group, keeping insertion order
+        true_group = true_keys[:, 0] * C + true_keys[:, 1]
+        true_order = np.argsort(true_group, kind="stable")
+        groups, group_start, group_size = np.unique(true_group[true_order], return_index=True, return_counts=True)
+        max_gts = int(group_size.max()) if len(groups) else 1
+        group_idx = np.searchsorted(groups, true_group[true_order])
+        slot_idx = np.arange(len(true_order)) - group_start[group_idx]
+        padded_gts = np.zeros((len(groups) + 1, max_gts, 4), dtype=np.float32)
+        padded_valid = np.zeros((len(groups) + 1, max_gts), dtype=bool)
+        padded_gts[group_idx, slot_idx] = true_boxes[true_order]
+        padded_valid[group_idx, slot_idx] = True
+
+        # Sort detections by class, then score descending, then insertion order
+        order = np.lexsort((np.arange(len(pred_scores)), -pred_scores, pred_keys[:, 1]))
+        pred_keys, pred_boxes = pred_keys[order], pred_boxes[order]
+
+        # Group of each detection, the extra empty group if it has no ground truths
+        pred_group = pred_keys[:, 0] * C + pred_keys[:, 1]
+        pred_group_idx = np.searchsorted(groups, pred_group)
+        pred_group_idx = np.minimum(pred_group_idx, len(groups))
+        found = pred_group_idx < len(groups)
+        found[found] = groups[pred_group_idx[found]] == pred_group[found]
+        pred_group_idx[~found] = len(groups)
+
+        # Best ground truth for every detection, in chunks to bound memory
+        best_iou = torch.zeros(len(pred_keys))
+        best_gt = torch.zeros(len(pred_keys), dtype=torch.int64)
+        padded_gts, padded_valid = torch.from_numpy(padded_gts), torch.from_numpy(padded_valid)
+        for start in range(0, len(pred_keys), self.chunk_size):
+            chunk = torch.from_numpy(pred_group_idx[start:start + self.chunk_size])
+            ious = intersection_over_union(
+                torch.from_numpy(pred_boxes[start:start + self.chunk_size]).unsqueeze(1),
+                padded_gts[chunk],
+                boxformat=self.boxformat,
+            ).squeeze(-1)
+            ious = torch.where(padded_valid[chunk], ious, torch.full_like(ious, -1))
+            best_iou[start:start + self.chunk_size], best_gt[start:start + self.chunk_size] = ious.max(dim=1)
+
+        # Only the highest scoring detection above the threshold claims a ground truth
+        TP = np.zeros(len(pred_keys), dtype=np.float32)
+        candidates = np.nonzero((best_iou > self.iou_threshold).numpy())[0]
+        claimed = pred_group_idx[candidates] * max_gts + best_gt.numpy()[candidates]
+        _, first = np.unique(claimed, return_index=True)
+        TP[candidates[first]] = 1
+
+        class_start = np.searchsorted(pred_keys[:, 1], np.arange(C + 1))
+        total_true = np.bincount(true_keys[:, 1], minlength=C)
+
+        average_precisions = []
+        epsilon = 1e-6
+
+        for c in range(C):
+            # If none exists for this class then we can safely skip
+            if total_true[c] == 0:
+                continue
+
+            TP_c = torch.from_numpy(TP[class_start[c]:class_start[c + 1]])
+            TP_cumsum = torch.cumsum(TP_c, dim=0)
+            FP_cumsum = torch.cumsum(1 - TP_c, dim=0)
+            recalls = TP_cumsum / (int(total_true[c]) + epsilon)
+            precisions = torch.divide(TP_cumsum, (TP_cumsum + FP_cumsum + epsilon))
+            precisions = torch.cat((torch.tensor([1]), precisions))
+            recalls = torch.cat((torch.tensor([0]), recalls))
+            average_precisions.append(torch.trapz(precisions, recalls))
+
+        if not average_precisions:
+            return torch.tensor(0.0)
+        return sum(average_precisions) / len(average_precisions)
+
+
 def draw_bounding_box(image, bounding_boxes, test = False):
     """
     Input: PIL image and bounding boxes (as list).